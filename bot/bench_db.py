@@ -0,0 +1,156 @@
+"""Micro-benchmark for the db.py connection layer.
+
+Times a few hot db functions against a throwaway SQLite file, once opening a
+fresh connection per call (the old behaviour) and once on the pooled
+per-thread connection. With --stress it instead hammers the slot tables from
+many threads and reports lock errors and double-bookings.
+
+    python bench_db.py --calls 2000
+    python bench_db.py --stress --threads 32 --ops 500
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import db
+
+
+def _seed(users: int) -> datetime:
+    tz = ZoneInfo("Asia/Tehran")
+    base = datetime(2030, 1, 1, 20, 30, tzinfo=tz)
+    for uid in range(1, users + 1):
+        db.upsert_user(uid, f"@user{uid}")
+        if uid % 2 == 0:
+            db.upsert_verified_card(uid, f"@user{uid}", "6219861800000000", None)
+    for i in range(min(users, 500)):
+        db.try_reserve_slot(i + 1, base + timedelta(minutes=30 * i))
+    return base
+
+
+def _time_calls(fn, calls: int, fresh: bool) -> list[float]:
+    samples = []
+    for i in range(calls):
+        if fresh:
+            db.close_connections()
+        # Time the query itself, not a hit in db.py's row and slot caches.
+        db.clear_caches()
+        t0 = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def _fmt(samples: list[float]) -> str:
+    us = sorted(s * 1_000_000 for s in samples)
+    p95 = us[int(len(us) * 0.95) - 1]
+    return f"mean {statistics.fmean(us):8.1f}us  p50 {statistics.median(us):8.1f}us  p95 {p95:8.1f}us"
+
+
+def _stress(base: datetime, threads: int, ops: int, users: int) -> None:
+    """Parallel readers and writers racing for the same slots."""
+    slots = [base + timedelta(minutes=30 * i) for i in range(600, 612)]
+    locked = 0
+    other_errors = 0
+    held = 0
+    counter_lock = threading.Lock()
+
+    def worker(seed: int) -> None:
+        nonlocal locked, other_errors, held
+        rng = random.Random(seed)
+        for _ in range(ops):
+            slot = rng.choice(slots)
+            uid = rng.randint(1, users)
+            try:
+                roll = rng.random()
+                if roll < 0.5:
+                    db.is_slot_reserved(slot)
+                    db.get_slot_owner_user_id(slot)
+                elif roll < 0.7:
+                    db.upsert_user(uid, None)
+                elif roll < 0.9:
+                    rid = db.try_hold_slot_pending_payment(uid, slot)
+                    if rid is not None:
+                        with counter_lock:
+                            held += 1
+                        if rng.random() < 0.8:
+                            db.set_reservation_status(rid, "cancelled")
+                else:
+                    db.set_user_subscription(uid, rng.random() < 0.5, None)
+            except sqlite3.OperationalError as e:
+                with counter_lock:
+                    if "locked" in str(e):
+                        locked += 1
+                    else:
+                        other_errors += 1
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    t0 = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    double_booked = sum(
+        1
+        for slot in slots
+        if len(
+            db._connect().execute(
+                "SELECT id FROM reservations WHERE reserved_ts = ? AND status IN ('booked', 'pending_payment')",
+                (int(slot.timestamp()),),
+            ).fetchall()
+        )
+        > 1
+    )
+    total_ops = threads * ops
+    print(f"stress: {threads} threads x {ops} ops in {elapsed:.2f}s ({total_ops / elapsed:,.0f} ops/s)")
+    print(f"  holds won: {held}  'database is locked': {locked}  other errors: {other_errors}")
+    print(f"  double-booked slots: {double_booked}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--stress", action="store_true", help="run the concurrency stress test instead")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--ops", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DB_PATH"] = os.path.join(tmp, "bench.sqlite3")
+        db.init_db()
+        base = _seed(args.users)
+
+        if args.stress:
+            _stress(base, args.threads, args.ops, args.users)
+            db.close_connections()
+            return
+
+        cases = {
+            "get_verified_card_number": lambda i: db.get_verified_card_number(i % args.users + 1),
+            "is_slot_reserved": lambda i: db.is_slot_reserved(base + timedelta(minutes=30 * (i % 600))),
+            "get_reservation": lambda i: db.get_reservation(i % 500 + 1),
+            "upsert_user": lambda i: db.upsert_user(i % args.users + 1, None),
+        }
+
+        for name, fn in cases.items():
+            before = _time_calls(fn, args.calls, fresh=True)
+            after = _time_calls(fn, args.calls, fresh=False)
+            print(f"{name}")
+            print(f"  connect per call: {_fmt(before)}")
+            print(f"  pooled          : {_fmt(after)}")
+
+        db.close_connections()
+
+
+if __name__ == "__main__":
+    main()
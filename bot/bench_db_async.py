@@ -0,0 +1,143 @@
+"""Handler latency benchmark: asyncio.to_thread vs the db_async executors.
+
+Simulates N users hitting the bot at the same time. Each user runs a few
+handler-shaped sequences of DB calls (main menu, slot reservation,
+subscribe), one after another, as a real conversation would. The benchmark
+reports per-handler latency for both ways of reaching db.py:
+
+- to_thread: every call hops to asyncio's default executor (the old bot.py);
+- db_async:  reads on the reader pool, writes on the single writer thread.
+
+With --blocking-tasks, that many tasks keep the default executor busy with
+blocking sleeps, standing in for other blocking work that shares it.
+
+    python bench_db_async.py                      # 100 and 1000 users
+    python bench_db_async.py --users 1000 --handlers 5 --blocking-tasks 0
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import db
+import db_async
+
+_TZ = ZoneInfo("Asia/Tehran")
+_BASE = datetime(2030, 1, 1, 20, 30, tzinfo=_TZ)
+_SLOTS = 48
+
+
+def _seed(users: int) -> None:
+    for uid in range(1, users + 1):
+        db.upsert_user(uid, f"@user{uid}")
+        if uid % 2 == 0:
+            db.upsert_verified_card(uid, f"@user{uid}", "6219861800000000", None)
+    for i in range(_SLOTS // 2):
+        db.try_reserve_slot(i + 1, _BASE + timedelta(minutes=30 * i))
+
+
+class _ToThread:
+    def __getattr__(self, name: str):
+        fn = getattr(db, name)
+        return lambda *args: asyncio.to_thread(fn, *args)
+
+
+_BACKENDS = {"to_thread": _ToThread(), "db_async": db_async}
+
+
+async def _handler(api, rng: random.Random, uid: int) -> None:
+    roll = rng.random()
+    if roll < 0.6:
+        # Main menu / "my reservations"
+        await api.get_verified_card_number(uid)
+        await api.list_reservations_for_user(uid, 20)
+    elif roll < 0.9:
+        # Pick a slot and hold it
+        await api.get_verified_card_number(uid)
+        await api.get_day_slot_occupancy(_BASE.date())
+        slot = _BASE + timedelta(minutes=30 * rng.randrange(_SLOTS))
+        reservation_id = await api.try_hold_slot_pending_payment(uid, slot)
+        if reservation_id is not None:
+            await api.set_reservation_status(reservation_id, "cancelled")
+    else:
+        await api.set_user_subscription(uid, rng.random() < 0.5, None)
+
+
+async def _blocking_load(stop: asyncio.Event, blocking_ms: float) -> None:
+    while not stop.is_set():
+        await asyncio.to_thread(time.sleep, blocking_ms / 1000)
+
+
+async def _run(backend: str, users: int, handlers: int, blocking_tasks: int, blocking_ms: float) -> dict:
+    api = _BACKENDS[backend]
+    latencies: list[float] = []
+    errors = 0
+
+    async def user(uid: int) -> None:
+        nonlocal errors
+        rng = random.Random(uid)
+        for _ in range(handlers):
+            t0 = time.perf_counter()
+            try:
+                await _handler(api, rng, uid)
+            except sqlite3.OperationalError:
+                errors += 1
+            latencies.append(time.perf_counter() - t0)
+
+    stop = asyncio.Event()
+    load = [asyncio.create_task(_blocking_load(stop, blocking_ms)) for _ in range(blocking_tasks)]
+    await asyncio.sleep(0)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(user(uid) for uid in range(1, users + 1)))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await asyncio.gather(*load)
+    await db_async.shutdown()
+
+    ms = sorted(x * 1000 for x in latencies)
+    return {
+        "p50": statistics.median(ms),
+        "p95": ms[int(len(ms) * 0.95) - 1],
+        "p99": ms[int(len(ms) * 0.99) - 1],
+        "max": ms[-1],
+        "rate": len(ms) / elapsed,
+        "errors": errors,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", default="100,1000", help="comma-separated concurrent user counts")
+    parser.add_argument("--handlers", type=int, default=5, help="handlers run by each user, one after another")
+    parser.add_argument("--blocking-tasks", type=int, default=4, help="tasks keeping the default executor busy")
+    parser.add_argument("--blocking-ms", type=float, default=20, help="length of each blocking call")
+    args = parser.parse_args()
+
+    print(
+        f"{'users':>6} {'backend':<10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+        f" {'handlers/s':>11} {'locked':>7}"
+    )
+    for users in (int(u) for u in args.users.split(",")):
+        for backend in _BACKENDS:
+            with tempfile.TemporaryDirectory() as tmp:
+                os.environ["DB_PATH"] = os.path.join(tmp, "bench.sqlite3")
+                db.clear_caches()
+                db.init_db()
+                _seed(users)
+                r = asyncio.run(_run(backend, users, args.handlers, args.blocking_tasks, args.blocking_ms))
+                db.close_connections()
+            print(
+                f"{users:>6} {backend:<10} {r['p50']:>8.2f} {r['p95']:>8.2f} {r['p99']:>8.2f} {r['max']:>8.2f}"
+                f" {r['rate']:>11,.0f} {r['errors']:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
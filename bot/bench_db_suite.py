@@ -0,0 +1,472 @@
+"""Benchmark suite: every public db.py function at several dataset sizes.
+
+For each size, a synthetic dataset is generated with gen_dataset.py (or reused
+from --data-dir). Each function then runs against a fresh copy of it, in the
+calling thread with db.py's pooled connection, the way db_async's workers call
+it. Reads run first and writes after them, so the reads see the generated
+data unchanged. Row-cached point reads are timed cold (caches cleared before
+each call) and their peek_* twins warm. Whole-table calls (admin stats, full
+subscriber walks, broadcast snapshots) run --heavy-calls times instead of
+--calls.
+
+The report (p50/p95/p99/mean/max in microseconds per function and size,
+plus dataset row counts) is printed and, with --json, saved. --baseline
+compares against a saved report and exits 1 if any function's p50 got more
+than --threshold slower (ignoring differences under --min-delta-us). The
+stored baseline is baselines/bench_db_suite.json. Timings depend on the
+machine, so refresh it (--update-baseline) on the machine you compare on.
+
+A public function without a case below fails the run, so new db.py
+functions get a benchmark with them.
+
+    python bench_db_suite.py                           # 10k and 100k users
+    python bench_db_suite.py --sizes 1m --data-dir /var/tmp/ryno-datasets
+    python bench_db_suite.py --baseline baselines/bench_db_suite.json
+"""
+
+import argparse
+import inspect
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Any, Callable
+
+import db
+import gen_dataset
+from migrations import LATEST_VERSION
+
+# name -> (users, reservations)
+SIZES = {
+    "10k": (10_000, 50_000),
+    "100k": (100_000, 500_000),
+    "1m": (1_000_000, 5_000_000),
+}
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "bench_db_suite.json")
+
+
+class _Context:
+    """Keys sampled from the generated dataset, plus fresh keys for inserts."""
+
+    def __init__(self, con: sqlite3.Connection, seed: int) -> None:
+        self.rng = random.Random(seed)
+        self.now = datetime.fromtimestamp(con.execute("SELECT MAX(created_ts) FROM reservations").fetchone()[0], timezone.utc)
+        self.max_user_id = con.execute("SELECT MAX(user_id) FROM users").fetchone()[0]
+        self.max_reservation_id = con.execute("SELECT MAX(id) FROM reservations").fetchone()[0]
+        self.max_payment_id = con.execute("SELECT MAX(id) FROM payment_requests").fetchone()[0] or 1
+        self.max_verification_id = con.execute("SELECT MAX(id) FROM verification_requests").fetchone()[0] or 1
+        self.booked_ids = self._sample(con, "SELECT id FROM reservations WHERE status = 'booked'")
+        self.cancelled_ids = self._sample(con, "SELECT id FROM reservations WHERE status = 'cancelled'")
+        self.active_slots = [
+            datetime.fromtimestamp(ts, db.LOCAL_TZ)
+            for ts in self._sample(con, "SELECT reserved_ts FROM reservations WHERE status IN ('booked', 'pending_payment')")
+        ]
+        self.codes = self._sample(con, "SELECT code FROM discount_codes")
+        self.persisted_user_ids = self._sample(con, "SELECT user_id FROM persisted_user_data") or [1]
+        self.running_job_id = con.execute("SELECT id FROM broadcast_jobs WHERE status = 'running'").fetchone()[0]
+        self.subscriber_ids = self._sample(con, "SELECT user_id FROM users WHERE is_subscribed = 1")
+        # Inserts take slots far past the dataset so they never collide with it or each other.
+        self._next_slot = datetime.combine(
+            self.now.astimezone(db.LOCAL_TZ).date() + timedelta(days=3650), gen_dataset.SLOT_TIMES[0], tzinfo=db.LOCAL_TZ
+        )
+        self._counter = 0
+
+    def _sample(self, con: sqlite3.Connection, sql: str, k: int = 2000) -> list:
+        values = [r[0] for r in con.execute(sql)]
+        return self.rng.sample(values, min(k, len(values)))
+
+    def user(self) -> int:
+        return self.rng.randint(1, self.max_user_id)
+
+    def reservation(self) -> int:
+        return self.rng.randint(1, self.max_reservation_id)
+
+    def free_slot(self) -> datetime:
+        slot = self._next_slot
+        self._next_slot += timedelta(minutes=30)
+        return slot
+
+    def unique(self, prefix: str) -> str:
+        self._counter += 1
+        return f"{prefix}{self._counter}"
+
+
+@dataclass(frozen=True)
+class Case:
+    # Builds the call to time; anything prepare itself does is setup and not timed.
+    prepare: Callable[[_Context], Callable[[], Any]]
+    write: bool = False
+    cold: bool = False
+    heavy: bool = False
+
+
+def _warm(load: Callable[[int], Any], peek: Callable[[int], Any], key: int) -> Callable[[], Any]:
+    load(key)
+    return partial(peek, key)
+
+
+def _loaded_days(c: _Context) -> Callable[[], Any]:
+    for slot in c.rng.sample(c.active_slots, min(7, len(c.active_slots))):
+        db.get_day_slot_occupancy(slot.date())
+    return db.check_slot_cache
+
+
+def _cached_past_days(c: _Context) -> Callable[[], Any]:
+    _loaded_days(c)
+    return partial(db.prune_slot_cache, c.now.astimezone(db.LOCAL_TZ).date())
+
+
+def _buffered_sightings(c: _Context) -> Callable[[], Any]:
+    for _ in range(100):
+        db.record_user_seen(c.user(), None)
+    return db.flush_seen_users
+
+
+def _payment_for_fresh_hold(c: _Context) -> Callable[[], Any]:
+    uid = c.user()
+    reservation_id = db.try_hold_slot_pending_payment(uid, c.free_slot())
+    return partial(db.create_payment_request, reservation_id, uid, f"user{uid}", "6219861800000000", None, None, "receipt")
+
+
+def _pending_payment(c: _Context, coupon: bool = False) -> int:
+    uid = c.user()
+    reservation_id = db.try_hold_slot_pending_payment(uid, c.free_slot())
+    code, percent = (c.rng.choice(c.codes), 10) if coupon else (None, None)
+    return db.create_payment_request(reservation_id, uid, f"user{uid}", "6219861800000000", code, percent, "receipt")
+
+
+def _broadcast_results(c: _Context) -> Callable[[], Any]:
+    # A batch of 100 recipients, put back to pending so repeated calls never run out.
+    with db._connect() as con:
+        recipients = [
+            r[0]
+            for r in con.execute(
+                """
+                UPDATE broadcast_deliveries SET status = 'pending', attempted_at = NULL
+                WHERE job_id = ? AND user_id IN (
+                    SELECT user_id FROM broadcast_deliveries WHERE job_id = ? AND user_id > ? ORDER BY user_id LIMIT 100
+                )
+                RETURNING user_id
+                """,
+                (c.running_job_id, c.running_job_id, c.rng.choice(c.subscriber_ids)),
+            )
+        ]
+    return partial(db.record_broadcast_results, c.running_job_id, {uid: "sent" for uid in recipients})
+
+
+CASES: dict[str, Case] = {
+    # Lifecycle and memory-only helpers
+    "init_db": Case(lambda c: db.init_db),
+    "cache_stats": Case(lambda c: db.cache_stats),
+    "normalize_discount_code": Case(lambda c: partial(db.normalize_discount_code, "  Summer50 ")),
+    "peek_user_profile": Case(lambda c: _warm(db.get_user_profile, db.peek_user_profile, c.user())),
+    "peek_verified_card_number": Case(
+        lambda c: _warm(db.get_verified_card_number, db.peek_verified_card_number, c.user())
+    ),
+    "peek_reservation": Case(lambda c: _warm(db.get_reservation, db.peek_reservation, c.reservation())),
+    "peek_reservation_full": Case(lambda c: _warm(db.get_reservation_full, db.peek_reservation_full, c.reservation())),
+    "peek_day_slot_occupancy": Case(
+        lambda c: _warm(db.get_day_slot_occupancy, db.peek_day_slot_occupancy, c.rng.choice(c.active_slots).date())
+    ),
+    # Reads
+    "get_user_profile": Case(lambda c: partial(db.get_user_profile, c.user()), cold=True),
+    "list_subscribed_user_ids": Case(lambda c: db.list_subscribed_user_ids, heavy=True),
+    "get_admin_stats": Case(
+        lambda c: partial(db.get_admin_stats, c.now - timedelta(days=1), c.now - timedelta(days=7), use_cache=False),
+        heavy=True,
+    ),
+    "is_slot_reserved": Case(lambda c: partial(db.is_slot_reserved, c.rng.choice(c.active_slots))),
+    "get_slot_owner_user_id": Case(lambda c: partial(db.get_slot_owner_user_id, c.rng.choice(c.active_slots))),
+    "get_day_slot_occupancy": Case(
+        lambda c: partial(db.get_day_slot_occupancy, c.rng.choice(c.active_slots).date()), cold=True
+    ),
+    "check_slot_cache": Case(_loaded_days, cold=True),
+    "prune_slot_cache": Case(_cached_past_days, cold=True),
+    "list_reservations_for_user": Case(lambda c: partial(db.list_reservations_for_user, c.user(), 20)),
+    "get_reservation": Case(lambda c: partial(db.get_reservation, c.reservation()), cold=True),
+    "get_reservation_full": Case(lambda c: partial(db.get_reservation_full, c.reservation()), cold=True),
+    "get_reminder_candidate": Case(lambda c: partial(db.get_reminder_candidate, c.rng.choice(c.booked_ids))),
+    "list_reminder_candidates": Case(lambda c: partial(db.list_reminder_candidates, c.now)),
+    "get_payment_request": Case(lambda c: partial(db.get_payment_request, c.rng.randint(1, c.max_payment_id))),
+    "get_discount_code": Case(lambda c: partial(db.get_discount_code, c.rng.choice(c.codes))),
+    "can_use_discount_code": Case(lambda c: partial(db.can_use_discount_code, c.rng.choice(c.codes), c.now)),
+    "get_verification_request": Case(
+        lambda c: partial(db.get_verification_request, c.rng.randint(1, c.max_verification_id))
+    ),
+    "get_verified_card_number": Case(lambda c: partial(db.get_verified_card_number, c.user()), cold=True),
+    "get_broadcast_job": Case(lambda c: partial(db.get_broadcast_job, c.running_job_id)),
+    "list_active_broadcast_jobs": Case(lambda c: db.list_active_broadcast_jobs),
+    "list_pending_broadcast_recipients": Case(
+        lambda c: partial(db.list_pending_broadcast_recipients, c.running_job_id, 500, c.rng.choice(c.subscriber_ids))
+    ),
+    "get_persisted_user_data": Case(lambda c: partial(db.get_persisted_user_data, c.rng.choice(c.persisted_user_ids))),
+    "get_persisted_bot_data": Case(lambda c: db.get_persisted_bot_data),
+    # Writes
+    "upsert_user": Case(lambda c: partial(db.upsert_user, c.user(), None), write=True),
+    "flush_seen_users": Case(_buffered_sightings, write=True),
+    "record_user_seen": Case(lambda c: partial(db.record_user_seen, c.user(), None), write=True),
+    "set_user_subscription": Case(
+        lambda c: partial(db.set_user_subscription, c.user(), c.rng.random() < 0.6, None), write=True
+    ),
+    "unsubscribe_users": Case(lambda c: partial(db.unsubscribe_users, [c.user() for _ in range(50)]), write=True),
+    "add_reservation": Case(lambda c: partial(db.add_reservation, c.user(), c.free_slot()), write=True),
+    "try_reserve_slot": Case(lambda c: partial(db.try_reserve_slot, c.user(), c.free_slot()), write=True),
+    "try_hold_slot_pending_payment": Case(
+        lambda c: partial(db.try_hold_slot_pending_payment, c.user(), c.free_slot()), write=True
+    ),
+    "expire_pending_payment_holds": Case(
+        lambda c: partial(db.expire_pending_payment_holds, c.now - timedelta(minutes=30), 500), write=True
+    ),
+    "set_reservation_status": Case(
+        lambda c: partial(db.set_reservation_status, c.rng.choice(c.cancelled_ids), "cancelled"), write=True
+    ),
+    "update_reservation_promo": Case(
+        lambda c: partial(db.update_reservation_promo, c.rng.choice(c.booked_ids), None, "https://t.me/+g", None),
+        write=True,
+    ),
+    "update_reservation_destination_links": Case(
+        lambda c: partial(db.update_reservation_destination_links, c.rng.choice(c.booked_ids), "@channel"), write=True
+    ),
+    "mark_reservation_reminded": Case(
+        lambda c: partial(db.mark_reservation_reminded, c.reservation(), c.now.isoformat()), write=True
+    ),
+    "unmark_reservation_reminded": Case(
+        lambda c: partial(db.unmark_reservation_reminded, c.reservation(), c.now.isoformat()), write=True
+    ),
+    "create_payment_request": Case(_payment_for_fresh_hold, write=True),
+    "set_payment_status": Case(
+        lambda c: partial(db.set_payment_status, c.rng.randint(1, c.max_payment_id), "approved", 1), write=True
+    ),
+    "approve_payment": Case(lambda c: partial(db.approve_payment, _pending_payment(c, coupon=True), 1, c.now), write=True),
+    "reject_payment": Case(lambda c: partial(db.reject_payment, _pending_payment(c), 1, "unreadable receipt"), write=True),
+    "create_discount_code": Case(
+        lambda c: partial(db.create_discount_code, c.unique("bench"), 10, 100, c.now + timedelta(days=7), 1),
+        write=True,
+    ),
+    "consume_discount_code": Case(lambda c: partial(db.consume_discount_code, c.rng.choice(c.codes), c.now), write=True),
+    "create_verification_request": Case(
+        lambda c: partial(db.create_verification_request, c.user(), None, "6219861800000000", "photo"), write=True
+    ),
+    "set_verification_status": Case(
+        lambda c: partial(db.set_verification_status, c.rng.randint(1, c.max_verification_id), "approved", 1),
+        write=True,
+    ),
+    "upsert_verified_card": Case(
+        lambda c: partial(db.upsert_verified_card, c.user(), None, "6219861800000000", 1), write=True
+    ),
+    "create_broadcast_job": Case(lambda c: partial(db.create_broadcast_job, 1, 1, 1, 1), write=True, heavy=True),
+    "set_broadcast_job_status": Case(
+        lambda c: partial(db.set_broadcast_job_status, c.running_job_id, c.rng.choice(("paused", "running"))),
+        write=True,
+    ),
+    "set_broadcast_status_message": Case(
+        lambda c: partial(db.set_broadcast_status_message, c.running_job_id, c.rng.randint(1, 10**6)), write=True
+    ),
+    "record_broadcast_results": Case(_broadcast_results, write=True),
+    "save_persisted_data": Case(
+        lambda c: partial(db.save_persisted_data, {c.user(): '{"flow": "payment"}'}, {"bench": "{}"}), write=True
+    ),
+    "clear_caches": Case(lambda c: db.clear_caches, write=True),
+    # Last: the next call after it pays for a reconnect.
+    "close_connections": Case(lambda c: db.close_connections, write=True),
+}
+
+
+def uncovered_functions() -> list[str]:
+    """Public db.py functions without a case."""
+    public = {
+        name
+        for name, fn in inspect.getmembers(db, inspect.isfunction)
+        if not name.startswith("_") and fn.__module__ == db.__name__
+    }
+    return sorted(public - set(CASES))
+
+
+def _stats(samples: list[float]) -> dict[str, float]:
+    us = sorted(s * 1_000_000 for s in samples)
+
+    def pct(p: float) -> float:
+        return round(us[min(len(us) - 1, int(len(us) * p))], 1)
+
+    return {
+        "calls": len(us),
+        "p50_us": round(statistics.median(us), 1),
+        "p95_us": pct(0.95),
+        "p99_us": pct(0.99),
+        "mean_us": round(statistics.fmean(us), 1),
+        "max_us": round(us[-1], 1),
+    }
+
+
+def _dataset(size: str, seed: int, data_dir: str) -> tuple[str, dict[str, int] | None, float | None]:
+    """Path of the dataset for `size`, generating it unless data_dir already has it."""
+    users, reservations = SIZES[size]
+    path = os.path.join(data_dir, f"dataset-{users}u-{reservations}r-seed{seed}-v{LATEST_VERSION}.sqlite3")
+    if os.path.exists(path):
+        return path, None, None
+    t0 = time.perf_counter()
+    counts = gen_dataset.generate(path + ".partial", users, reservations, seed)
+    os.replace(path + ".partial", path)
+    return path, counts, time.perf_counter() - t0
+
+
+def _run_size(size: str, args: argparse.Namespace, data_dir: str, work_dir: str) -> dict:
+    dataset, counts, generate_s = _dataset(size, args.seed, data_dir)
+    work = os.path.join(work_dir, f"work-{size}.sqlite3")
+    shutil.copyfile(dataset, work)
+    os.environ["DB_PATH"] = work
+    db.close_connections()
+    db.clear_caches()
+    db.init_db()
+
+    con = db._connect()
+    if counts is None:
+        counts = {
+            table: con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("users", "reservations", "payment_requests", "verification_requests", "broadcast_deliveries")
+        }
+    ctx = _Context(con, args.seed)
+
+    functions: dict[str, dict[str, float]] = {}
+    for name, case in sorted(CASES.items(), key=lambda kv: kv[1].write):
+        samples = []
+        for _ in range(args.heavy_calls if case.heavy else args.calls):
+            if case.cold:
+                db.clear_caches()
+            call = case.prepare(ctx)
+            t0 = time.perf_counter()
+            call()
+            samples.append(time.perf_counter() - t0)
+        functions[name] = _stats(samples)
+        if args.verbose:
+            print(f"  {size} {name}: p50 {functions[name]['p50_us']}us", file=sys.stderr)
+
+    db.flush_seen_users()  # what record_user_seen buffered goes into this copy, not the next size's
+    db.clear_caches()
+    db.close_connections()
+    os.remove(work)
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(work + suffix):
+            os.remove(work + suffix)
+
+    return {
+        "users": SIZES[size][0],
+        "reservations": SIZES[size][1],
+        "rows": counts,
+        "generate_s": round(generate_s, 1) if generate_s is not None else None,
+        "db_mb": round(os.path.getsize(dataset) / 1e6, 1),
+        "functions": functions,
+    }
+
+
+def _compare(report: dict, baseline: dict, threshold: float, min_delta_us: float) -> list[str]:
+    """Print p50 changes against `baseline`; return the regressions."""
+    regressions = []
+    for size, result in report["sizes"].items():
+        old_size = baseline.get("sizes", {}).get(size)
+        if old_size is None:
+            print(f"{size}: not in baseline")
+            continue
+        print(f"{size}: p50 vs baseline")
+        for name, now in result["functions"].items():
+            old = old_size["functions"].get(name)
+            if old is None:
+                print(f"  {name:<38} {now['p50_us']:>11.1f}us  (new)")
+                continue
+            delta = now["p50_us"] - old["p50_us"]
+            change = delta / old["p50_us"] if old["p50_us"] else 0.0
+            regressed = change > threshold and delta > min_delta_us
+            flag = "  REGRESSED" if regressed else ""
+            print(f"  {name:<38} {old['p50_us']:>11.1f}us -> {now['p50_us']:>11.1f}us {change:+7.0%}{flag}")
+            if regressed:
+                regressions.append(f"{size} {name}")
+    return regressions
+
+
+def _print_report(report: dict) -> None:
+    for size, result in report["sizes"].items():
+        generated = f", generated in {result['generate_s']}s" if result["generate_s"] is not None else ""
+        print(
+            f"{size}: {result['users']:,} users, {result['reservations']:,} reservations,"
+            f" {result['db_mb']} MB{generated}"
+        )
+        print(f"  {'function':<38} {'calls':>6} {'p50 us':>11} {'p95 us':>11} {'p99 us':>11} {'max us':>11}")
+        for name, s in result["functions"].items():
+            print(
+                f"  {name:<38} {s['calls']:>6} {s['p50_us']:>11.1f} {s['p95_us']:>11.1f}"
+                f" {s['p99_us']:>11.1f} {s['max_us']:>11.1f}"
+            )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10k,100k", help=f"comma-separated, from {', '.join(SIZES)}")
+    parser.add_argument("--calls", type=int, default=200, help="calls per function")
+    parser.add_argument("--heavy-calls", type=int, default=5, help="calls per whole-table function")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--data-dir", help="keep generated datasets here and reuse them on later runs")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="report to compare against (e.g. baselines/bench_db_suite.json)")
+    parser.add_argument("--update-baseline", action="store_true", help=f"also write the report to {BASELINE_PATH}")
+    parser.add_argument("--threshold", type=float, default=0.3, help="p50 slowdown that counts as a regression")
+    parser.add_argument("--min-delta-us", type=float, default=50, help="ignore p50 changes smaller than this")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    missing = uncovered_functions()
+    if missing:
+        print(f"public db functions without a benchmark case: {', '.join(missing)}")
+        return 2
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        parser.error(f"unknown size(s) {unknown}; choose from {list(SIZES)}")
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} cpu",
+            "schema_version": LATEST_VERSION,
+            "seed": args.seed,
+            "calls": args.calls,
+            "heavy_calls": args.heavy_calls,
+        },
+        "sizes": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        os.makedirs(data_dir, exist_ok=True)
+        for size in sizes:
+            report["sizes"][size] = _run_size(size, args, data_dir, tmp)
+
+    _print_report(report)
+    for path in filter(None, (args.json, BASELINE_PATH if args.update_baseline else None)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = _compare(report, baseline, args.threshold, args.min_delta_us)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+        print("no regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,8 @@ import os
 import logging
 import asyncio
 import re
+from collections import OrderedDict
+from time import monotonic
 from typing import Optional
 from datetime import datetime, time, timedelta
 from zoneinfo import ZoneInfo
@@ -9,32 +11,64 @@ from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
 import jdatetime
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton, Update
+from telegram import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton, Update
 from telegram.constants import ChatMemberStatus
 from telegram.error import BadRequest, Forbidden
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     Application,
+    ApplicationBuilder,
     ApplicationHandlerStop,
     CallbackQueryHandler,
+    ChatMemberHandler,
     CommandHandler,
     ContextTypes,
     MessageHandler,
+    TypeHandler,
     filters,
 )
 
+# Before the local imports: metrics, db, db_async and recording read their settings at import time.
+load_dotenv()
+
+import metrics
+import recording
+from broadcast import BroadcastProgress, run_broadcast
+from persistence import SQLitePersistence
+from updates import PerUserUpdateProcessor, allowed_update_types
 from db import (
     init_db,
+    cache_stats,
+    peek_day_slot_occupancy,
+    prune_slot_cache,
+    record_user_seen,
+    BroadcastJob,
+    PaymentRequest,
+    normalize_discount_code,
+)
+import db_async
+from db_async import (
     list_reservations_for_user,
-    is_slot_reserved,
-    get_slot_owner_user_id,
+    get_day_slot_occupancy,
+    check_slot_cache,
     try_reserve_slot,
     try_hold_slot_pending_payment,
-    upsert_user,
+    expire_pending_payment_holds,
+    flush_seen_users,
     set_user_subscription,
-    list_subscribed_user_ids,
+    create_broadcast_job,
+    get_broadcast_job,
+    list_active_broadcast_jobs,
+    set_broadcast_job_status,
+    set_broadcast_status_message,
+    list_pending_broadcast_recipients,
+    record_broadcast_results,
+    unsubscribe_users,
     get_admin_stats,
-    list_reservations_due_for_reminder,
+    get_reminder_candidate,
+    list_reminder_candidates,
     mark_reservation_reminded,
+    unmark_reservation_reminded,
     create_verification_request,
     get_verification_request,
     set_verification_status,
@@ -42,20 +76,16 @@ from db import (
     get_verified_card_number,
     create_payment_request,
     get_payment_request,
-    set_payment_status,
+    approve_payment,
+    reject_payment,
     create_discount_code,
     can_use_discount_code,
-    normalize_discount_code,
-    consume_discount_code,
     get_reservation,
     get_reservation_full,
-    set_reservation_status,
     update_reservation_promo,
     update_reservation_destination_links,
 )
 
-load_dotenv()
-
 logging.basicConfig(
     format="%(asctime)s %(levelname)s %(name)s - %(message)s",
     level=logging.INFO,
@@ -67,6 +97,13 @@ REQUIRED_CHANNEL = os.getenv("REQUIRED_CHANNEL", "").strip()
 CHANNEL_JOIN_URL = os.getenv("CHANNEL_JOIN_URL", "").strip()
 ADMIN_CONTACT = os.getenv("ADMIN_CONTACT", "").strip()
 
+# "polling" (default) or "webhook" (see webhook.py for its WEBHOOK_* settings)
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower() or "polling"
+# Updates processed at once (different users only; one user's updates stay in order). 1 = sequential.
+CONCURRENT_UPDATES = max(1, int(os.getenv("CONCURRENT_UPDATES", "16").strip() or "16"))
+# How often changed user_data / bot_data (flow steps) are written to SQLite.
+PERSISTENCE_FLUSH_SECONDS = float(os.getenv("PERSISTENCE_FLUSH_SECONDS", "5").strip() or "5")
+
 TZ_NAME = os.getenv("TZ_NAME", "Asia/Tehran").strip() or "Asia/Tehran"
 TZ = ZoneInfo(TZ_NAME)
 
@@ -85,7 +122,22 @@ if BOT_ADMIN_IDS_RAW:
 if OWNER_CHAT_ID is not None:
     BOT_ADMIN_IDS.add(OWNER_CHAT_ID)
 
-BROADCAST_SLEEP_SECONDS = float(os.getenv("BROADCAST_SLEEP_SECONDS", "0.07").strip() or "0.07")
+MEMBERSHIP_CACHE_TTL_SECONDS = float(os.getenv("MEMBERSHIP_CACHE_TTL_SECONDS", "600").strip() or "600")
+MEMBERSHIP_NEGATIVE_TTL_SECONDS = float(os.getenv("MEMBERSHIP_NEGATIVE_TTL_SECONDS", "15").strip() or "15")
+MEMBERSHIP_CACHE_MAX_SIZE = int(os.getenv("MEMBERSHIP_CACHE_MAX_SIZE", "50000").strip() or "50000")
+# Listen for chat_member updates of REQUIRED_CHANNEL to keep the cache fresh (bot must be channel admin).
+MEMBERSHIP_UPDATES_ENABLED = os.getenv("MEMBERSHIP_UPDATES", "").strip().lower() in {"1", "true", "yes"}
+
+# Telegram's global bot limit is ~30 msg/s; stay a little under it.
+BROADCAST_RATE_PER_SECOND = float(os.getenv("BROADCAST_RATE_PER_SECOND", "25").strip() or "25")
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "8").strip() or "8")
+BROADCAST_PROGRESS_SECONDS = float(os.getenv("BROADCAST_PROGRESS_SECONDS", "5").strip() or "5")
+# Recipients loaded and sent per round of a persisted broadcast job.
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "500").strip() or "500")
+# Delivery results are saved every this many results or seconds, whichever comes first;
+# a crash resends at most the unsaved ones.
+BROADCAST_FLUSH_EVERY = int(os.getenv("BROADCAST_FLUSH_EVERY", "50").strip() or "50")
+BROADCAST_FLUSH_SECONDS = float(os.getenv("BROADCAST_FLUSH_SECONDS", "2").strip() or "2")
 
 UD_BROADCAST_STEP = "broadcast_step"
 BROADCAST_AWAIT_MESSAGE = "await_broadcast_message"
@@ -246,12 +298,34 @@ def _time_slots() -> list[time]:
     ]
 
 
-async def _render_slots_keyboard(target_date) -> tuple[InlineKeyboardMarkup, int]:
+def _slot_key(dt: datetime) -> str:
+    # Same format db.py stores in reservations.reserved_at
+    return dt.isoformat(timespec="seconds")
+
+
+def _reserved_slot_count(target_date, occupancy: dict[str, int]) -> int:
+    return sum(1 for t in _time_slots() if _slot_key(datetime.combine(target_date, t, tzinfo=TZ)) in occupancy)
+
+
+async def _day_occupancy(target_date) -> dict[str, int]:
+    # Cache hits are answered inline; only a miss pays for the thread hop + query.
+    occupancy = peek_day_slot_occupancy(target_date)
+    if occupancy is None:
+        occupancy = await get_day_slot_occupancy(target_date)
+    return occupancy
+
+
+async def _render_slots_keyboard(
+    target_date, occupancy: dict[str, int] | None = None
+) -> tuple[InlineKeyboardMarkup, int]:
+    if occupancy is None:
+        occupancy = await _day_occupancy(target_date)
+
     rows = []
     reserved_count = 0
     for t in _time_slots():
         dt = datetime.combine(target_date, t, tzinfo=TZ)
-        reserved = await asyncio.to_thread(is_slot_reserved, dt)
+        reserved = _slot_key(dt) in occupancy
         if reserved:
             reserved_count += 1
 
@@ -358,8 +432,7 @@ async def _ensure_member(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return True
 
     try:
-        member = await context.bot.get_chat_member(chat_id=REQUIRED_CHANNEL, user_id=user.id)
-        if _is_member(member):
+        if await _check_channel_member(context, user.id):
             return True
     except Exception:
         pass
@@ -389,20 +462,40 @@ def _build_gate_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(keyboard)
 
 
+SEEN_FLUSH_SECONDS = int(os.getenv("SEEN_FLUSH_SECONDS", "10").strip() or "10")
+
+
+async def track_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Record every interacting user in the write-behind buffer (memory only)."""
+    user = update.effective_user
+    if user is None or user.is_bot:
+        return
+    username = f"@{user.username}" if user.username else None
+    if record_user_seen(user.id, username):
+        context.application.create_task(_flush_seen_users())
+
+
+async def _flush_seen_users() -> None:
+    try:
+        await flush_seen_users()
+    except Exception:
+        logger.exception("Flushing seen users failed (will retry)")
+
+
+async def seen_users_flush_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    await _flush_seen_users()
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if update.effective_message is None:
         return
 
     user = update.effective_user
-    if user is not None:
-        username = f"@{user.username}" if user.username else None
-        await asyncio.to_thread(upsert_user, user.id, username)
     is_member = False
 
     if user and REQUIRED_CHANNEL:
         try:
-            member = await context.bot.get_chat_member(chat_id=REQUIRED_CHANNEL, user_id=user.id)
-            is_member = _is_member(member)
+            is_member = await _check_channel_member(context, user.id)
         except Exception:
             # If bot isn't admin or channel is wrong, we'll fall back to showing the gate.
             is_member = False
@@ -432,7 +525,7 @@ async def subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return
 
     username = f"@{user.username}" if user.username else None
-    await asyncio.to_thread(set_user_subscription, user.id, True, username)
+    await set_user_subscription(user.id, True, username)
     await msg.reply_text("عضویت شما در اطلاع رسانی فعال شد.", reply_markup=_main_menu_keyboard())
 
 
@@ -443,10 +536,25 @@ async def unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         return
 
     username = f"@{user.username}" if user.username else None
-    await asyncio.to_thread(set_user_subscription, user.id, False, username)
+    await set_user_subscription(user.id, False, username)
     await msg.reply_text("عضویت شما در اطلاع رسانی غیرفعال شد.", reply_markup=_main_menu_keyboard())
 
 
+async def perf(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin-only latency digest since start (handlers, DB, Bot API, row caches)."""
+    msg = update.effective_message
+    user = update.effective_user
+    if msg is None or user is None:
+        return
+
+    if not _is_admin(user.id):
+        await msg.reply_text("شما دسترسی ندارید.")
+        return
+
+    caches = ", ".join(f"{name} {s['hits']}/{s['hits'] + s['misses']}" for name, s in cache_stats().items())
+    await msg.reply_text(f"⚙️ عملکرد ربات\n\n{metrics.summary()}\n\nrow cache hits: {caches}")
+
+
 def _owner_only(user_id: int | None) -> bool:
     return OWNER_CHAT_ID is not None and user_id is not None and user_id == OWNER_CHAT_ID
 
@@ -455,11 +563,11 @@ def _is_admin(user_id: int | None) -> bool:
     return user_id is not None and user_id in BOT_ADMIN_IDS
 
 
-def _format_seen_at(seen_at_iso_utc: str | None) -> str:
-    if not seen_at_iso_utc:
+def _format_seen_at(seen_at: datetime | None) -> str:
+    if seen_at is None:
         return "نامشخص"
     try:
-        dt = datetime.fromisoformat(seen_at_iso_utc)
+        dt = seen_at
         if dt.tzinfo is None:
             dt = dt.replace(tzinfo=ZoneInfo("UTC"))
         dt = dt.astimezone(TZ)
@@ -468,7 +576,7 @@ def _format_seen_at(seen_at_iso_utc: str | None) -> str:
         time_str = dt.strftime("%H:%M").translate(PERSIAN_DIGITS)
         return f"{date_str} - {time_str}"
     except Exception:
-        return seen_at_iso_utc
+        return seen_at.isoformat(timespec="seconds")
 
 
 async def amar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -482,10 +590,10 @@ async def amar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return
 
     now_utc = datetime.utcnow().replace(tzinfo=ZoneInfo("UTC"))
-    since_24h = (now_utc - timedelta(hours=24)).isoformat(timespec="seconds")
-    since_7d = (now_utc - timedelta(days=7)).isoformat(timespec="seconds")
+    since_24h = now_utc - timedelta(hours=24)
+    since_7d = now_utc - timedelta(days=7)
 
-    stats = await asyncio.to_thread(get_admin_stats, since_24h, since_7d)
+    stats = await get_admin_stats(since_24h, since_7d)
 
     now_local = datetime.now(TZ)
     jdate = jdatetime.date.fromgregorian(date=now_local.date())
@@ -557,6 +665,298 @@ async def hamgani_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await msg.reply_text("ارسال همگانی لغو شد.")
 
 
+BROADCAST_STATUS_FA = {
+    "running": "در حال ارسال",
+    "paused": "متوقف موقت",
+    "cancelled": "لغو شده",
+    "done": "تمام شد",
+}
+
+# job_id -> (drain task, stop event) for broadcast jobs drained by this process
+_broadcast_drains: dict[int, tuple[asyncio.Task, asyncio.Event]] = {}
+
+
+def _broadcast_status_text(job: BroadcastJob, batch: BroadcastProgress | None = None) -> str:
+    sent = job.sent + (batch.sent if batch else 0)
+    failed = job.failed + (batch.failed if batch else 0)
+    blocked = job.blocked + (batch.blocked if batch else 0)
+    return (
+        f"ارسال همگانی #{job.id} - {BROADCAST_STATUS_FA.get(job.status, job.status)}\n"
+        f"آمار: {sent + failed + blocked}/{job.total}\n"
+        f"ارسال موفق: {sent}\n"
+        f"ناموفق: {failed + blocked} (بلاک/غیرفعال: {blocked})"
+    )
+
+
+async def _edit_broadcast_status(bot, job: BroadcastJob, batch: BroadcastProgress | None = None) -> None:
+    if job.status_message_id is None:
+        return
+    try:
+        await bot.edit_message_text(
+            chat_id=job.owner_chat_id,
+            message_id=job.status_message_id,
+            text=_broadcast_status_text(job, batch),
+        )
+    except BadRequest:
+        # "message is not modified" or the status message was deleted
+        pass
+
+
+class _BroadcastResultWriter:
+    """Saves a broadcast job's delivery results while it sends.
+
+    `add` is run_broadcast's on_result. A background task writes the buffered
+    results every BROADCAST_FLUSH_EVERY results or BROADCAST_FLUSH_SECONDS and
+    unsubscribes chats that blocked the bot. If a write fails it sets `stop`,
+    so sending ends instead of going on unsaved, and `close` raises the error.
+    """
+
+    def __init__(self, job_id: int, stop: asyncio.Event) -> None:
+        self._job_id = job_id
+        self._stop = stop
+        self._unsaved: dict[int, str] = {}
+        self._wake = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._closed = False
+        self._task = asyncio.create_task(self._run())
+
+    def add(self, user_id: int, outcome: str) -> None:
+        self._unsaved[user_id] = outcome
+        if len(self._unsaved) >= BROADCAST_FLUSH_EVERY:
+            self._wake.set()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            results, self._unsaved = self._unsaved, {}
+            if not results:
+                return
+            await record_broadcast_results(self._job_id, results)
+            blocked_ids = [uid for uid, outcome in results.items() if outcome == "blocked"]
+            if blocked_ids:
+                await unsubscribe_users(blocked_ids)
+
+    async def _run(self) -> None:
+        try:
+            while not self._closed:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), BROADCAST_FLUSH_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                await self.flush()
+        except Exception:
+            self._stop.set()
+            raise
+
+    async def close(self) -> None:
+        """Stop the background task and save what is left; raises a failed write."""
+        self._closed = True
+        self._wake.set()
+        try:
+            await self._task
+        finally:
+            await self.flush()
+
+
+async def _drain_broadcast_job(job_id: int, bot, stop: asyncio.Event) -> None:
+    """Send a persisted broadcast job batch by batch until done, paused or cancelled."""
+    # Keyset cursor: earlier recipients already have a result, so never rescan them.
+    last_user_id = -1
+    writer = _BroadcastResultWriter(job_id, stop)
+    try:
+        try:
+            while not stop.is_set():
+                job = await get_broadcast_job(job_id)
+                if job is None or job.status != "running":
+                    return
+
+                batch = await list_pending_broadcast_recipients(job_id, BROADCAST_BATCH_SIZE, last_user_id)
+                if not batch:
+                    # The counters shown to the owner must include every result.
+                    await writer.flush()
+                    await set_broadcast_job_status(job_id, "done")
+                    job = await get_broadcast_job(job_id)
+                    await _edit_broadcast_status(bot, job)
+                    await bot.send_message(
+                        chat_id=job.owner_chat_id,
+                        text=(
+                            f"ارسال همگانی #{job.id} تمام شد.\n"
+                            f"کل: {job.total}\n"
+                            f"موفق: {job.sent}\n"
+                            f"ناموفق: {job.failed + job.blocked} (بلاک/غیرفعال: {job.blocked})"
+                        ),
+                    )
+                    return
+
+                async def on_progress(p: BroadcastProgress, job: BroadcastJob = job) -> None:
+                    await _edit_broadcast_status(bot, job, p)
+
+                last_user_id = batch[-1]
+                await run_broadcast(
+                    bot,
+                    batch,
+                    len(batch),
+                    job.from_chat_id,
+                    job.message_id,
+                    on_progress=on_progress,
+                    on_result=writer.add,
+                    stop_event=stop,
+                    rate_per_second=BROADCAST_RATE_PER_SECOND,
+                    concurrency=BROADCAST_CONCURRENCY,
+                    progress_interval=BROADCAST_PROGRESS_SECONDS,
+                )
+        finally:
+            # Recipients without a saved result stay pending and are retried on resume.
+            await writer.close()
+    except Exception:
+        logger.exception("Broadcast job %s failed", job_id)
+        await _pause_failed_broadcast(job_id, bot)
+    finally:
+        _broadcast_drains.pop(job_id, None)
+
+
+async def _pause_failed_broadcast(job_id: int, bot) -> None:
+    """Park a job whose drain crashed as paused (instead of stuck 'running') and tell its owner."""
+    try:
+        job = await get_broadcast_job(job_id)
+        if job is None or job.status != "running":
+            return
+        await set_broadcast_job_status(job_id, "paused")
+        job = await get_broadcast_job(job_id)
+        await _edit_broadcast_status(bot, job)
+        await bot.send_message(
+            chat_id=job.owner_chat_id,
+            text=f"ارسال همگانی #{job.id} به خطا خورد و متوقف شد.\nادامه: /resume_hamgani {job.id}",
+        )
+    except Exception:
+        logger.exception("Could not pause broadcast job %s after its failure", job_id)
+
+
+def _start_broadcast_drain(job_id: int, bot) -> None:
+    if job_id in _broadcast_drains:
+        return
+    stop = asyncio.Event()
+    # Deliberately not Application.create_task: stop() awaits those, and a large
+    # broadcast would hold up shutdown. _stop_broadcast_drains() handles it instead.
+    task = asyncio.create_task(_drain_broadcast_job(job_id, bot, stop))
+    _broadcast_drains[job_id] = (task, stop)
+
+
+async def _stop_broadcast_drain(job_id: int) -> None:
+    drain = _broadcast_drains.get(job_id)
+    if drain is None:
+        return
+    task, stop = drain
+    stop.set()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+async def _stop_broadcast_drains() -> None:
+    """Let in-flight sends finish and persist their results; jobs stay 'running' for resume."""
+    await asyncio.gather(*(_stop_broadcast_drain(job_id) for job_id in list(_broadcast_drains)))
+
+
+async def _resolve_broadcast_job(update: Update, context: ContextTypes.DEFAULT_TYPE) -> BroadcastJob | None:
+    """The job named by the command argument, else the newest running/paused job."""
+    msg = update.effective_message
+    if context.args:
+        if not context.args[0].isdigit():
+            await msg.reply_text("شماره ارسال نامعتبر است.")
+            return None
+        job = await get_broadcast_job(int(context.args[0]))
+    else:
+        active = await list_active_broadcast_jobs()
+        job = active[-1] if active else None
+    if job is None:
+        await msg.reply_text("ارسال همگانی فعالی پیدا نشد.")
+    return job
+
+
+async def hamgani_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    msg = update.effective_message
+    user = update.effective_user
+    if msg is None or user is None:
+        return
+
+    if not _is_admin(user.id):
+        await msg.reply_text("شما دسترسی ندارید.")
+        return
+
+    job = await _resolve_broadcast_job(update, context)
+    if job is None:
+        return
+    await msg.reply_text(_broadcast_status_text(job))
+
+
+async def hamgani_pause(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    msg = update.effective_message
+    user = update.effective_user
+    if msg is None or user is None:
+        return
+
+    if not _is_admin(user.id):
+        await msg.reply_text("شما دسترسی ندارید.")
+        return
+
+    job = await _resolve_broadcast_job(update, context)
+    if job is None:
+        return
+    if job.status != "running":
+        await msg.reply_text(f"ارسال #{job.id} در حال اجرا نیست.")
+        return
+
+    await set_broadcast_job_status(job.id, "paused")
+    await _stop_broadcast_drain(job.id)
+    job = await get_broadcast_job(job.id)
+    await _edit_broadcast_status(context.bot, job)
+    await msg.reply_text(f"ارسال #{job.id} متوقف شد. ادامه: /resume_hamgani {job.id}")
+
+
+async def hamgani_resume(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    msg = update.effective_message
+    user = update.effective_user
+    if msg is None or user is None:
+        return
+
+    if not _is_admin(user.id):
+        await msg.reply_text("شما دسترسی ندارید.")
+        return
+
+    job = await _resolve_broadcast_job(update, context)
+    if job is None:
+        return
+    if job.status != "paused":
+        await msg.reply_text(f"ارسال #{job.id} متوقف نیست.")
+        return
+
+    await set_broadcast_job_status(job.id, "running")
+    _start_broadcast_drain(job.id, context.bot)
+    await msg.reply_text(f"ارسال #{job.id} ادامه پیدا کرد.")
+
+
+async def hamgani_stop(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    msg = update.effective_message
+    user = update.effective_user
+    if msg is None or user is None:
+        return
+
+    if not _is_admin(user.id):
+        await msg.reply_text("شما دسترسی ندارید.")
+        return
+
+    job = await _resolve_broadcast_job(update, context)
+    if job is None:
+        return
+    if not await set_broadcast_job_status(job.id, "cancelled"):
+        await msg.reply_text(f"ارسال #{job.id} قبلاً تمام یا لغو شده.")
+        return
+
+    await _stop_broadcast_drain(job.id)
+    job = await get_broadcast_job(job.id)
+    await _edit_broadcast_status(context.bot, job)
+    await msg.reply_text(f"ارسال #{job.id} لغو شد.")
+
+
 async def on_owner_broadcast_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
     msg = update.effective_message
@@ -576,58 +976,24 @@ async def on_owner_broadcast_message(update: Update, context: ContextTypes.DEFAU
     source_chat_id = msg.chat_id
     source_message_id = msg.message_id
 
-    user_ids = await asyncio.to_thread(list_subscribed_user_ids)
-    total = len(user_ids)
+    job = await create_broadcast_job(user.id, owner_chat_id, source_chat_id, source_message_id)
 
-    if total == 0:
+    if job.total == 0:
+        await set_broadcast_job_status(job.id, "done")
         await context.bot.send_message(chat_id=owner_chat_id, text="هیچ کاربری عضو اطلاع رسانی نیست.")
         raise ApplicationHandlerStop
 
-    sent = 0
-    failed = 0
-    blocked = 0
-
-    await context.bot.send_message(chat_id=owner_chat_id, text=f"شروع ارسال به {total} نفر...")
-
-    for i, chat_id in enumerate(user_ids, start=1):
-        try:
-            await context.bot.copy_message(
-                chat_id=chat_id,
-                from_chat_id=source_chat_id,
-                message_id=source_message_id,
-            )
-            sent += 1
-        except Forbidden:
-            blocked += 1
-            failed += 1
-            await asyncio.to_thread(set_user_subscription, int(chat_id), False, None)
-        except BadRequest:
-            failed += 1
-        except Exception:
-            failed += 1
-
-        if i % 10 == 0 or i == total:
-            await context.bot.send_message(
-                chat_id=owner_chat_id,
-                text=(
-                    f"آمار: {i}/{total}\n"
-                    f"ارسال موفق: {sent}\n"
-                    f"ناموفق: {failed} (بلاک/غیرفعال: {blocked})"
-                ),
-            )
-
-        if BROADCAST_SLEEP_SECONDS > 0:
-            await asyncio.sleep(BROADCAST_SLEEP_SECONDS)
-
+    status_msg = await context.bot.send_message(chat_id=owner_chat_id, text=_broadcast_status_text(job))
+    await set_broadcast_status_message(job.id, status_msg.message_id)
     await context.bot.send_message(
         chat_id=owner_chat_id,
         text=(
-            "ارسال همگانی تمام شد.\n"
-            f"کل: {total}\n"
-            f"موفق: {sent}\n"
-            f"ناموفق: {failed} (بلاک/غیرفعال: {blocked})"
+            f"ارسال همگانی #{job.id} در پس زمینه شروع شد.\n"
+            "/status_hamgani وضعیت | /pause_hamgani توقف موقت | "
+            "/resume_hamgani ادامه | /stop_hamgani لغو"
         ),
     )
+    _start_broadcast_drain(job.id, context.bot)
 
     # Prevent other handlers (e.g., photo/text flows) from processing this owner message.
     raise ApplicationHandlerStop
@@ -734,6 +1100,81 @@ def _is_member(member) -> bool:
     return False
 
 
+class _MembershipCache:
+    """Bounded LRU of REQUIRED_CHANNEL membership results.
+
+    Positive and negative answers get separate TTLs: a non-member who just
+    joined should not wait long, while members rarely leave.
+    """
+
+    def __init__(self, positive_ttl: float, negative_ttl: float, max_size: int) -> None:
+        self._positive_ttl = positive_ttl
+        self._negative_ttl = negative_ttl
+        self._max_size = max_size
+        self._entries: OrderedDict[int, tuple[bool, float]] = OrderedDict()
+
+    def get(self, user_id: int) -> bool | None:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        is_member, expires_at = entry
+        if monotonic() >= expires_at:
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return is_member
+
+    def set(self, user_id: int, is_member: bool) -> None:
+        ttl = self._positive_ttl if is_member else self._negative_ttl
+        if ttl <= 0:
+            self._entries.pop(user_id, None)
+            return
+        self._entries[user_id] = (is_member, monotonic() + ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        self._entries.pop(user_id, None)
+
+
+_membership_cache = _MembershipCache(
+    MEMBERSHIP_CACHE_TTL_SECONDS, MEMBERSHIP_NEGATIVE_TTL_SECONDS, MEMBERSHIP_CACHE_MAX_SIZE
+)
+
+
+async def _check_channel_member(context: ContextTypes.DEFAULT_TYPE, user_id: int, fresh: bool = False) -> bool:
+    """Cached get_chat_member(REQUIRED_CHANNEL). Errors propagate and are never cached."""
+    if fresh:
+        _membership_cache.invalidate(user_id)
+    else:
+        cached = _membership_cache.get(user_id)
+        if cached is not None:
+            return cached
+
+    member = await context.bot.get_chat_member(chat_id=REQUIRED_CHANNEL, user_id=user_id)
+    is_member = _is_member(member)
+    _membership_cache.set(user_id, is_member)
+    return is_member
+
+
+def _is_required_channel(chat) -> bool:
+    if not REQUIRED_CHANNEL or chat is None:
+        return False
+    if REQUIRED_CHANNEL.startswith("@"):
+        return bool(chat.username) and chat.username.lower() == REQUIRED_CHANNEL[1:].lower()
+    return str(chat.id) == REQUIRED_CHANNEL
+
+
+async def on_channel_member_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Keep the membership cache in sync with joins/leaves in REQUIRED_CHANNEL."""
+    cmu = update.chat_member
+    if cmu is None or not _is_required_channel(cmu.chat):
+        return
+    new_member = cmu.new_chat_member
+    _membership_cache.set(new_member.user.id, _is_member(new_member))
+
+
 async def confirm_membership(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     if query is None:
@@ -748,8 +1189,8 @@ async def confirm_membership(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
 
     try:
-        member = await context.bot.get_chat_member(chat_id=REQUIRED_CHANNEL, user_id=user.id)
-        if _is_member(member):
+        # The user usually presses this right after joining, so bypass (and then refresh) the cache.
+        if await _check_channel_member(context, user.id, fresh=True):
             await query.answer()
             await query.edit_message_text(
                 "عضویت شما تایید شد.",
@@ -796,7 +1237,7 @@ async def on_account(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     if not await _ensure_member(update, context):
         return
 
-    reservations = await asyncio.to_thread(list_reservations_for_user, user.id, 20)
+    reservations = await list_reservations_for_user(user.id, 20)
     if reservations:
         lines = []
         for idx, r in enumerate(reservations, start=1):
@@ -838,8 +1279,7 @@ async def on_slot_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         pass
     else:
         try:
-            member = await context.bot.get_chat_member(chat_id=REQUIRED_CHANNEL, user_id=user.id)
-            if not _is_member(member):
+            if not await _check_channel_member(context, user.id):
                 await query.answer("عضو نیستید", show_alert=True)
                 return
         except Exception:
@@ -860,7 +1300,8 @@ async def on_slot_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         await query.answer("داده نامعتبر است.", show_alert=True)
         return
 
-    owner_id = await asyncio.to_thread(get_slot_owner_user_id, slot_dt)
+    occupancy = await _day_occupancy(target_date)
+    owner_id = occupancy.get(_slot_key(slot_dt))
     if owner_id is not None:
         if owner_id == user.id:
             await query.answer("این تایم قبلاً توسط شما رزرو شده.", show_alert=True)
@@ -869,13 +1310,13 @@ async def on_slot_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         return
 
     # Enforce daily quota based on real reserved count for this date.
-    _, reserved_count = await _render_slots_keyboard(target_date)
+    reserved_count = _reserved_slot_count(target_date, occupancy)
     if reserved_count >= DAILY_LIMIT:
         await query.answer("ظرفیت رزرو امروز تکمیل است.", show_alert=True)
         return
 
     # Require verification before proceeding to payment.
-    verified_card = await asyncio.to_thread(get_verified_card_number, user.id)
+    verified_card = await get_verified_card_number(user.id)
     if not verified_card:
         await query.answer("ابتدا احراز هویت را انجام دهید.", show_alert=True)
         await context.bot.send_message(
@@ -885,7 +1326,7 @@ async def on_slot_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         )
         return
 
-    reservation_id = await asyncio.to_thread(try_hold_slot_pending_payment, user.id, slot_dt)
+    reservation_id = await try_hold_slot_pending_payment(user.id, slot_dt)
     if reservation_id is None:
         await query.answer("این تایم همین الان رزرو شد.", show_alert=True)
         return
@@ -941,7 +1382,7 @@ async def on_discount_choice(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await query.answer("داده نامعتبر است.", show_alert=True)
         return
 
-    verified_card = await asyncio.to_thread(get_verified_card_number, user.id)
+    verified_card = await get_verified_card_number(user.id)
     if not verified_card:
         await query.answer("ابتدا احراز هویت را انجام دهید.", show_alert=True)
         return
@@ -995,8 +1436,8 @@ async def on_coupon_code(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await msg.reply_text("کد تخفیف نامعتبر است. دوباره ارسال کنید.")
         return
 
-    now_utc = datetime.utcnow().replace(tzinfo=ZoneInfo("UTC")).isoformat(timespec="seconds")
-    ok, reason, percent = await asyncio.to_thread(can_use_discount_code, code, now_utc)
+    now_utc = datetime.now(ZoneInfo("UTC"))
+    ok, reason, percent = await can_use_discount_code(code, now_utc)
     if not ok:
         if reason == "expired":
             await msg.reply_text("این کد تخفیف منقضی شده است.")
@@ -1006,7 +1447,7 @@ async def on_coupon_code(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             await msg.reply_text("این کد تخفیف معتبر نیست.")
         return
 
-    verified_card = await asyncio.to_thread(get_verified_card_number, user.id)
+    verified_card = await get_verified_card_number(user.id)
     if not verified_card:
         await msg.reply_text("ابتدا احراز هویت را انجام دهید.")
         return
@@ -1048,7 +1489,7 @@ async def on_payment_receipt_photo(update: Update, context: ContextTypes.DEFAULT
         await msg.reply_text("پرداخت در حال حاضر فعال نیست (ادمین تنظیم نشده).")
         return
 
-    verified_card = await asyncio.to_thread(get_verified_card_number, user.id)
+    verified_card = await get_verified_card_number(user.id)
     if not verified_card:
         await msg.reply_text("ابتدا احراز هویت را انجام دهید.")
         return
@@ -1061,8 +1502,7 @@ async def on_payment_receipt_photo(update: Update, context: ContextTypes.DEFAULT
     coupon = context.user_data.pop(UD_PAYMENT_COUPON_CODE, None)
     coupon_percent = context.user_data.pop(UD_PAYMENT_COUPON_PERCENT, None)
 
-    payment_id = await asyncio.to_thread(
-        create_payment_request,
+    payment_id = await create_payment_request(
         reservation_id,
         user.id,
         username,
@@ -1071,8 +1511,17 @@ async def on_payment_receipt_photo(update: Update, context: ContextTypes.DEFAULT
         int(coupon_percent) if isinstance(coupon_percent, int) else None,
         receipt_file_id,
     )
+    if payment_id is None:
+        # The hold expired (see pending_hold_sweeper_job) before the receipt arrived.
+        context.user_data[UD_PAYMENT_STEP] = None
+        context.user_data.pop(UD_PAYMENT_RESERVATION_ID, None)
+        await msg.reply_text(
+            "مهلت پرداخت این رزرو به پایان رسیده و تایم آزاد شده است. لطفاً دوباره رزرو کنید: /start",
+            reply_markup=_main_menu_keyboard(),
+        )
+        return
 
-    res = await asyncio.to_thread(get_reservation, reservation_id)
+    res = await get_reservation(reservation_id)
     reserved_at_text = res.reserved_at if res else "(نامشخص)"
 
     caption = (
@@ -1107,6 +1556,15 @@ async def on_payment_receipt_photo(update: Update, context: ContextTypes.DEFAULT
     await msg.reply_text("فیش شما ارسال شد و در حال بررسی است.", reply_markup=_main_menu_keyboard())
 
 
+async def _answer_payment_not_pending(query: CallbackQuery, payment_id: int, pay: PaymentRequest | None = None) -> None:
+    if pay is None:
+        pay = await get_payment_request(payment_id)
+    if pay is None:
+        await query.answer("پرداخت پیدا نشد.", show_alert=True)
+    else:
+        await query.answer("این پرداخت قبلاً بررسی شده.", show_alert=True)
+
+
 async def on_payment_decision(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     if query is None:
@@ -1134,25 +1592,17 @@ async def on_payment_decision(update: Update, context: ContextTypes.DEFAULT_TYPE
         await query.answer("داده نامعتبر است.", show_alert=True)
         return
 
-    pay = await asyncio.to_thread(get_payment_request, payment_id)
-    if pay is None:
-        await query.answer("پرداخت پیدا نشد.", show_alert=True)
-        return
-
-    if pay.status != "pending":
-        await query.answer("این پرداخت قبلاً بررسی شده.", show_alert=True)
-        return
-
     if action == "approve":
-        await asyncio.to_thread(set_payment_status, payment_id, "approved", actor.id, None)
-        await asyncio.to_thread(set_reservation_status, pay.reservation_id, "booked")
-
-        # Consume coupon only on approved purchase
-        if pay.coupon_code:
-            now_utc = datetime.utcnow().replace(tzinfo=ZoneInfo("UTC")).isoformat(timespec="seconds")
-            consumed = await asyncio.to_thread(consume_discount_code, pay.coupon_code, now_utc)
-            if not consumed:
-                logger.warning("Coupon could not be consumed (expired/used up): %s", pay.coupon_code)
+        # One transaction: payment approved, slot booked, coupon consumed (only on an approved purchase).
+        approval = await approve_payment(payment_id, actor.id, datetime.now(ZoneInfo("UTC")))
+        if approval is None:
+            await _answer_payment_not_pending(query, payment_id)
+            return
+        pay = approval.payment
+        if approval.reminder is not None:
+            _schedule_reminder(context, approval.reminder.reservation_id, approval.reminder.reserved_at)
+        if approval.coupon_consumed is False:
+            logger.warning("Coupon could not be consumed (expired/used up): %s", pay.coupon_code)
 
         # After approval, ask user for banner/link and forward it to owner.
         await context.bot.send_message(
@@ -1174,6 +1624,10 @@ async def on_payment_decision(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
 
     if action == "reject":
+        pay = await get_payment_request(payment_id)
+        if pay is None or pay.status != "pending":
+            await _answer_payment_not_pending(query, payment_id, pay)
+            return
         # Ask owner for reason in chat
         pending = context.bot_data.setdefault(BOTDATA_OWNER_PENDING_REJECT, {})
         pending[str(actor.id)] = payment_id
@@ -1306,7 +1760,7 @@ async def on_takhfif_wizard(update: Update, context: ContextTypes.DEFAULT_TYPE)
             raise ApplicationHandlerStop
 
         try:
-            await asyncio.to_thread(create_discount_code, code, percent, max_uses, expires_at, user.id)
+            await create_discount_code(code, percent, max_uses, datetime.fromisoformat(expires_at), user.id)
         except Exception:
             await msg.reply_text("این کد قبلاً ثبت شده است. یک کد دیگر ارسال کنید: /takhfif")
             context.user_data[UD_TAKHFIF_STEP] = None
@@ -1344,15 +1798,12 @@ async def on_owner_reject_reason(update: Update, context: ContextTypes.DEFAULT_T
         return
 
     reason = msg.text.strip()
-    pay = await asyncio.to_thread(get_payment_request, int(payment_id))
-    if pay is None or pay.status != "pending":
+    # One transaction: payment rejected and the pending reservation cancelled, freeing the slot.
+    pay = await reject_payment(int(payment_id), actor.id, reason)
+    if pay is None:
         pending.pop(str(actor.id), None)
         return
 
-    await asyncio.to_thread(set_payment_status, int(payment_id), "rejected", actor.id, reason)
-    # Free the slot by cancelling the pending reservation
-    await asyncio.to_thread(set_reservation_status, pay.reservation_id, "cancelled")
-
     await context.bot.send_message(
         chat_id=pay.user_id,
         text=f"{reason}\n\n/start",
@@ -1387,8 +1838,7 @@ async def on_banner_or_link(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if getattr(msg, "photo", None):
         promo_photo_file_id = msg.photo[-1].file_id
 
-    await asyncio.to_thread(
-        update_reservation_promo,
+    await update_reservation_promo(
         int(reservation_id),
         username,
         group_link,
@@ -1452,12 +1902,12 @@ async def on_destination_choice(update: Update, context: ContextTypes.DEFAULT_TY
         return
 
     if choice == "no":
-        await asyncio.to_thread(update_reservation_destination_links, reservation_id, None)
+        await update_reservation_destination_links(reservation_id, None)
 
         # Send admin summary now
         targets = sorted(BOT_ADMIN_IDS) if BOT_ADMIN_IDS else ([OWNER_CHAT_ID] if OWNER_CHAT_ID else [])
         if targets:
-            full = await asyncio.to_thread(get_reservation_full, reservation_id)
+            full = await get_reservation_full(reservation_id)
             reserved_str = _format_reserved_at_for_owner(full.reserved_at) if full else "(نامشخص)"
             username = full.username if full and full.username else (f"@{user.username}" if user.username else None)
             for admin_id in targets:
@@ -1528,12 +1978,12 @@ async def on_destination_links(update: Update, context: ContextTypes.DEFAULT_TYP
     if text == DEST_FINISH_TEXT:
         links_list = context.user_data.get(UD_DEST_LINKS_LIST, [])
         links_text = "\n".join([s for s in links_list if s]) or None
-        await asyncio.to_thread(update_reservation_destination_links, reservation_id, links_text)
+        await update_reservation_destination_links(reservation_id, links_text)
 
         # Send admin summary now (with links)
         targets = sorted(BOT_ADMIN_IDS) if BOT_ADMIN_IDS else ([OWNER_CHAT_ID] if OWNER_CHAT_ID else [])
         if targets:
-            full = await asyncio.to_thread(get_reservation_full, reservation_id)
+            full = await get_reservation_full(reservation_id)
             reserved_str = _format_reserved_at_for_owner(full.reserved_at) if full else "(نامشخص)"
             username = full.username if full and full.username else (f"@{user.username}" if user.username else None)
             for admin_id in targets:
@@ -1739,7 +2189,7 @@ async def on_verification_card_number(update: Update, context: ContextTypes.DEFA
         return
 
     username = f"@{user.username}" if user.username else None
-    request_id = await asyncio.to_thread(create_verification_request, user.id, username, card, photo_file_id)
+    request_id = await create_verification_request(user.id, username, card, photo_file_id)
     context.user_data[UD_VERIFICATION_REQUEST_ID] = request_id
 
     caption = (
@@ -1807,7 +2257,7 @@ async def on_verification_decision(update: Update, context: ContextTypes.DEFAULT
         await query.answer("داده نامعتبر است.", show_alert=True)
         return
 
-    req = await asyncio.to_thread(get_verification_request, request_id)
+    req = await get_verification_request(request_id)
     if req is None:
         await query.answer("درخواست پیدا نشد.", show_alert=True)
         return
@@ -1817,8 +2267,8 @@ async def on_verification_decision(update: Update, context: ContextTypes.DEFAULT
         return
 
     if action == "approve":
-        await asyncio.to_thread(set_verification_status, request_id, "approved", actor.id, None)
-        await asyncio.to_thread(upsert_verified_card, req.user_id, req.username, req.card_number, actor.id)
+        await set_verification_status(request_id, "approved", actor.id, None)
+        await upsert_verified_card(req.user_id, req.username, req.card_number, actor.id)
 
         await context.bot.send_message(
             chat_id=req.user_id,
@@ -1836,7 +2286,7 @@ async def on_verification_decision(update: Update, context: ContextTypes.DEFAULT
         return
 
     if action == "reject_wrong":
-        await asyncio.to_thread(set_verification_status, request_id, "rejected", actor.id, "wrong")
+        await set_verification_status(request_id, "rejected", actor.id, "wrong")
         await context.bot.send_message(
             chat_id=req.user_id,
             text=(
@@ -1852,7 +2302,7 @@ async def on_verification_decision(update: Update, context: ContextTypes.DEFAULT
         return
 
     if action == "reject_incomplete":
-        await asyncio.to_thread(set_verification_status, request_id, "rejected", actor.id, "incomplete")
+        await set_verification_status(request_id, "rejected", actor.id, "incomplete")
         await context.bot.send_message(
             chat_id=req.user_id,
             text=(
@@ -1871,67 +2321,245 @@ async def on_verification_decision(update: Update, context: ContextTypes.DEFAULT
 
 
 REMINDER_MINUTES_BEFORE = int(os.getenv("REMINDER_MINUTES_BEFORE", "30").strip() or "30")
-REMINDER_INTERVAL_SECONDS = int(os.getenv("REMINDER_INTERVAL_SECONDS", "30").strip() or "30")
+# A reminder more than this late (bot was down at its due time) is skipped.
 REMINDER_WINDOW_SECONDS = int(os.getenv("REMINDER_WINDOW_SECONDS", "90").strip() or "90")
+# A reminder no admin received is retried this often until the reservation starts.
+REMINDER_RETRY_SECONDS = 60
+# Safety net: re-scan booked reservations for reminders that have no job.
+REMINDER_RECONCILE_SECONDS = int(os.getenv("REMINDER_RECONCILE_SECONDS", "900").strip() or "900")
 
 
-async def reminder_job(context: ContextTypes.DEFAULT_TYPE) -> None:
-    if not BOT_ADMIN_IDS and OWNER_CHAT_ID is None:
-        return
+def _reminder_job_name(reservation_id: int) -> str:
+    return f"reminder:{reservation_id}"
+
+
+def _schedule_reminder(context: ContextTypes.DEFAULT_TYPE, reservation_id: int, reserved_at_iso: str) -> bool:
+    """One-shot job at reserved_at - REMINDER_MINUTES_BEFORE; False if already scheduled or too late."""
+    job_queue = context.job_queue
+    if job_queue is None or (not BOT_ADMIN_IDS and OWNER_CHAT_ID is None):
+        return False
+    name = _reminder_job_name(reservation_id)
+    if job_queue.get_jobs_by_name(name):
+        return False
+    try:
+        reserved_at = datetime.fromisoformat(reserved_at_iso)
+    except ValueError:
+        return False
+    if reserved_at.tzinfo is None:
+        reserved_at = reserved_at.replace(tzinfo=TZ)
 
     now = datetime.now(TZ)
-    target = now + timedelta(minutes=REMINDER_MINUTES_BEFORE)
-    window_start = target - timedelta(seconds=REMINDER_WINDOW_SECONDS)
-    window_end = target + timedelta(seconds=REMINDER_WINDOW_SECONDS)
+    due = reserved_at - timedelta(minutes=REMINDER_MINUTES_BEFORE)
+    if due < now - timedelta(seconds=REMINDER_WINDOW_SECONDS):
+        return False
+    job_queue.run_once(
+        reservation_reminder_job,
+        when=max((due - now).total_seconds(), 0),
+        data=reservation_id,
+        name=name,
+    )
+    return True
 
-    window_start_iso = window_start.isoformat(timespec="seconds")
-    window_end_iso = window_end.isoformat(timespec="seconds")
 
-    candidates = await asyncio.to_thread(list_reservations_due_for_reminder, window_start_iso, window_end_iso)
-    if not candidates:
+async def reservation_reminder_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    reservation_id = int(context.job.data)
+    c = await get_reminder_candidate(reservation_id)
+    if c is None:
+        # Cancelled since it was scheduled, or already reminded.
         return
 
-    targets = sorted(BOT_ADMIN_IDS) if BOT_ADMIN_IDS else [OWNER_CHAT_ID]
+    now = datetime.now(TZ)
+    claimed_at = now.isoformat(timespec="seconds")
+    if not await mark_reservation_reminded(reservation_id, claimed_at):
+        return
+
+    text = (
+        f"⏰ یادآوری رزرو ({_to_fa_digits(str(REMINDER_MINUTES_BEFORE))} دقیقه مانده)\n\n"
+        f"کد رزرو: {c.reservation_id}\n"
+        f"آیدی عددی: {c.user_id}\n"
+        f"یوزرنیم: {c.username or 'ندارد'}\n"
+        f"تایم رزرو: {_format_reserved_at_for_owner(c.reserved_at)}\n"
+        f"لینک گروه: {c.group_link or 'ندارد'}\n"
+        f"بنر: {'دارد' if c.promo_photo_file_id else 'ندارد'}\n"
+        f"لینک(های) گروه مقصد: {c.destination_links or 'ندارد'}"
+    )
 
-    for c in candidates:
-        full = await asyncio.to_thread(get_reservation_full, int(c.reservation_id))
-        reserved_at = full.reserved_at if full else c.reserved_at
-        reserved_str = _format_reserved_at_for_owner(reserved_at)
-        username = (full.username if full and full.username else None) or (c.username or "ندارد")
-        group_link = full.group_link if full else c.group_link
-        dest_links = full.destination_links if full else None
-        has_banner = bool((full.promo_photo_file_id if full else c.promo_photo_file_id))
-
-        text = (
-            f"⏰ یادآوری رزرو ({_to_fa_digits(str(REMINDER_MINUTES_BEFORE))} دقیقه مانده)\n\n"
-            f"کد رزرو: {c.reservation_id}\n"
-            f"آیدی عددی: {c.user_id}\n"
-            f"یوزرنیم: {username}\n"
-            f"تایم رزرو: {reserved_str}\n"
-            f"لینک گروه: {group_link or 'ندارد'}\n"
-            f"بنر: {'دارد' if has_banner else 'ندارد'}\n"
-            f"لینک(های) گروه مقصد: {dest_links or 'ندارد'}"
+    targets = sorted(BOT_ADMIN_IDS) if BOT_ADMIN_IDS else [OWNER_CHAT_ID]
+    delivered = 0
+    for admin_id in targets:
+        try:
+            await context.bot.send_message(chat_id=admin_id, text=text, disable_web_page_preview=True)
+            delivered += 1
+        except Exception:
+            continue
+    if delivered:
+        return
+
+    # Nobody got it: release the claim so the reminder isn't lost, and retry.
+    await unmark_reservation_reminded(reservation_id, claimed_at)
+    reserved_at = datetime.fromisoformat(c.reserved_at)
+    if reserved_at.tzinfo is None:
+        reserved_at = reserved_at.replace(tzinfo=TZ)
+    if context.job_queue is not None and now + timedelta(seconds=REMINDER_RETRY_SECONDS) < reserved_at:
+        logger.warning("Reminder for reservation %s reached no admin; retrying", reservation_id)
+        context.job_queue.run_once(
+            reservation_reminder_job,
+            when=REMINDER_RETRY_SECONDS,
+            data=reservation_id,
+            name=_reminder_job_name(reservation_id),
         )
+    else:
+        logger.warning("Reminder for reservation %s reached no admin", reservation_id)
 
-        for admin_id in targets:
+
+async def reminder_reconcile_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Schedule reminders missing a job: all of them on startup, then any approval that slipped through."""
+    now = datetime.now(TZ)
+    earliest = now + timedelta(minutes=REMINDER_MINUTES_BEFORE) - timedelta(seconds=REMINDER_WINDOW_SECONDS)
+    candidates = await list_reminder_candidates(earliest)
+    scheduled = sum(1 for c in candidates if _schedule_reminder(context, c.reservation_id, c.reserved_at))
+    if scheduled:
+        logger.info("Scheduled %s reservation reminder(s)", scheduled)
+
+
+# Unpaid holds (no receipt sent) are cancelled after this many minutes.
+PENDING_PAYMENT_TTL_MINUTES = int(os.getenv("PENDING_PAYMENT_TTL_MINUTES", "30").strip() or "30")
+PENDING_SWEEP_SECONDS = int(os.getenv("PENDING_SWEEP_SECONDS", "60").strip() or "60")
+PENDING_SWEEP_BATCH_SIZE = 500
+
+
+async def pending_hold_sweeper_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    cutoff = datetime.utcnow() - timedelta(minutes=PENDING_PAYMENT_TTL_MINUTES)
+    while True:
+        expired = await expire_pending_payment_holds(cutoff, PENDING_SWEEP_BATCH_SIZE)
+        if expired:
+            logger.info("Expired %s unpaid reservation hold(s)", len(expired))
+        for hold in expired:
             try:
-                await context.bot.send_message(chat_id=admin_id, text=text, disable_web_page_preview=True)
+                await context.bot.send_message(
+                    chat_id=hold.user_id,
+                    text=(
+                        f"مهلت پرداخت برای تایم {_format_reserved_at_for_owner(hold.reserved_at)} به پایان رسید "
+                        "و رزرو لغو شد.\nدر صورت تمایل دوباره رزرو کنید: /start"
+                    ),
+                )
             except Exception:
                 continue
+        if len(expired) < PENDING_SWEEP_BATCH_SIZE:
+            return
 
-        await asyncio.to_thread(mark_reservation_reminded, int(c.reservation_id), now.isoformat(timespec="seconds"))
 
+_metrics_runner = None
+_update_recorder: recording.UpdateRecorder | None = None
 
-def main() -> None:
-    if not BOT_TOKEN:
-        raise SystemExit("BOT_TOKEN is missing. Create .env and set BOT_TOKEN.")
 
-    init_db()
+async def _on_startup(app: Application) -> None:
+    global _metrics_runner
+    if metrics.METRICS_PORT and _metrics_runner is None:
+        _metrics_runner = await metrics.start_http_server(metrics.METRICS_LISTEN, int(metrics.METRICS_PORT))
+    # Resume broadcasts interrupted by a restart; pending recipients pick up where they left off.
+    for job in await list_active_broadcast_jobs():
+        if job.status == "running":
+            logger.info("Resuming broadcast job %s", job.id)
+            _start_broadcast_drain(job.id, app.bot)
+
+
+async def _on_stop(app: Application) -> None:
+    await _stop_broadcast_drains()
+    await _flush_seen_users()
+    await _flush_update_recording()
 
-    app = Application.builder().token(BOT_TOKEN).build()
+
+async def _on_shutdown(app: Application) -> None:
+    global _metrics_runner
+    if _metrics_runner is not None:
+        await _metrics_runner.cleanup()
+        _metrics_runner = None
+    await db_async.shutdown()
+
+
+async def _flush_update_recording() -> None:
+    if _update_recorder is None:
+        return
+    try:
+        await asyncio.to_thread(_update_recorder.flush)
+    except Exception:
+        logger.exception("Writing the update recording failed")
+
+
+async def update_recording_flush_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    await _flush_update_recording()
+
+
+def _recording_keep_texts() -> set[str]:
+    """Reply keyboard labels: the free text the handlers route on, safe to record verbatim."""
+    keyboards = (_main_menu_keyboard(), _back_keyboard(), _finish_keyboard(), _reserve_days_keyboard())
+    return {button.text for keyboard in keyboards for row in keyboard.keyboard for button in row}
+
+
+SLOT_CACHE_CHECK_SECONDS = int(os.getenv("SLOT_CACHE_CHECK_SECONDS", "600").strip() or "600")
+
+
+async def slot_cache_maintenance_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Past days are never rendered again; then verify what's left against the DB.
+    evicted = prune_slot_cache(datetime.now(TZ).date())
+    mismatched = await check_slot_cache(True)
+    if mismatched:
+        logger.warning("Slot cache was out of sync for %s (reloaded)", ", ".join(mismatched))
+    elif evicted:
+        logger.info("Slot cache evicted %s past day(s)", evicted)
+    logger.info(
+        "Row caches (hits/misses): %s",
+        ", ".join(f"{name} {s['hits']}/{s['misses']}" for name, s in cache_stats().items()),
+    )
+
+
+def build_application(builder: ApplicationBuilder | None = None) -> Application:
+    """Build the Application with every handler and job registered.
+
+    `builder` defaults to one configured with BOT_TOKEN; pass your own (e.g. with
+    a custom base_url) to run the same bot against a different Bot API.
+    """
+    if builder is None:
+        # Same pool size python-telegram-bot would pick, wrapped to time each Bot API call.
+        builder = Application.builder().token(BOT_TOKEN).request(
+            metrics.TimedRequest(HTTPXRequest(connection_pool_size=256))
+        )
+
+    global _update_recorder
+    if recording.UPDATE_RECORD_PATH:
+        _update_recorder = recording.UpdateRecorder(
+            recording.UPDATE_RECORD_PATH,
+            admin_ids=BOT_ADMIN_IDS,
+            keep_texts=_recording_keep_texts(),
+            keep_words=("روز", "ساعت", "دقیقه"),  # /takhfif duration units
+        )
+        builder = builder.update_queue(recording.RecordingQueue(_update_recorder))
+        logger.info("Recording scrubbed updates to %s", recording.UPDATE_RECORD_PATH)
+
+    if CONCURRENT_UPDATES > 1:
+        builder = builder.concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+    builder = builder.persistence(SQLitePersistence(update_interval=PERSISTENCE_FLUSH_SECONDS))
+    app = builder.post_init(_on_startup).post_stop(_on_stop).post_shutdown(_on_shutdown).build()
 
     if app.job_queue is not None and (BOT_ADMIN_IDS or OWNER_CHAT_ID is not None):
-        app.job_queue.run_repeating(reminder_job, interval=REMINDER_INTERVAL_SECONDS, first=10)
+        # Also runs right after start to rebuild the per-reservation jobs from the DB.
+        app.job_queue.run_repeating(reminder_reconcile_job, interval=REMINDER_RECONCILE_SECONDS, first=1)
+    if app.job_queue is not None:
+        app.job_queue.run_repeating(pending_hold_sweeper_job, interval=PENDING_SWEEP_SECONDS, first=15)
+        app.job_queue.run_repeating(seen_users_flush_job, interval=SEEN_FLUSH_SECONDS, first=SEEN_FLUSH_SECONDS)
+        app.job_queue.run_repeating(
+            slot_cache_maintenance_job, interval=SLOT_CACHE_CHECK_SECONDS, first=SLOT_CACHE_CHECK_SECONDS
+        )
+        if _update_recorder is not None:
+            app.job_queue.run_repeating(
+                update_recording_flush_job,
+                interval=recording.UPDATE_RECORD_FLUSH_SECONDS,
+                first=recording.UPDATE_RECORD_FLUSH_SECONDS,
+            )
+
+    # Track every interacting user (buffered, no per-update DB write); never stops propagation.
+    app.add_handler(TypeHandler(Update, track_user), group=-2)
 
     # Admin captures that must run before other handlers
     app.add_handler(MessageHandler(filters.ALL, on_admin_capture), group=-1)
@@ -1941,17 +2569,24 @@ def main() -> None:
     app.add_handler(CommandHandler("unsubscribe", unsubscribe))
     app.add_handler(CommandHandler("hamgani", hamgani_start))
     app.add_handler(CommandHandler("cancel_hamgani", hamgani_cancel))
+    app.add_handler(CommandHandler("status_hamgani", hamgani_status))
+    app.add_handler(CommandHandler("pause_hamgani", hamgani_pause))
+    app.add_handler(CommandHandler("resume_hamgani", hamgani_resume))
+    app.add_handler(CommandHandler("stop_hamgani", hamgani_stop))
     app.add_handler(CommandHandler("amar", amar))
+    app.add_handler(CommandHandler("perf", perf))
     app.add_handler(CommandHandler("takhfif", takhfif_start))
     app.add_handler(CommandHandler("cancel_takhfif", takhfif_cancel))
     app.add_handler(CallbackQueryHandler(confirm_membership, pattern=f"^{CB_CONFIRM}$"))
     app.add_handler(CallbackQueryHandler(noop, pattern="^noop$"))
+    if MEMBERSHIP_UPDATES_ENABLED and REQUIRED_CHANNEL:
+        app.add_handler(ChatMemberHandler(on_channel_member_update, ChatMemberHandler.CHAT_MEMBER))
 
-    app.add_handler(CallbackQueryHandler(on_slot_click, pattern=f"^{CB_SLOT_PREFIX}"))
-    app.add_handler(CallbackQueryHandler(on_discount_choice, pattern=f"^{CB_DISCOUNT_PREFIX}"))
-    app.add_handler(CallbackQueryHandler(on_verification_decision, pattern=f"^{CB_VERIF_PREFIX}"))
-    app.add_handler(CallbackQueryHandler(on_payment_decision, pattern=f"^{CB_PAYMENT_PREFIX}"))
-    app.add_handler(CallbackQueryHandler(on_destination_choice, pattern=f"^{CB_DEST_PREFIX}"))
+    app.add_handler(CallbackQueryHandler(on_slot_click, pattern=f"^{re.escape(CB_SLOT_PREFIX)}"))
+    app.add_handler(CallbackQueryHandler(on_discount_choice, pattern=f"^{re.escape(CB_DISCOUNT_PREFIX)}"))
+    app.add_handler(CallbackQueryHandler(on_verification_decision, pattern=f"^{re.escape(CB_VERIF_PREFIX)}"))
+    app.add_handler(CallbackQueryHandler(on_payment_decision, pattern=f"^{re.escape(CB_PAYMENT_PREFIX)}"))
+    app.add_handler(CallbackQueryHandler(on_destination_choice, pattern=f"^{re.escape(CB_DEST_PREFIX)}"))
 
     app.add_handler(MessageHandler(filters.Regex(r"^حساب کاربری$"), on_account))
     app.add_handler(MessageHandler(filters.Regex(r"^رزرو تایم$"), reserve_day_menu))
@@ -1970,8 +2605,29 @@ def main() -> None:
     app.add_handler(MessageHandler(filters.PHOTO, on_photo_router))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, on_text_router))
 
+    metrics.instrument_handlers(app)
+    return app
+
+
+def main() -> None:
+    if not BOT_TOKEN:
+        raise SystemExit("BOT_TOKEN is missing. Create .env and set BOT_TOKEN.")
+
+    init_db()
+    app = build_application()
+    allowed_updates = allowed_update_types(app)
+    logger.info("Subscribing to updates: %s", ", ".join(allowed_updates))
+
+    if BOT_MODE == "webhook":
+        from webhook import WebhookConfig, run_webhook
+
+        config = WebhookConfig.from_env()
+        logger.info("Bot started (webhook on %s:%s/%s).", config.listen, config.port, config.url_path)
+        run_webhook(app, config, allowed_updates=allowed_updates)
+        return
+
     logger.info("Bot started.")
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    app.run_polling(allowed_updates=allowed_updates)
 
 
 if __name__ == "__main__":
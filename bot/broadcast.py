@@ -0,0 +1,183 @@
+"""Rate-limited, concurrent delivery of one message to many chats.
+
+Telegram allows roughly 30 messages/second per bot overall. The engine keeps
+a shared token bucket under that limit, runs a bounded number of senders, and
+when Telegram answers RetryAfter it pauses every sender for the requested
+time before retrying. Telegram's per-chat limit (about one message/second
+into the same chat) is not enforced here: a broadcast sends each chat a
+single message.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import timedelta
+from time import monotonic
+from typing import Awaitable, Callable, Iterable
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+logger = logging.getLogger("ryno_sender_bot.broadcast")
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens/second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self._rate = rate
+        self._capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self._capacity
+        self._updated = monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Block all acquirers for `seconds` (used for RetryAfter)."""
+        self._paused_until = max(self._paused_until, monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+@dataclass
+class BroadcastProgress:
+    total: int
+    done: int = 0
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+
+
+def _retry_after_seconds(err: RetryAfter) -> float:
+    value = err.retry_after
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+async def run_broadcast(
+    bot,
+    chat_ids: Iterable[int],
+    total: int,
+    from_chat_id: int,
+    message_id: int,
+    *,
+    on_progress: Callable[[BroadcastProgress], Awaitable[None]] | None = None,
+    on_result: Callable[[int, str], None] | None = None,
+    stop_event: asyncio.Event | None = None,
+    rate_per_second: float = 25.0,
+    concurrency: int = 8,
+    max_retries: int = 3,
+    progress_interval: float = 5.0,
+) -> BroadcastProgress:
+    """copy_message `message_id` to every chat in `chat_ids`.
+
+    `on_progress` is awaited at most every `progress_interval` seconds and
+    once at the end. `on_result(chat_id, outcome)` gets "sent", "failed" or
+    "blocked" (Forbidden: the chat blocked the bot) per chat. Setting
+    `stop_event` stops before the next send; chats not yet attempted get no
+    result.
+
+    RetryAfter is waited out and retried without counting as an attempt.
+    TimedOut and NetworkError are retried up to `max_retries` times with
+    backoff. The message may already have been delivered when they are
+    raised, so such a chat can receive it twice.
+    """
+    progress = BroadcastProgress(total=total)
+    bucket = TokenBucket(rate_per_second)
+    queue: asyncio.Queue[int | None] = asyncio.Queue(maxsize=concurrency * 4)
+    last_report = monotonic()
+    report_lock = asyncio.Lock()
+
+    async def maybe_report() -> None:
+        nonlocal last_report
+        if on_progress is None or monotonic() - last_report < progress_interval:
+            return
+        if report_lock.locked():
+            return
+        async with report_lock:
+            last_report = monotonic()
+            try:
+                await on_progress(progress)
+            except Exception:
+                logger.exception("Broadcast progress callback failed")
+
+    async def deliver(chat_id: int) -> str:
+        backoff = 1.0
+        retries = 0
+        while True:
+            await bucket.acquire()
+            try:
+                await bot.copy_message(chat_id=chat_id, from_chat_id=from_chat_id, message_id=message_id)
+                progress.sent += 1
+                return "sent"
+            except RetryAfter as e:
+                wait = _retry_after_seconds(e)
+                logger.warning("Broadcast hit flood limit, pausing %.1fs", wait)
+                bucket.pause(wait)
+            except Forbidden:
+                progress.blocked += 1
+                return "blocked"
+            except BadRequest:
+                progress.failed += 1
+                return "failed"
+            except (TimedOut, NetworkError):
+                if retries >= max_retries:
+                    progress.failed += 1
+                    return "failed"
+                retries += 1
+                await asyncio.sleep(backoff)
+                backoff *= 2
+            except Exception:
+                logger.exception("Broadcast to %s failed", chat_id)
+                progress.failed += 1
+                return "failed"
+
+    async def worker() -> None:
+        while True:
+            chat_id = await queue.get()
+            try:
+                if chat_id is None:
+                    return
+                if stop_event is not None and stop_event.is_set():
+                    continue
+                outcome = await deliver(chat_id)
+                progress.done += 1
+                if on_result is not None:
+                    on_result(chat_id, outcome)
+                await maybe_report()
+            finally:
+                queue.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+    try:
+        for chat_id in chat_ids:
+            if stop_event is not None and stop_event.is_set():
+                break
+            await queue.put(chat_id)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for w in workers:
+            w.cancel()
+
+    if on_progress is not None:
+        async with report_lock:
+            try:
+                await on_progress(progress)
+            except Exception:
+                logger.exception("Broadcast progress callback failed")
+    return progress
@@ -0,0 +1,157 @@
+"""Behaviour check for broadcast.run_broadcast against the offline Bot API.
+
+Drives run_broadcast with a real telegram.Bot whose requests are answered by
+fake_telegram.FakeBotAPI, which can answer 429 (RetryAfter) every Nth send
+and 403 (Forbidden) for chosen chats. Checks that:
+
+- a flood limit pauses sending for retry_after and the chat is retried,
+  even with max_retries=0 (flood waits do not use up attempts);
+- a chat that blocked the bot is reported as blocked, not failed;
+- setting stop_event stops before the next send;
+- on_progress is called while sending and once at the end.
+
+Exits non-zero if any check fails. Takes a few seconds (each 429 pauses 1s).
+
+    python check_broadcast.py
+"""
+
+import asyncio
+import sys
+import time
+
+from telegram import Bot
+
+from broadcast import BroadcastProgress, run_broadcast
+from fake_telegram import FAKE_TOKEN, FakeBotAPI
+
+CHATS = list(range(1, 21))
+
+
+async def _bot(api: FakeBotAPI) -> Bot:
+    bot = Bot(FAKE_TOKEN, request=api, get_updates_request=FakeBotAPI())
+    await bot.initialize()
+    return bot
+
+
+async def _flood_limit() -> list[str]:
+    api = FakeBotAPI(flood_every=7)
+    results: dict[int, str] = {}
+    t0 = time.perf_counter()
+    progress = await run_broadcast(
+        await _bot(api),
+        CHATS,
+        len(CHATS),
+        1,
+        1,
+        on_result=results.__setitem__,
+        rate_per_second=1000,
+        concurrency=4,
+        max_retries=0,
+    )
+    elapsed = time.perf_counter() - t0
+    problems = []
+    if progress.sent != len(CHATS) or set(results.values()) != {"sent"}:
+        problems.append(f"every chat should be sent after retrying, got {progress} / {set(results.values())}")
+    floods = api.calls["copyMessage"] - len(CHATS)
+    if floods < 2:
+        problems.append(f"expected at least 2 rate-limited sends to be retried, got {floods}")
+    if elapsed < 1.0:
+        problems.append(f"RetryAfter(1) should pause sending for 1s, finished in {elapsed:.2f}s")
+    return problems
+
+
+async def _blocked_chats() -> list[str]:
+    blocked = {3, 7, 11}
+    results: dict[int, str] = {}
+    progress = await run_broadcast(
+        await _bot(FakeBotAPI(blocked_chats=blocked)),
+        CHATS,
+        len(CHATS),
+        1,
+        1,
+        on_result=results.__setitem__,
+        rate_per_second=1000,
+    )
+    problems = []
+    if {c for c, outcome in results.items() if outcome == "blocked"} != blocked:
+        problems.append(f"blocked chats should report 'blocked', got {results}")
+    if (progress.sent, progress.failed, progress.blocked) != (len(CHATS) - len(blocked), 0, len(blocked)):
+        problems.append(f"blocked chats must not count as failed: {progress}")
+    return problems
+
+
+async def _stop_event() -> list[str]:
+    api = FakeBotAPI(latency=0.01)
+    stop = asyncio.Event()
+    results: dict[int, str] = {}
+
+    def on_result(chat_id: int, outcome: str) -> None:
+        results[chat_id] = outcome
+        if len(results) == 5:
+            stop.set()
+
+    progress = await run_broadcast(
+        await _bot(api), CHATS, len(CHATS), 1, 1, on_result=on_result, stop_event=stop, rate_per_second=1000, concurrency=2
+    )
+    problems = []
+    if not 5 <= len(results) < len(CHATS):
+        problems.append(f"stop_event should end the run early, {len(results)} of {len(CHATS)} chats got a result")
+    if api.calls["copyMessage"] != len(results) or progress.done != len(results):
+        problems.append(
+            f"no send may start after stop: {api.calls['copyMessage']} sends, {len(results)} results, done={progress.done}"
+        )
+    return problems
+
+
+async def _progress_callbacks() -> list[str]:
+    reports: list[BroadcastProgress] = []
+
+    async def on_progress(p: BroadcastProgress) -> None:
+        reports.append(BroadcastProgress(p.total, p.done, p.sent, p.failed, p.blocked))
+
+    await run_broadcast(
+        await _bot(FakeBotAPI(latency=0.005)),
+        CHATS,
+        len(CHATS),
+        1,
+        1,
+        on_progress=on_progress,
+        rate_per_second=1000,
+        concurrency=2,
+        progress_interval=0.02,
+    )
+    problems = []
+    if len(reports) < 2 or not any(r.done < len(CHATS) for r in reports):
+        problems.append(f"expected progress while sending, got {[r.done for r in reports]}")
+    if not reports or reports[-1].done != len(CHATS) or reports[-1].sent != len(CHATS):
+        problems.append(f"the last progress report should be final, got {reports[-1:] or None}")
+    if [r.done for r in reports] != sorted(r.done for r in reports):
+        problems.append(f"progress went backwards: {[r.done for r in reports]}")
+    return problems
+
+
+CHECKS = {
+    "flood limit pauses and retries": _flood_limit,
+    "blocked chats": _blocked_chats,
+    "stop_event": _stop_event,
+    "progress callbacks": _progress_callbacks,
+}
+
+
+async def _main() -> int:
+    failures = 0
+    for name, check in CHECKS.items():
+        problems = await check()
+        print(f"{'FAIL' if problems else 'ok  '} {name}")
+        for problem in problems:
+            print(f"       {problem}")
+        failures += bool(problems)
+    if failures:
+        print(f"{failures} broadcast check(s) failed")
+        return 1
+    print("all broadcast checks passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
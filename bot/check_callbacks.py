@@ -0,0 +1,71 @@
+"""Routing check for the CallbackQueryHandlers registered by bot.build_application.
+
+Builds the Application offline (fake_telegram.FakeBotAPI, throwaway SQLite
+file) and matches sample callback data of every button the bot sends against
+each handler's pattern. Every sample must match exactly the handler meant for
+it: an unescaped prefix such as "^slot|" is "slot" OR "", which matches any
+callback and sends an admin's pay|...|approve press to the slot handler.
+
+Exits non-zero if any check fails.
+
+    python check_callbacks.py
+"""
+
+import os
+import sys
+import tempfile
+
+from telegram.ext import Application, CallbackQueryHandler
+
+from fake_telegram import FAKE_TOKEN, FakeBotAPI
+
+
+def _samples(bot) -> dict[str, str]:
+    """Callback data -> name of the handler that must receive it."""
+    return {
+        bot.CB_CONFIRM: "confirm_membership",
+        "noop": "noop",
+        f"{bot.CB_SLOT_PREFIX}2030-01-05|18:30": "on_slot_click",
+        f"{bot.CB_DISCOUNT_PREFIX}12|yes": "on_discount_choice",
+        f"{bot.CB_VERIF_PREFIX}4|reject_wrong": "on_verification_decision",
+        f"{bot.CB_PAYMENT_PREFIX}7|approve": "on_payment_decision",
+        f"{bot.CB_PAYMENT_PREFIX}7|reject": "on_payment_decision",
+        f"{bot.CB_DEST_PREFIX}12|has": "on_destination_choice",
+    }
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DB_PATH"] = os.path.join(tmp, "callbacks.sqlite3")
+        os.environ.setdefault("REQUIRED_CHANNEL", "@check_callbacks")
+        os.environ["UPDATE_RECORD_PATH"] = ""
+        import bot
+
+        app = bot.build_application(
+            Application.builder().token(FAKE_TOKEN).request(FakeBotAPI()).get_updates_request(FakeBotAPI()).updater(None)
+        )
+        handlers = [
+            h
+            for group in app.handlers.values()
+            for h in group
+            if isinstance(h, CallbackQueryHandler) and h.pattern is not None
+        ]
+
+        failures = 0
+        for data, expected in _samples(bot).items():
+            matched = [h.callback.__name__ for h in handlers if h.pattern.match(data)]
+            ok = matched == [expected]
+            print(f"{'ok  ' if ok else 'FAIL'} {data!r} -> {', '.join(matched) or 'no handler'}")
+            if not ok:
+                print(f"       expected only {expected}")
+            failures += not ok
+
+    if failures:
+        print(f"{failures} callback(s) routed wrongly")
+        return 1
+    print("every callback reaches its own handler")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
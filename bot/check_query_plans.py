@@ -0,0 +1,125 @@
+"""EXPLAIN QUERY PLAN regression check for the hot db.py queries.
+
+Runs the hot db functions against a throwaway database, records the SQL they
+actually execute (with parameters bound, via the connection's trace
+callback), and explains each statement. Exits non-zero if any of them scans
+a table or sorts with a temporary b-tree instead of using an index, or if a
+query listed in REQUIRED_PLANS loses the plan it was shaped for.
+
+    python check_query_plans.py           # only report problems
+    python check_query_plans.py -v        # print every plan
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from typing import Any, Callable
+from zoneinfo import ZoneInfo
+
+import db
+
+_SKIP_PREFIXES = ("PRAGMA", "BEGIN", "COMMIT", "ROLLBACK", "CREATE", "DROP", "ANALYZE")
+
+# Plan detail a hot call's statements must show, beyond using an index at all.
+REQUIRED_PLANS = {
+    # Every selected column is in idx_reservations_user_status_reserved_ts.
+    "list_reservations_for_user": "USING COVERING INDEX",
+}
+
+
+def _seed() -> datetime:
+    tz = ZoneInfo("Asia/Tehran")
+    base = datetime(2030, 1, 1, 20, 30, tzinfo=tz)
+    for uid in range(1, 201):
+        db.upsert_user(uid, f"@user{uid}")
+        db.set_user_subscription(uid, uid % 3 != 0)
+    for i in range(200):
+        slot = base + timedelta(minutes=30 * i)
+        if i % 2:
+            db.try_reserve_slot(i + 1, slot)
+        else:
+            db.try_hold_slot_pending_payment(i + 1, slot)
+    return base
+
+
+def _hot_calls(base: datetime) -> dict[str, Callable[[], Any]]:
+    """The queries that run per update / per job tick."""
+    return {
+        "is_slot_reserved": lambda: db.is_slot_reserved(base),
+        "get_slot_owner_user_id": lambda: db.get_slot_owner_user_id(base),
+        "day occupancy load": lambda: (db._slot_cache.clear(), db.get_day_slot_occupancy(base.date())),
+        "list_reservations_for_user": lambda: db.list_reservations_for_user(2),
+        "get_reservation": lambda: db.get_reservation(2),
+        "get_user_profile": lambda: db.get_user_profile(5),
+        "get_verified_card_number": lambda: db.get_verified_card_number(5),
+        "set_reservation_status": lambda: db.set_reservation_status(3, "pending_payment"),
+        "get_reminder_candidate": lambda: db.get_reminder_candidate(2),
+        "list_reminder_candidates": lambda: db.list_reminder_candidates(base),
+        "create_payment_request": lambda: db.create_payment_request(1, 1, None, "6219", None, None, "file"),
+        "approve_payment": lambda: db.approve_payment(
+            db.create_payment_request(3, 3, None, "6219", "off", 10, "file"), 1, base
+        ),
+        "reject_payment": lambda: db.reject_payment(
+            db.create_payment_request(5, 5, None, "6219", None, None, "file"), 1, "reason"
+        ),
+        "expire_pending_payment_holds": lambda: db.expire_pending_payment_holds(datetime(2000, 1, 1)),
+    }
+
+
+def _problems(plan: list[tuple], required: str | None = None) -> list[str]:
+    found = []
+    for row in plan:
+        detail = str(row[3])
+        if detail.startswith("SCAN ") and not detail.startswith("SCAN CONSTANT ROW"):
+            found.append(detail)
+        elif detail.startswith("USE TEMP B-TREE"):
+            found.append(detail)
+    if required and not any(required in str(row[3]) for row in plan):
+        found.append(f"expected {required}")
+    return found
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-v", "--verbose", action="store_true", help="print the plan of every statement")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DB_PATH"] = os.path.join(tmp, "plans.sqlite3")
+        db.init_db()
+        base = _seed()
+
+        con = db._connect()
+        failures = 0
+        for name, call in _hot_calls(base).items():
+            statements: list[str] = []
+            con.set_trace_callback(statements.append)
+            try:
+                call()
+            finally:
+                con.set_trace_callback(None)
+
+            for sql in statements:
+                if sql.lstrip().upper().startswith(_SKIP_PREFIXES):
+                    continue
+                plan = con.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+                problems = _problems(plan, REQUIRED_PLANS.get(name))
+                if problems or args.verbose:
+                    print(f"{'FAIL' if problems else 'ok  '} {name}: {' '.join(sql.split())[:120]}")
+                    for row in plan:
+                        print(f"       {row[3]}")
+                failures += bool(problems)
+
+        db.close_connections()
+
+    if failures:
+        print(f"{failures} hot statement(s) without the expected index")
+        return 1
+    print("all hot queries use indexes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
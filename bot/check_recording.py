@@ -0,0 +1,112 @@
+"""Behaviour check for the personal-data scrubbing in recording.Scrubber.
+
+Scrubs sample message texts and checks that:
+
+- card and phone numbers are masked whether typed in one run or in groups,
+  with Latin or Persian digits;
+- the bot's own button labels, `keep_words`, command words and short
+  numbers in ordinary text (/takhfif durations) are kept;
+- ids become pseudonyms and contacts are dropped.
+
+Exits non-zero if any check fails.
+
+    python check_recording.py
+"""
+
+import sys
+
+from recording import Scrubber
+
+KEEP_TEXTS = ("📅 رزرو نوبت",)
+KEEP_WORDS = ("روز", "ساعت", "دقیقه")
+
+SECRETS = {
+    "card in one run": "6219861812345678",
+    "card in groups": "6219 8618 1234 5678",
+    "card in Persian digits": "۶۲۱۹ ۸۶۱۸ ۱۲۳۴ ۵۶۷۸",
+    "card in sentence": "شماره کارت 6219 8618 1234 5678 هست",
+    "card after command": "/start 6219 8618 1234 5678",
+    "phone in groups": "0912 123 4567",
+    "phone in Persian digits": "۰۹۱۲ ۱۲۳ ۴۵۶۷",
+}
+
+
+def _digits(text: str) -> list[str]:
+    return [ch for ch in text if ch.isdigit()]
+
+
+def _numbers_masked() -> list[str]:
+    scrubber = Scrubber(KEEP_TEXTS, KEEP_WORDS)
+    problems = []
+    for name, text in SECRETS.items():
+        masked = scrubber.text(text)
+        if any(ch != "1" for ch in _digits(masked)):
+            problems.append(f"{name}: digits survived scrubbing, {text!r} -> {masked!r}")
+        if len(masked) != len(text):
+            problems.append(f"{name}: masked text should keep its length, {text!r} -> {masked!r}")
+    return problems
+
+
+def _routing_kept() -> list[str]:
+    scrubber = Scrubber(KEEP_TEXTS, KEEP_WORDS)
+    expected = {
+        "📅 رزرو نوبت": "📅 رزرو نوبت",
+        "/takhfif ABC 3 روز": "/takhfif xxx 3 روز",
+        "/start": "/start",
+        "ساعت 10": "ساعت 10",
+    }
+    return [
+        f"{text!r} should scrub to {want!r}, got {scrubber.text(text)!r}"
+        for text, want in expected.items()
+        if scrubber.text(text) != want
+    ]
+
+
+def _ids_and_contacts() -> list[str]:
+    scrubber = Scrubber()
+    update = {
+        "update_id": 5,
+        "message": {
+            "message_id": 9,
+            "date": 1_700_000_100,
+            "from": {"id": 123456789, "first_name": "Ali", "is_bot": False},
+            "chat": {"id": 123456789, "type": "private"},
+            "contact": {"phone_number": "+989121234567", "first_name": "Ali"},
+        },
+    }
+    scrubbed = scrubber.scrub(update, 1_700_000_000)
+    message = scrubbed["message"]
+    problems = []
+    if message["from"]["id"] == 123456789 or message["from"]["id"] != message["chat"]["id"]:
+        problems.append(f"user and chat ids should map to the same pseudonym, got {message['from']}, {message['chat']}")
+    if "contact" in message:
+        problems.append("contacts should be dropped")
+    if message["date"] != 100:
+        problems.append(f"dates should be relative to the session start, got {message['date']}")
+    return problems
+
+
+CHECKS = {
+    "card and phone numbers masked": _numbers_masked,
+    "routing text kept": _routing_kept,
+    "ids and contacts": _ids_and_contacts,
+}
+
+
+def main() -> int:
+    failures = 0
+    for name, check in CHECKS.items():
+        problems = check()
+        print(f"{'FAIL' if problems else 'ok  '} {name}")
+        for problem in problems:
+            print(f"       {problem}")
+        failures += bool(problems)
+    if failures:
+        print(f"{failures} recording check(s) failed")
+        return 1
+    print("all recording checks passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
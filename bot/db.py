@@ -1,8 +1,14 @@
 import os
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
-from datetime import datetime
-from typing import List
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Hashable, List
+from zoneinfo import ZoneInfo
+
+from migrations import LATEST_VERSION, apply_migrations, schema_version
 
 DEFAULT_DB_PATH = "db.sqlite3"
 
@@ -21,201 +27,345 @@ def _db_path() -> str:
     return DEFAULT_DB_PATH
 
 
-def init_db() -> None:
-    db_path = _db_path()
-    with sqlite3.connect(db_path) as con:
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                first_seen_at TEXT NOT NULL,
-                last_seen_at TEXT NOT NULL,
-                username TEXT,
-                is_subscribed INTEGER NOT NULL DEFAULT 0,
-                subscribed_at TEXT,
-                unsubscribed_at TEXT
-            );
-            """
-        )
+# Size of sqlite3's per-connection prepared statement cache. Connections are
+# long-lived, so every query below is compiled once per worker thread.
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "128").strip() or "128")
 
-        user_cols = {row[1] for row in con.execute("PRAGMA table_info(users)").fetchall()}
-        if "first_seen_at" not in user_cols:
-            con.execute("ALTER TABLE users ADD COLUMN first_seen_at TEXT")
-        if "last_seen_at" not in user_cols:
-            con.execute("ALTER TABLE users ADD COLUMN last_seen_at TEXT")
-        if "username" not in user_cols:
-            con.execute("ALTER TABLE users ADD COLUMN username TEXT")
-        if "is_subscribed" not in user_cols:
-            con.execute("ALTER TABLE users ADD COLUMN is_subscribed INTEGER NOT NULL DEFAULT 0")
-        if "subscribed_at" not in user_cols:
-            con.execute("ALTER TABLE users ADD COLUMN subscribed_at TEXT")
-        if "unsubscribed_at" not in user_cols:
-            con.execute("ALTER TABLE users ADD COLUMN unsubscribed_at TEXT")
-
-        con.execute("CREATE INDEX IF NOT EXISTS idx_users_is_subscribed ON users(is_subscribed);")
-        con.execute("CREATE INDEX IF NOT EXISTS idx_users_last_seen_at ON users(last_seen_at);")
 
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS reservations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                reserved_at TEXT NOT NULL,
-                created_at TEXT NOT NULL,
-                status TEXT NOT NULL DEFAULT 'booked',
-                group_link TEXT,
-                promo_photo_file_id TEXT,
-                reminder_sent_at TEXT,
-                username TEXT,
-                destination_links TEXT
-            );
-            """
-        )
+def _env_choice(name: str, default: str, choices: set[str]) -> str:
+    value = os.getenv(name, "").strip().upper() or default
+    if value not in choices:
+        raise ValueError(f"{name} must be one of {sorted(choices)}, got {value!r}")
+    return value
 
-        # Migrate existing DBs (SQLite has no IF NOT EXISTS for columns)
-        cols = {row[1] for row in con.execute("PRAGMA table_info(reservations)").fetchall()}
-        if "group_link" not in cols:
-            con.execute("ALTER TABLE reservations ADD COLUMN group_link TEXT")
-        if "promo_photo_file_id" not in cols:
-            con.execute("ALTER TABLE reservations ADD COLUMN promo_photo_file_id TEXT")
-        if "reminder_sent_at" not in cols:
-            con.execute("ALTER TABLE reservations ADD COLUMN reminder_sent_at TEXT")
-        if "username" not in cols:
-            con.execute("ALTER TABLE reservations ADD COLUMN username TEXT")
-        if "destination_links" not in cols:
-            con.execute("ALTER TABLE reservations ADD COLUMN destination_links TEXT")
-        # Prevent double-booking the same time slot for active statuses.
-        # Keep the previous index (if exists) but also enforce for pending payments.
-        con.execute(
-            """
-            CREATE UNIQUE INDEX IF NOT EXISTS ux_reservations_reserved_at_active
-            ON reservations(reserved_at)
-            WHERE status IN ('booked', 'pending_payment');
-            """
-        )
-        con.execute(
-            "CREATE INDEX IF NOT EXISTS idx_reservations_user_id ON reservations(user_id);"
-        )
-        con.execute(
-            "CREATE INDEX IF NOT EXISTS idx_reservations_reserved_at ON reservations(reserved_at);"
-        )
 
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS payment_requests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                reservation_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                username TEXT,
-                card_number TEXT NOT NULL,
-                coupon_code TEXT,
-                coupon_percent INTEGER,
-                receipt_photo_file_id TEXT NOT NULL,
-                status TEXT NOT NULL DEFAULT 'pending',
-                created_at TEXT NOT NULL,
-                reviewed_at TEXT,
-                reviewer_id INTEGER,
-                reject_reason TEXT,
-                FOREIGN KEY(reservation_id) REFERENCES reservations(id)
-            );
-            """
-        )
+# Storage profile. journal_mode is persistent and applied once in init_db();
+# the rest are per-connection and applied whenever _connect() opens one.
+DB_JOURNAL_MODE = _env_choice("DB_JOURNAL_MODE", "WAL", {"WAL", "DELETE", "TRUNCATE", "PERSIST", "MEMORY"})
+DB_SYNCHRONOUS = _env_choice("DB_SYNCHRONOUS", "NORMAL", {"OFF", "NORMAL", "FULL", "EXTRA"})
+DB_TEMP_STORE = _env_choice("DB_TEMP_STORE", "MEMORY", {"DEFAULT", "FILE", "MEMORY"})
+# Negative values are KiB (SQLite convention): -16000 is ~16 MB of page cache.
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", "-16000").strip() or "-16000")
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", "67108864").strip() or "67108864")
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000").strip() or "5000")
 
-        pay_cols = {row[1] for row in con.execute("PRAGMA table_info(payment_requests)").fetchall()}
-        if "coupon_code" not in pay_cols:
-            con.execute("ALTER TABLE payment_requests ADD COLUMN coupon_code TEXT")
-        if "coupon_percent" not in pay_cols:
-            con.execute("ALTER TABLE payment_requests ADD COLUMN coupon_percent INTEGER")
-        con.execute(
-            "CREATE INDEX IF NOT EXISTS idx_payment_requests_status ON payment_requests(status);"
-        )
-        con.execute(
-            "CREATE INDEX IF NOT EXISTS idx_payment_requests_reservation_id ON payment_requests(reservation_id);"
-        )
 
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS discount_codes (
-                code TEXT PRIMARY KEY,
-                percent INTEGER NOT NULL,
-                max_uses INTEGER NOT NULL,
-                used_count INTEGER NOT NULL DEFAULT 0,
-                created_at TEXT NOT NULL,
-                created_by INTEGER NOT NULL,
-                expires_at TEXT NOT NULL,
-                is_active INTEGER NOT NULL DEFAULT 1
-            );
-            """
-        )
-        con.execute("CREATE INDEX IF NOT EXISTS idx_discount_codes_expires_at ON discount_codes(expires_at);")
-        con.execute("CREATE INDEX IF NOT EXISTS idx_discount_codes_is_active ON discount_codes(is_active);")
+def _apply_connection_pragmas(con: sqlite3.Connection) -> None:
+    con.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    con.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+    con.execute(f"PRAGMA cache_size = {DB_CACHE_SIZE}")
+    con.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    con.execute(f"PRAGMA temp_store = {DB_TEMP_STORE}")
 
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS verification_requests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                username TEXT,
-                card_number TEXT NOT NULL,
-                photo_file_id TEXT NOT NULL,
-                status TEXT NOT NULL DEFAULT 'pending',
-                created_at TEXT NOT NULL,
-                reviewed_at TEXT,
-                reviewer_id INTEGER,
-                decision_reason TEXT
-            );
-            """
-        )
-        con.execute(
-            "CREATE INDEX IF NOT EXISTS idx_verification_requests_user_id ON verification_requests(user_id);"
-        )
-        con.execute(
-            "CREATE INDEX IF NOT EXISTS idx_verification_requests_status ON verification_requests(status);"
-        )
 
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS verified_cards (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                card_number TEXT NOT NULL,
-                verified_at TEXT NOT NULL,
-                verifier_id INTEGER
-            );
-            """
-        )
+# Timestamps are compared, ordered and indexed as integer UTC epoch seconds
+# (the *_ts columns); the ISO text columns next to them are readable copies.
+# Functions take datetimes and convert here; naive values are taken as UTC,
+# which is how the bot has always produced them.
+def _to_epoch(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
 
 
-def upsert_user(user_id: int, username: str | None) -> None:
+def _from_epoch(ts: int) -> datetime:
+    return datetime.fromtimestamp(ts, timezone.utc)
+
+
+def _utc_now() -> tuple[str, int]:
+    """(naive UTC ISO text, epoch) for "now" columns."""
+    now = datetime.utcnow().replace(microsecond=0)
+    return now.isoformat(), _to_epoch(now)
+
+
+# Calendar days for slot occupancy are local days in the bot's timezone.
+LOCAL_TZ = ZoneInfo(os.getenv("TZ_NAME", "Asia/Tehran").strip() or "Asia/Tehran")
+
+
+_local = threading.local()
+_connections: list[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+# Bumped by close_connections() so threads drop connections closed under them.
+_generation = 0
+
+
+def _connect() -> sqlite3.Connection:
+    """Return the calling thread's long-lived connection.
+
+    The bot reaches this module through db_async's reader and writer threads,
+    so the set of calling threads is small and each keeps one connection.
+    Use it as `with _connect() as con:` - the block is one transaction
+    (commit on success, rollback on error) and the connection stays open.
+    """
     db_path = _db_path()
-    now_iso = datetime.utcnow().isoformat(timespec="seconds")
-    with sqlite3.connect(db_path) as con:
+    con = getattr(_local, "con", None)
+    if con is not None and _local.path == db_path and _local.generation == _generation:
+        return con
+
+    if con is not None:
+        _close_connection(con)
+
+    con = sqlite3.connect(
+        db_path,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        # Only the owning thread uses it; close_connections() may close it from another.
+        check_same_thread=False,
+    )
+    _apply_connection_pragmas(con)
+    _local.con = con
+    _local.path = db_path
+    _local.generation = _generation
+    with _connections_lock:
+        _connections.append(con)
+    return con
+
+
+def _close_connection(con: sqlite3.Connection) -> None:
+    with _connections_lock:
+        if con in _connections:
+            _connections.remove(con)
+    con.close()
+
+
+def close_connections() -> None:
+    """Close every pooled connection (call on shutdown)."""
+    global _generation
+    with _connections_lock:
+        cons = list(_connections)
+        _connections.clear()
+        _generation += 1
+    for con in cons:
+        try:
+            con.close()
+        except sqlite3.Error:
+            pass
+
+
+def init_db() -> None:
+    """Create or upgrade the schema (see migrations.py); a version check when current."""
+    con = _connect()
+    # WAL lets readers run alongside the single writer; it is stored in the DB
+    # file, so setting it once here covers every later connection.
+    con.execute(f"PRAGMA journal_mode = {DB_JOURNAL_MODE}")
+    if schema_version(con) != LATEST_VERSION:
+        apply_migrations(con)
+
+
+# Point reads the bot repeats within one flow (the verified card is checked on
+# every step from slot choice to receipt) are answered from memory. Each cache
+# is invalidated by the db.py functions that write its rows, after their
+# commit; the TTL only bounds what an edit made outside this process can hide.
+ROW_CACHE_TTL_SECONDS = float(os.getenv("ROW_CACHE_TTL_SECONDS", "300").strip() or "300")
+ROW_CACHE_MAX_ENTRIES = int(os.getenv("ROW_CACHE_MAX_ENTRIES", "20000").strip() or "20000")
+
+_MISS = object()
+
+
+class _RowCache:
+    """Thread-safe LRU of point-read results with a TTL and hit/miss counters.
+
+    Loads record the invalidation sequence when they start; store() drops the
+    result if the key was invalidated meanwhile, so a read racing a write
+    never caches the pre-write row.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int, cache_none: bool) -> None:
+        self._ttl = ttl_seconds
+        self._max = max_entries
+        self._cache_none = cache_none
+        self._lock = threading.Lock()
+        self._rows: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._seq = 0
+        self._invalidated: dict[Hashable, int] = {}
+        # Invalidations older than this were forgotten; loads started before it can't store.
+        self._floor = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Any:
+        """The cached value, or _MISS. Counts hits only; misses are counted when loading."""
+        with self._lock:
+            entry = self._rows.get(key)
+            if entry is None:
+                return _MISS
+            if time.monotonic() - entry[0] > self._ttl:
+                del self._rows[key]
+                return _MISS
+            self._rows.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def begin_load(self) -> int:
+        with self._lock:
+            self.misses += 1
+            return self._seq
+
+    def store(self, key: Hashable, token: int, value: Any) -> None:
+        if value is None and not self._cache_none:
+            return
+        with self._lock:
+            if max(self._floor, self._invalidated.get(key, 0)) > token:
+                return
+            self._rows[key] = (time.monotonic(), value)
+            self._rows.move_to_end(key)
+            if len(self._rows) > self._max:
+                self._rows.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._seq += 1
+            self.invalidations += 1
+            self._rows.pop(key, None)
+            if len(self._invalidated) >= self._max:
+                self._invalidated.clear()
+                self._floor = self._seq
+            self._invalidated[key] = self._seq
+
+    def clear(self) -> None:
+        with self._lock:
+            self._seq += 1
+            self._floor = self._seq
+            self._rows.clear()
+            self._invalidated.clear()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "size": len(self._rows),
+            }
+
+
+# Nobody without a verified card ever gets one except through upsert_verified_card,
+# so "no card" is cached too; reservations that don't exist yet are not.
+_card_cache = _RowCache(ROW_CACHE_TTL_SECONDS, ROW_CACHE_MAX_ENTRIES, cache_none=True)
+_profile_cache = _RowCache(ROW_CACHE_TTL_SECONDS, ROW_CACHE_MAX_ENTRIES, cache_none=True)
+_reservation_cache = _RowCache(ROW_CACHE_TTL_SECONDS, ROW_CACHE_MAX_ENTRIES, cache_none=False)
+
+_ROW_CACHES = {"verified_card": _card_cache, "user_profile": _profile_cache, "reservation": _reservation_cache}
+
+
+def _cached(cache: _RowCache, key: Hashable, load: Callable[[], Any]) -> Any:
+    value = cache.get(key)
+    if value is _MISS:
+        token = cache.begin_load()
+        value = load()
+        cache.store(key, token, value)
+    return value
+
+
+def _peek(cache: _RowCache, key: Hashable) -> tuple[bool, Any]:
+    value = cache.get(key)
+    return (False, None) if value is _MISS else (True, value)
+
+
+def cache_stats() -> dict[str, dict[str, int]]:
+    """Hit/miss/invalidation counters and current size of each point-read cache."""
+    return {name: cache.stats() for name, cache in _ROW_CACHES.items()}
+
+
+def clear_caches() -> None:
+    """Forget every cached row and slot (e.g. after pointing DB_PATH elsewhere)."""
+    for cache in _ROW_CACHES.values():
+        cache.clear()
+    _slot_cache.clear()
+
+
+def upsert_user(user_id: int, username: str | None) -> None:
+    now_iso, now_ts = _utc_now()
+    with _connect() as con:
         con.execute(
             """
-            INSERT INTO users(user_id, first_seen_at, last_seen_at, username)
-            VALUES (?, ?, ?, ?)
+            INSERT INTO users(user_id, first_seen_at, last_seen_at, last_seen_ts, username)
+            VALUES (?, ?, ?, ?, ?)
             ON CONFLICT(user_id) DO UPDATE SET
                 last_seen_at = excluded.last_seen_at,
+                last_seen_ts = excluded.last_seen_ts,
                 username = COALESCE(excluded.username, users.username)
             """,
-            (user_id, now_iso, now_iso, username),
+            (user_id, now_iso, now_iso, now_ts, username),
         )
+    _profile_cache.invalidate(user_id)
+
+
+# Write-behind buffer for "user was seen" updates: user_id -> (last_seen_at, last_seen_ts, username)
+SEEN_FLUSH_MAX_ENTRIES = int(os.getenv("SEEN_FLUSH_MAX_ENTRIES", "500").strip() or "500")
+
+_seen_lock = threading.Lock()
+_seen_pending: dict[int, tuple[str, int, str | None]] = {}
+
+
+def record_user_seen(user_id: int, username: str | None) -> bool:
+    """Buffer a last_seen/username bump in memory (no DB access).
+
+    Repeated sightings of the same user coalesce into one row. Returns True once
+    the buffer holds SEEN_FLUSH_MAX_ENTRIES users and should be flushed.
+    """
+    now_iso, now_ts = _utc_now()
+    with _seen_lock:
+        previous = _seen_pending.get(user_id)
+        if username is None and previous is not None:
+            username = previous[2]
+        _seen_pending[user_id] = (now_iso, now_ts, username)
+        return len(_seen_pending) >= SEEN_FLUSH_MAX_ENTRIES
+
+
+def flush_seen_users() -> int:
+    """Write all buffered sightings as one batched upsert. Returns how many users were written."""
+    global _seen_pending
+    with _seen_lock:
+        if not _seen_pending:
+            return 0
+        pending, _seen_pending = _seen_pending, {}
+
+    try:
+        with _connect() as con:
+            con.executemany(
+                """
+                INSERT INTO users(user_id, first_seen_at, last_seen_at, last_seen_ts, username)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    last_seen_at = CASE
+                        WHEN excluded.last_seen_ts >= COALESCE(users.last_seen_ts, 0) THEN excluded.last_seen_at
+                        ELSE users.last_seen_at
+                    END,
+                    last_seen_ts = MAX(COALESCE(users.last_seen_ts, 0), excluded.last_seen_ts),
+                    username = COALESCE(excluded.username, users.username)
+                """,
+                [
+                    (uid, seen_at, seen_at, seen_ts, username)
+                    for uid, (seen_at, seen_ts, username) in pending.items()
+                ],
+            )
+    except Exception:
+        # Put the batch back (newer sightings recorded meanwhile win) so nothing is lost.
+        with _seen_lock:
+            for uid, entry in pending.items():
+                _seen_pending.setdefault(uid, entry)
+        raise
+    for uid in pending:
+        _profile_cache.invalidate(uid)
+    return len(pending)
 
 
 def set_user_subscription(user_id: int, subscribed: bool, username: str | None = None) -> None:
-    db_path = _db_path()
-    now_iso = datetime.utcnow().isoformat(timespec="seconds")
-    with sqlite3.connect(db_path) as con:
+    now_iso, now_ts = _utc_now()
+    with _connect() as con:
         # Ensure user exists
         con.execute(
             """
-            INSERT INTO users(user_id, first_seen_at, last_seen_at, username)
-            VALUES (?, ?, ?, ?)
+            INSERT INTO users(user_id, first_seen_at, last_seen_at, last_seen_ts, username)
+            VALUES (?, ?, ?, ?, ?)
             ON CONFLICT(user_id) DO UPDATE SET
                 last_seen_at = excluded.last_seen_at,
+                last_seen_ts = excluded.last_seen_ts,
                 username = COALESCE(excluded.username, users.username)
             """,
-            (user_id, now_iso, now_iso, username),
+            (user_id, now_iso, now_iso, now_ts, username),
         )
 
         if subscribed:
@@ -226,10 +376,11 @@ def set_user_subscription(user_id: int, subscribed: bool, username: str | None =
                     subscribed_at = ?,
                     unsubscribed_at = NULL,
                     last_seen_at = ?,
+                    last_seen_ts = ?,
                     username = COALESCE(?, username)
                 WHERE user_id = ?
                 """,
-                (now_iso, now_iso, username, user_id),
+                (now_iso, now_iso, now_ts, username, user_id),
             )
         else:
             con.execute(
@@ -238,25 +389,68 @@ def set_user_subscription(user_id: int, subscribed: bool, username: str | None =
                 SET is_subscribed = 0,
                     unsubscribed_at = ?,
                     last_seen_at = ?,
+                    last_seen_ts = ?,
                     username = COALESCE(?, username)
                 WHERE user_id = ?
                 """,
-                (now_iso, now_iso, username, user_id),
+                (now_iso, now_iso, now_ts, username, user_id),
             )
+    _profile_cache.invalidate(user_id)
+
+
+def unsubscribe_users(user_ids: list[int]) -> int:
+    """Unsubscribe many users in one transaction (e.g. chats that blocked the bot). Returns rows changed."""
+    if not user_ids:
+        return 0
+    now_iso = datetime.utcnow().isoformat(timespec="seconds")
+    with _connect() as con:
+        cur = con.executemany(
+            """
+            UPDATE users
+            SET is_subscribed = 0,
+                unsubscribed_at = ?
+            WHERE user_id = ? AND is_subscribed = 1
+            """,
+            [(now_iso, int(uid)) for uid in user_ids],
+        )
+    for uid in user_ids:
+        _profile_cache.invalidate(int(uid))
+    return int(cur.rowcount)
 
 
 def list_subscribed_user_ids(limit: int | None = None) -> list[int]:
-    db_path = _db_path()
     q = "SELECT user_id FROM users WHERE is_subscribed = 1 ORDER BY subscribed_at ASC"
     params: tuple = ()
     if limit is not None:
         q += " LIMIT ?"
         params = (limit,)
-    with sqlite3.connect(db_path) as con:
+    with _connect() as con:
         rows = con.execute(q, params).fetchall()
     return [int(r[0]) for r in rows]
 
 
+@dataclass(frozen=True)
+class UserProfile:
+    user_id: int
+    username: str | None
+    is_subscribed: bool
+
+
+def _load_user_profile(user_id: int) -> UserProfile | None:
+    with _connect() as con:
+        row = con.execute("SELECT user_id, username, is_subscribed FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    return UserProfile(int(row[0]), row[1], bool(row[2])) if row else None
+
+
+def get_user_profile(user_id: int) -> UserProfile | None:
+    return _cached(_profile_cache, user_id, lambda: _load_user_profile(user_id))
+
+
+def peek_user_profile(user_id: int) -> tuple[bool, UserProfile | None]:
+    """(True, profile) if cached, else (False, None); never touches the DB."""
+    return _peek(_profile_cache, user_id)
+
+
 @dataclass(frozen=True)
 class AdminStats:
     total_users: int
@@ -275,162 +469,342 @@ class AdminStats:
     verification_pending: int
     verification_approved: int
     verification_rejected: int
-    last_user_seen_at: str | None
+    last_user_seen_at: datetime | None
 
 
-def get_admin_stats(active_24h_since_iso: str, active_7d_since_iso: str) -> AdminStats:
-    db_path = _db_path()
-    with sqlite3.connect(db_path) as con:
-        total_users = int(con.execute("SELECT COUNT(*) FROM users").fetchone()[0])
-        subscribed_users = int(con.execute("SELECT COUNT(*) FROM users WHERE is_subscribed = 1").fetchone()[0])
-        active_24h_users = int(
-            con.execute(
-                "SELECT COUNT(*) FROM users WHERE last_seen_at >= ?",
-                (active_24h_since_iso,),
-            ).fetchone()[0]
-        )
-        active_7d_users = int(
-            con.execute(
-                "SELECT COUNT(*) FROM users WHERE last_seen_at >= ?",
-                (active_7d_since_iso,),
-            ).fetchone()[0]
-        )
+# /amar may be pressed repeatedly; within this window the previous snapshot is reused.
+ADMIN_STATS_TTL_SECONDS = float(os.getenv("ADMIN_STATS_TTL_SECONDS", "30").strip() or "30")
 
-        last_seen_row = con.execute("SELECT MAX(last_seen_at) FROM users").fetchone()
-        last_user_seen_at = str(last_seen_row[0]) if last_seen_row and last_seen_row[0] else None
+_admin_stats_lock = threading.Lock()
+_admin_stats_snapshot: tuple[float, "AdminStats"] | None = None
 
-        reservations_total = int(con.execute("SELECT COUNT(*) FROM reservations").fetchone()[0])
-        reservations_booked = int(con.execute("SELECT COUNT(*) FROM reservations WHERE status = 'booked'").fetchone()[0])
-        reservations_pending_payment = int(
-            con.execute("SELECT COUNT(*) FROM reservations WHERE status = 'pending_payment'").fetchone()[0]
-        )
-        reservations_cancelled = int(
-            con.execute("SELECT COUNT(*) FROM reservations WHERE status = 'cancelled'").fetchone()[0]
-        )
 
-        payment_total = int(con.execute("SELECT COUNT(*) FROM payment_requests").fetchone()[0])
-        payment_pending = int(con.execute("SELECT COUNT(*) FROM payment_requests WHERE status = 'pending'").fetchone()[0])
-        payment_approved = int(
-            con.execute("SELECT COUNT(*) FROM payment_requests WHERE status = 'approved'").fetchone()[0]
-        )
-        payment_rejected = int(
-            con.execute("SELECT COUNT(*) FROM payment_requests WHERE status = 'rejected'").fetchone()[0]
-        )
+def _status_counts(con: sqlite3.Connection, table: str) -> dict[str, int]:
+    return {str(status): int(n) for status, n in con.execute(f"SELECT status, COUNT(*) FROM {table} GROUP BY status")}
 
-        verification_total = int(con.execute("SELECT COUNT(*) FROM verification_requests").fetchone()[0])
-        verification_pending = int(
-            con.execute("SELECT COUNT(*) FROM verification_requests WHERE status = 'pending'").fetchone()[0]
-        )
-        verification_approved = int(
-            con.execute("SELECT COUNT(*) FROM verification_requests WHERE status = 'approved'").fetchone()[0]
-        )
-        verification_rejected = int(
-            con.execute("SELECT COUNT(*) FROM verification_requests WHERE status = 'rejected'").fetchone()[0]
-        )
 
-    return AdminStats(
-        total_users=total_users,
-        subscribed_users=subscribed_users,
-        active_24h_users=active_24h_users,
-        active_7d_users=active_7d_users,
-        reservations_total=reservations_total,
-        reservations_booked=reservations_booked,
-        reservations_pending_payment=reservations_pending_payment,
-        reservations_cancelled=reservations_cancelled,
-        payment_total=payment_total,
-        payment_pending=payment_pending,
-        payment_approved=payment_approved,
-        payment_rejected=payment_rejected,
-        verification_total=verification_total,
-        verification_pending=verification_pending,
-        verification_approved=verification_approved,
-        verification_rejected=verification_rejected,
-        last_user_seen_at=last_user_seen_at,
+def get_admin_stats(active_24h_since: datetime, active_7d_since: datetime, use_cache: bool = True) -> AdminStats:
+    """Dashboard counters in four aggregate queries (one pass per table).
+
+    A snapshot younger than ADMIN_STATS_TTL_SECONDS is returned as-is, even if
+    the `since` bounds moved by a few seconds in the meantime.
+    """
+    global _admin_stats_snapshot
+    if use_cache:
+        with _admin_stats_lock:
+            snapshot = _admin_stats_snapshot
+        if snapshot is not None and time.monotonic() - snapshot[0] < ADMIN_STATS_TTL_SECONDS:
+            return snapshot[1]
+
+    with _connect() as con:
+        users_row = con.execute(
+            """
+            SELECT COUNT(*),
+                   COALESCE(SUM(is_subscribed = 1), 0),
+                   COALESCE(SUM(last_seen_ts >= ?), 0),
+                   COALESCE(SUM(last_seen_ts >= ?), 0),
+                   MAX(last_seen_ts)
+            FROM users
+            """,
+            (_to_epoch(active_24h_since), _to_epoch(active_7d_since)),
+        ).fetchone()
+        reservations = _status_counts(con, "reservations")
+        payments = _status_counts(con, "payment_requests")
+        verifications = _status_counts(con, "verification_requests")
+
+    stats = AdminStats(
+        total_users=int(users_row[0]),
+        subscribed_users=int(users_row[1]),
+        active_24h_users=int(users_row[2]),
+        active_7d_users=int(users_row[3]),
+        reservations_total=sum(reservations.values()),
+        reservations_booked=reservations.get("booked", 0),
+        reservations_pending_payment=reservations.get("pending_payment", 0),
+        reservations_cancelled=reservations.get("cancelled", 0),
+        payment_total=sum(payments.values()),
+        payment_pending=payments.get("pending", 0),
+        payment_approved=payments.get("approved", 0),
+        payment_rejected=payments.get("rejected", 0),
+        verification_total=sum(verifications.values()),
+        verification_pending=verifications.get("pending", 0),
+        verification_approved=verifications.get("approved", 0),
+        verification_rejected=verifications.get("rejected", 0),
+        last_user_seen_at=_from_epoch(int(users_row[4])) if users_row[4] is not None else None,
     )
+    with _admin_stats_lock:
+        _admin_stats_snapshot = (time.monotonic(), stats)
+    return stats
 
 
 def add_reservation(user_id: int, reserved_at: datetime) -> int:
-    db_path = _db_path()
-    created_at = datetime.utcnow().isoformat(timespec="seconds")
-    with sqlite3.connect(db_path) as con:
+    created_at, created_ts = _utc_now()
+    reserved_iso = reserved_at.isoformat(timespec="seconds")
+    with _connect() as con:
         cur = con.execute(
             """
-            INSERT INTO reservations(user_id, reserved_at, created_at, status)
-            VALUES (?, ?, ?, 'booked')
+            INSERT INTO reservations(user_id, reserved_at, reserved_ts, created_at, created_ts, status)
+            VALUES (?, ?, ?, ?, ?, 'booked')
             """,
-            (user_id, reserved_at.isoformat(timespec="seconds"), created_at),
+            (user_id, reserved_iso, _to_epoch(reserved_at), created_at, created_ts),
         )
-        return int(cur.lastrowid)
+    _slot_cache.set_slot(reserved_iso, user_id)
+    return int(cur.lastrowid)
 
 
 def is_slot_reserved(reserved_at: datetime) -> bool:
-    db_path = _db_path()
-    reserved_iso = reserved_at.isoformat(timespec="seconds")
-    with sqlite3.connect(db_path) as con:
+    with _connect() as con:
         row = con.execute(
             """
             SELECT 1
             FROM reservations
-            WHERE reserved_at = ? AND status IN ('booked', 'pending_payment')
+            WHERE reserved_ts = ? AND status IN ('booked', 'pending_payment')
             LIMIT 1
             """,
-            (reserved_iso,),
+            (_to_epoch(reserved_at),),
         ).fetchone()
     return row is not None
 
 
 def get_slot_owner_user_id(reserved_at: datetime) -> int | None:
-    db_path = _db_path()
-    reserved_iso = reserved_at.isoformat(timespec="seconds")
-    with sqlite3.connect(db_path) as con:
-        row = con.execute(
+    with _connect() as con:
+        return _active_slot_owner(con, _to_epoch(reserved_at))
+
+
+# Seconds a cached day stays valid without a write-through update. Guards
+# against writes made by another process sharing the same DB file.
+SLOT_CACHE_TTL_SECONDS = int(os.getenv("SLOT_CACHE_TTL_SECONDS", "300").strip() or "300")
+
+
+class _SlotOccupancyCache:
+    """In-process index of active reservations keyed by local date ("YYYY-MM-DD").
+
+    Days load lazily from the DB and are kept current by the reservation write
+    functions below. A per-day write sequence stops a load that raced with a
+    write from caching the pre-write snapshot.
+    """
+
+    def __init__(self, ttl_seconds: int) -> None:
+        self._ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._days: dict[str, tuple[float, dict[str, int]]] = {}
+        self._seq: dict[str, int] = {}
+
+    def get(self, day_key: str) -> dict[str, int] | None:
+        with self._lock:
+            entry = self._days.get(day_key)
+            if entry is None:
+                return None
+            loaded_at, occupancy = entry
+            if time.monotonic() - loaded_at > self._ttl:
+                del self._days[day_key]
+                return None
+            return dict(occupancy)
+
+    def write_seq(self, day_key: str) -> int:
+        with self._lock:
+            return self._seq.get(day_key, 0)
+
+    def store(self, day_key: str, seq: int, occupancy: dict[str, int]) -> None:
+        with self._lock:
+            if self._seq.get(day_key, 0) == seq:
+                self._days[day_key] = (time.monotonic(), dict(occupancy))
+
+    def set_slot(self, reserved_at_iso: str, owner_user_id: int | None) -> None:
+        day_key = reserved_at_iso[:10]
+        with self._lock:
+            self._seq[day_key] = self._seq.get(day_key, 0) + 1
+            entry = self._days.get(day_key)
+            if entry is None:
+                return
+            occupancy = entry[1]
+            if owner_user_id is None:
+                occupancy.pop(reserved_at_iso, None)
+            else:
+                occupancy[reserved_at_iso] = owner_user_id
+
+    def invalidate(self, day_key: str) -> None:
+        with self._lock:
+            self._seq[day_key] = self._seq.get(day_key, 0) + 1
+            self._days.pop(day_key, None)
+
+    def evict_before(self, day_key: str) -> int:
+        with self._lock:
+            stale = [k for k in self._days if k < day_key]
+            for k in stale:
+                del self._days[k]
+            for k in [k for k in self._seq if k < day_key]:
+                del self._seq[k]
+            return len(stale)
+
+    def cached_days(self) -> list[str]:
+        with self._lock:
+            return sorted(self._days)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._days.clear()
+            self._seq.clear()
+
+
+_slot_cache = _SlotOccupancyCache(SLOT_CACHE_TTL_SECONDS)
+
+
+def _load_day_slot_occupancy(day_key: str) -> dict[str, int]:
+    day_start = datetime.combine(date.fromisoformat(day_key), datetime.min.time(), tzinfo=LOCAL_TZ)
+    day_end = day_start + timedelta(days=1)
+    with _connect() as con:
+        rows = con.execute(
             """
-            SELECT user_id
+            SELECT reserved_at, user_id
             FROM reservations
-            WHERE reserved_at = ? AND status IN ('booked', 'pending_payment')
-            LIMIT 1
+            WHERE reserved_ts >= ? AND reserved_ts < ?
+              AND status IN ('booked', 'pending_payment')
             """,
-            (reserved_iso,),
-        ).fetchone()
+            (_to_epoch(day_start), _to_epoch(day_end)),
+        ).fetchall()
+    return {str(r[0]): int(r[1]) for r in rows}
+
+
+def _active_slot_owner(con: sqlite3.Connection, reserved_ts: int) -> int | None:
+    row = con.execute(
+        """
+        SELECT user_id
+        FROM reservations
+        WHERE reserved_ts = ? AND status IN ('booked', 'pending_payment')
+        LIMIT 1
+        """,
+        (reserved_ts,),
+    ).fetchone()
     return int(row[0]) if row else None
 
 
+def peek_day_slot_occupancy(day: date) -> dict[str, int] | None:
+    """Cached occupancy for `day` without touching the DB, or None on a cache miss."""
+    return _slot_cache.get(day.isoformat())
+
+
+def get_day_slot_occupancy(day: date) -> dict[str, int]:
+    """Active (booked/pending_payment) reservations on `day` as {reserved_at_iso: user_id}.
+
+    Served from the in-process slot cache; a miss is one index range search
+    over the local day's reserved_ts.
+    """
+    day_key = day.isoformat()
+    cached = _slot_cache.get(day_key)
+    if cached is not None:
+        return cached
+    seq = _slot_cache.write_seq(day_key)
+    occupancy = _load_day_slot_occupancy(day_key)
+    _slot_cache.store(day_key, seq, occupancy)
+    return occupancy
+
+
+def prune_slot_cache(today: date) -> int:
+    """Drop cached days before `today`. Returns how many were evicted."""
+    return _slot_cache.evict_before(today.isoformat())
+
+
+def check_slot_cache(repair: bool = True) -> list[str]:
+    """Compare every cached day with the DB. Returns the days that differed.
+
+    With repair=True, mismatching days are dropped so the next read reloads them.
+    """
+    mismatched = []
+    for day_key in _slot_cache.cached_days():
+        seq = _slot_cache.write_seq(day_key)
+        cached = _slot_cache.get(day_key)
+        if cached is None:
+            continue
+        actual = _load_day_slot_occupancy(day_key)
+        # A write landed while we were reading; the cache is already being kept current.
+        if _slot_cache.write_seq(day_key) != seq:
+            continue
+        if cached != actual:
+            mismatched.append(day_key)
+            if repair:
+                _slot_cache.invalidate(day_key)
+    return mismatched
+
+
 def try_reserve_slot(user_id: int, reserved_at: datetime) -> bool:
     """Returns True if reservation was created, False if slot already reserved."""
-    db_path = _db_path()
-    created_at = datetime.utcnow().isoformat(timespec="seconds")
+    created_at, created_ts = _utc_now()
+    reserved_iso = reserved_at.isoformat(timespec="seconds")
     try:
-        with sqlite3.connect(db_path) as con:
+        with _connect() as con:
             con.execute(
                 """
-                INSERT INTO reservations(user_id, reserved_at, created_at, status)
-                VALUES (?, ?, ?, 'booked')
+                INSERT INTO reservations(user_id, reserved_at, reserved_ts, created_at, created_ts, status)
+                VALUES (?, ?, ?, ?, ?, 'booked')
                 """,
-                (user_id, reserved_at.isoformat(timespec="seconds"), created_at),
+                (user_id, reserved_iso, _to_epoch(reserved_at), created_at, created_ts),
             )
+        _slot_cache.set_slot(reserved_iso, user_id)
         return True
     except sqlite3.IntegrityError:
+        # Someone else holds it; make sure the cache doesn't still show it free.
+        _slot_cache.invalidate(reserved_iso[:10])
         return False
 
 
 def try_hold_slot_pending_payment(user_id: int, reserved_at: datetime) -> int | None:
     """Creates a pending_payment reservation. Returns reservation id or None if slot already taken."""
-    db_path = _db_path()
-    created_at = datetime.utcnow().isoformat(timespec="seconds")
+    created_at, created_ts = _utc_now()
+    reserved_iso = reserved_at.isoformat(timespec="seconds")
     try:
-        with sqlite3.connect(db_path) as con:
+        with _connect() as con:
             cur = con.execute(
                 """
-                INSERT INTO reservations(user_id, reserved_at, created_at, status)
-                VALUES (?, ?, ?, 'pending_payment')
+                INSERT INTO reservations(user_id, reserved_at, reserved_ts, created_at, created_ts, status)
+                VALUES (?, ?, ?, ?, ?, 'pending_payment')
                 """,
-                (user_id, reserved_at.isoformat(timespec="seconds"), created_at),
+                (user_id, reserved_iso, _to_epoch(reserved_at), created_at, created_ts),
             )
-            return int(cur.lastrowid)
+            reservation_id = int(cur.lastrowid)
+        _slot_cache.set_slot(reserved_iso, user_id)
+        return reservation_id
     except sqlite3.IntegrityError:
+        _slot_cache.invalidate(reserved_iso[:10])
         return None
 
 
+@dataclass(frozen=True)
+class ExpiredHold:
+    reservation_id: int
+    user_id: int
+    reserved_at: str
+
+
+def expire_pending_payment_holds(created_before: datetime, limit: int = 500) -> list[ExpiredHold]:
+    """Cancel up to `limit` pending_payment holds created before `created_before`
+    that never got a payment request, and free their slots.
+    """
+    with _connect() as con:
+        rows = con.execute(
+            """
+            UPDATE reservations
+            SET status = 'cancelled'
+            WHERE id IN (
+                SELECT r.id
+                FROM reservations r
+                WHERE r.status = 'pending_payment'
+                  AND r.created_ts < ?
+                  AND NOT EXISTS (SELECT 1 FROM payment_requests p WHERE p.reservation_id = r.id)
+                ORDER BY r.created_ts
+                LIMIT ?
+            )
+            RETURNING id, user_id, reserved_at
+            """,
+            (_to_epoch(created_before), limit),
+        ).fetchall()
+    expired = [ExpiredHold(int(r[0]), int(r[1]), str(r[2])) for r in rows]
+    # The unique active-slot index allowed only this hold on each slot.
+    for hold in expired:
+        _slot_cache.set_slot(hold.reserved_at, None)
+        _reservation_cache.invalidate(hold.reservation_id)
+    return expired
+
+
 @dataclass(frozen=True)
 class Reservation:
     id: int
@@ -462,17 +836,17 @@ class ReminderCandidate:
     group_link: str | None
     promo_photo_file_id: str | None
     username: str | None
+    destination_links: str | None
 
 
 def list_reservations_for_user(user_id: int, limit: int = 20) -> List[Reservation]:
-    db_path = _db_path()
-    with sqlite3.connect(db_path) as con:
+    with _connect() as con:
         rows = con.execute(
             """
             SELECT id, user_id, reserved_at, created_at, status
             FROM reservations
             WHERE user_id = ? AND status = 'booked'
-            ORDER BY reserved_at ASC
+            ORDER BY reserved_ts ASC
             LIMIT ?
             """,
             (user_id, limit),
@@ -481,23 +855,32 @@ def list_reservations_for_user(user_id: int, limit: int = 20) -> List[Reservatio
     return [Reservation(*row) for row in rows]
 
 
+def _short_reservation(full: ReservationFull | None) -> Reservation | None:
+    if full is None:
+        return None
+    return Reservation(full.id, full.user_id, full.reserved_at, full.created_at, full.status)
+
+
 def get_reservation(reservation_id: int) -> Reservation | None:
-    db_path = _db_path()
-    with sqlite3.connect(db_path) as con:
-        row = con.execute(
-            """
-            SELECT id, user_id, reserved_at, created_at, status
-            FROM reservations
-            WHERE id = ?
-            """,
-            (reservation_id,),
-        ).fetchone()
-    return Reservation(*row) if row else None
+    # Same row as get_reservation_full, so both share one cache entry.
+    return _short_reservation(get_reservation_full(reservation_id))
+
+
+def peek_reservation(reservation_id: int) -> tuple[bool, Reservation | None]:
+    hit, full = _peek(_reservation_cache, reservation_id)
+    return hit, _short_reservation(full)
 
 
 def get_reservation_full(reservation_id: int) -> ReservationFull | None:
-    db_path = _db_path()
-    with sqlite3.connect(db_path) as con:
+    return _cached(_reservation_cache, reservation_id, lambda: _load_reservation_full(reservation_id))
+
+
+def peek_reservation_full(reservation_id: int) -> tuple[bool, ReservationFull | None]:
+    return _peek(_reservation_cache, reservation_id)
+
+
+def _load_reservation_full(reservation_id: int) -> ReservationFull | None:
+    with _connect() as con:
         row = con.execute(
             """
             SELECT id, user_id, reserved_at, created_at, status,
@@ -510,13 +893,30 @@ def get_reservation_full(reservation_id: int) -> ReservationFull | None:
     return ReservationFull(*row) if row else None
 
 
+def _set_reservation_status_in(
+    con: sqlite3.Connection, reservation_id: int, status: str
+) -> tuple[str, int | None] | None:
+    """set_reservation_status inside an open transaction; returns (reserved_at, slot owner) for the cache."""
+    rows = con.execute(
+        "UPDATE reservations SET status = ? WHERE id = ? RETURNING reserved_at, reserved_ts",
+        (status, reservation_id),
+    ).fetchall()
+    if not rows:
+        return None
+    return str(rows[0][0]), _active_slot_owner(con, int(rows[0][1]))
+
+
+def _after_reservation_status(reservation_id: int, slot: tuple[str, int | None] | None) -> None:
+    # Write-through after commit so a concurrent cache load can't keep the old state.
+    if slot is not None:
+        _slot_cache.set_slot(*slot)
+    _reservation_cache.invalidate(reservation_id)
+
+
 def set_reservation_status(reservation_id: int, status: str) -> None:
-    db_path = _db_path()
-    with sqlite3.connect(db_path) as con:
-        con.execute(
-            "UPDATE reservations SET status = ? WHERE id = ?",
-            (status, reservation_id),
-        )
+    with _connect() as con:
+        slot = _set_reservation_status_in(con, reservation_id, status)
+    _after_reservation_status(reservation_id, slot)
 
 
 def update_reservation_promo(
@@ -525,8 +925,7 @@ def update_reservation_promo(
     group_link: str | None,
     promo_photo_file_id: str | None,
 ) -> None:
-    db_path = _db_path()
-    with sqlite3.connect(db_path) as con:
+    with _connect() as con:
         con.execute(
             """
             UPDATE reservations
@@ -537,43 +936,65 @@ def update_reservation_promo(
             """,
             (username, group_link, promo_photo_file_id, reservation_id),
         )
+    _reservation_cache.invalidate(reservation_id)
 
 
 def update_reservation_destination_links(reservation_id: int, destination_links: str | None) -> None:
-    db_path = _db_path()
-    with sqlite3.connect(db_path) as con:
+    with _connect() as con:
         con.execute(
             "UPDATE reservations SET destination_links = ? WHERE id = ?",
             (destination_links, reservation_id),
         )
+    _reservation_cache.invalidate(reservation_id)
 
 
-def mark_reservation_reminded(reservation_id: int, reminded_at_iso: str) -> None:
-    db_path = _db_path()
-    with sqlite3.connect(db_path) as con:
-        con.execute(
-            "UPDATE reservations SET reminder_sent_at = ? WHERE id = ?",
+def mark_reservation_reminded(reservation_id: int, reminded_at_iso: str) -> bool:
+    """Claim the reminder; False if it was already sent."""
+    with _connect() as con:
+        cur = con.execute(
+            "UPDATE reservations SET reminder_sent_at = ? WHERE id = ? AND reminder_sent_at IS NULL",
             (reminded_at_iso, reservation_id),
         )
+    _reservation_cache.invalidate(reservation_id)
+    return cur.rowcount > 0
 
 
-def list_reservations_due_for_reminder(window_start_iso: str, window_end_iso: str) -> list[ReminderCandidate]:
-    """Booked reservations in [window_start, window_end] with no reminder yet."""
-    db_path = _db_path()
-    with sqlite3.connect(db_path) as con:
+def unmark_reservation_reminded(reservation_id: int, reminded_at_iso: str) -> bool:
+    """Release a reminder claim made with `reminded_at_iso` (it could not be delivered)."""
+    with _connect() as con:
+        cur = con.execute(
+            "UPDATE reservations SET reminder_sent_at = NULL WHERE id = ? AND reminder_sent_at = ?",
+            (reservation_id, reminded_at_iso),
+        )
+    _reservation_cache.invalidate(reservation_id)
+    return cur.rowcount > 0
+
+
+# Everything a reminder message needs, joined in one row.
+_REMINDER_CANDIDATE_SELECT = """
+    SELECT r.id, r.user_id, r.reserved_at, r.group_link, r.promo_photo_file_id,
+           COALESCE(r.username, u.username), r.destination_links
+    FROM reservations r
+    LEFT JOIN users u ON u.user_id = r.user_id
+    WHERE r.status = 'booked'
+      AND r.reminder_sent_at IS NULL
+"""
+
+
+def get_reminder_candidate(reservation_id: int) -> ReminderCandidate | None:
+    """The reservation if it is booked and not yet reminded, else None."""
+    with _connect() as con:
+        row = con.execute(_REMINDER_CANDIDATE_SELECT + " AND r.id = ?", (reservation_id,)).fetchone()
+    return ReminderCandidate(*row) if row else None
+
+
+def list_reminder_candidates(reserved_from: datetime) -> list[ReminderCandidate]:
+    """Booked, not yet reminded reservations at or after `reserved_from`."""
+    with _connect() as con:
         rows = con.execute(
-            """
-            SELECT id, user_id, reserved_at, group_link, promo_photo_file_id, username
-            FROM reservations
-            WHERE status = 'booked'
-              AND reminder_sent_at IS NULL
-              AND reserved_at >= ?
-              AND reserved_at <= ?
-            ORDER BY reserved_at ASC
-            """,
-            (window_start_iso, window_end_iso),
+            _REMINDER_CANDIDATE_SELECT + " AND r.reserved_ts >= ? ORDER BY r.reserved_ts ASC",
+            (_to_epoch(reserved_from),),
         ).fetchall()
-
     return [ReminderCandidate(*row) for row in rows]
 
 
@@ -602,32 +1023,48 @@ def create_payment_request(
     coupon_code: str | None,
     coupon_percent: int | None,
     receipt_photo_file_id: str,
-) -> int:
-    db_path = _db_path()
+) -> int | None:
+    """Returns the payment id, or None if the reservation is no longer held (e.g. the hold expired)."""
     created_at = datetime.utcnow().isoformat(timespec="seconds")
-    with sqlite3.connect(db_path) as con:
+    with _connect() as con:
+        # Conditional insert: atomic with respect to expire_pending_payment_holds().
         cur = con.execute(
             """
             INSERT INTO payment_requests(
                 reservation_id, user_id, username, card_number, coupon_code, coupon_percent, receipt_photo_file_id, status, created_at
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?, 'pending', ?)
+            SELECT ?, ?, ?, ?, ?, ?, ?, 'pending', ?
+            WHERE EXISTS (
+                SELECT 1 FROM reservations WHERE id = ? AND status = 'pending_payment'
+            )
             """,
-            (reservation_id, user_id, username, card_number, coupon_code, coupon_percent, receipt_photo_file_id, created_at),
+            (
+                reservation_id,
+                user_id,
+                username,
+                card_number,
+                coupon_code,
+                coupon_percent,
+                receipt_photo_file_id,
+                created_at,
+                reservation_id,
+            ),
         )
+        if cur.rowcount == 0:
+            return None
         return int(cur.lastrowid)
 
 
+_PAYMENT_COLUMNS = """
+    id, reservation_id, user_id, username, card_number, coupon_code, coupon_percent, receipt_photo_file_id,
+    status, created_at, reviewed_at, reviewer_id, reject_reason
+"""
+
+
 def get_payment_request(payment_id: int) -> PaymentRequest | None:
-    db_path = _db_path()
-    with sqlite3.connect(db_path) as con:
+    with _connect() as con:
         row = con.execute(
-            """
-            SELECT id, reservation_id, user_id, username, card_number, coupon_code, coupon_percent, receipt_photo_file_id,
-                   status, created_at, reviewed_at, reviewer_id, reject_reason
-            FROM payment_requests
-            WHERE id = ?
-            """,
+            f"SELECT {_PAYMENT_COLUMNS} FROM payment_requests WHERE id = ?",
             (payment_id,),
         ).fetchone()
     return PaymentRequest(*row) if row else None
@@ -643,6 +1080,7 @@ class DiscountCode:
     created_by: int
     expires_at: str
     is_active: int
+    expires_ts: int | None
 
 
 def normalize_discount_code(code: str) -> str:
@@ -653,30 +1091,32 @@ def create_discount_code(
     code: str,
     percent: int,
     max_uses: int,
-    expires_at_iso: str,
+    expires_at: datetime,
     created_by: int,
 ) -> None:
     """Create a new discount code. Raises sqlite3.IntegrityError if code already exists."""
-    db_path = _db_path()
-    now_iso = datetime.utcnow().isoformat(timespec="seconds")
+    now_iso, _ = _utc_now()
+    expires_ts = _to_epoch(expires_at)
+    expires_iso = _from_epoch(expires_ts).replace(tzinfo=None).isoformat()
     norm = normalize_discount_code(code)
-    with sqlite3.connect(db_path) as con:
+    with _connect() as con:
         con.execute(
             """
-            INSERT INTO discount_codes(code, percent, max_uses, used_count, created_at, created_by, expires_at, is_active)
-            VALUES (?, ?, ?, 0, ?, ?, ?, 1)
+            INSERT INTO discount_codes(
+                code, percent, max_uses, used_count, created_at, created_by, expires_at, expires_ts, is_active
+            )
+            VALUES (?, ?, ?, 0, ?, ?, ?, ?, 1)
             """,
-            (norm, int(percent), int(max_uses), now_iso, int(created_by), expires_at_iso),
+            (norm, int(percent), int(max_uses), now_iso, int(created_by), expires_iso, expires_ts),
         )
 
 
 def get_discount_code(code: str) -> DiscountCode | None:
-    db_path = _db_path()
     norm = normalize_discount_code(code)
-    with sqlite3.connect(db_path) as con:
+    with _connect() as con:
         row = con.execute(
             """
-            SELECT code, percent, max_uses, used_count, created_at, created_by, expires_at, is_active
+            SELECT code, percent, max_uses, used_count, created_at, created_by, expires_at, is_active, expires_ts
             FROM discount_codes
             WHERE code = ?
             """,
@@ -685,41 +1125,39 @@ def get_discount_code(code: str) -> DiscountCode | None:
     return DiscountCode(*row) if row else None
 
 
-def can_use_discount_code(code: str, now_iso: str) -> tuple[bool, str, int | None]:
-    """Returns (ok, reason, percent). now_iso should be UTC ISO string."""
+def can_use_discount_code(code: str, now: datetime) -> tuple[bool, str, int | None]:
+    """Returns (ok, reason, percent)."""
     dc = get_discount_code(code)
     if dc is None:
         return False, "not_found", None
     if int(dc.is_active) != 1:
         return False, "inactive", None
-    try:
-        if datetime.fromisoformat(now_iso) >= datetime.fromisoformat(dc.expires_at):
-            return False, "expired", None
-    except Exception:
-        # If parsing fails, be safe.
+    if dc.expires_ts is None or _to_epoch(now) >= int(dc.expires_ts):
         return False, "expired", None
     if int(dc.used_count) >= int(dc.max_uses):
         return False, "used_up", None
     return True, "ok", int(dc.percent)
 
 
-def consume_discount_code(code: str, now_iso: str) -> bool:
+def consume_discount_code(code: str, now: datetime) -> bool:
     """Atomically increments used_count if usable. Returns True if consumed."""
-    db_path = _db_path()
-    norm = normalize_discount_code(code)
-    with sqlite3.connect(db_path) as con:
-        cur = con.execute(
-            """
-            UPDATE discount_codes
-            SET used_count = used_count + 1
-            WHERE code = ?
-              AND is_active = 1
-              AND used_count < max_uses
-              AND expires_at > ?
-            """,
-            (norm, now_iso),
-        )
-        return cur.rowcount == 1
+    with _connect() as con:
+        return _consume_discount_code(con, code, now)
+
+
+def _consume_discount_code(con: sqlite3.Connection, code: str, now: datetime) -> bool:
+    cur = con.execute(
+        """
+        UPDATE discount_codes
+        SET used_count = used_count + 1
+        WHERE code = ?
+          AND is_active = 1
+          AND used_count < max_uses
+          AND expires_ts > ?
+        """,
+        (normalize_discount_code(code), _to_epoch(now)),
+    )
+    return cur.rowcount == 1
 
 
 def set_payment_status(
@@ -728,9 +1166,8 @@ def set_payment_status(
     reviewer_id: int | None,
     reject_reason: str | None = None,
 ) -> None:
-    db_path = _db_path()
     reviewed_at = datetime.utcnow().isoformat(timespec="seconds")
-    with sqlite3.connect(db_path) as con:
+    with _connect() as con:
         con.execute(
             """
             UPDATE payment_requests
@@ -741,6 +1178,64 @@ def set_payment_status(
         )
 
 
+@dataclass(frozen=True)
+class PaymentApproval:
+    payment: PaymentRequest
+    # The booked reservation if its reminder is still due, else None.
+    reminder: ReminderCandidate | None
+    # None when the payment had no coupon.
+    coupon_consumed: bool | None
+
+
+def _review_payment(
+    con: sqlite3.Connection, payment_id: int, status: str, reviewer_id: int | None, reject_reason: str | None
+) -> PaymentRequest | None:
+    """Move a pending payment to `status`; None if it is missing or was already reviewed."""
+    reviewed_at = datetime.utcnow().isoformat(timespec="seconds")
+    rows = con.execute(
+        f"""
+        UPDATE payment_requests
+        SET status = ?, reviewed_at = ?, reviewer_id = ?, reject_reason = ?
+        WHERE id = ? AND status = 'pending'
+        RETURNING {_PAYMENT_COLUMNS}
+        """,
+        (status, reviewed_at, reviewer_id, reject_reason, payment_id),
+    ).fetchall()
+    return PaymentRequest(*rows[0]) if rows else None
+
+
+def approve_payment(payment_id: int, reviewer_id: int | None, now: datetime | None = None) -> PaymentApproval | None:
+    """Approve a pending payment, book its reservation and consume its coupon, in one transaction.
+
+    Returns None if the payment does not exist or was already reviewed, so
+    two admins pressing approve at once book the slot only once.
+    """
+    now = now or datetime.now(timezone.utc)
+    with _connect() as con:
+        payment = _review_payment(con, payment_id, "approved", reviewer_id, None)
+        if payment is None:
+            return None
+        slot = _set_reservation_status_in(con, payment.reservation_id, "booked")
+        coupon_consumed = _consume_discount_code(con, payment.coupon_code, now) if payment.coupon_code else None
+        row = con.execute(_REMINDER_CANDIDATE_SELECT + " AND r.id = ?", (payment.reservation_id,)).fetchone()
+    _after_reservation_status(payment.reservation_id, slot)
+    return PaymentApproval(payment, ReminderCandidate(*row) if row else None, coupon_consumed)
+
+
+def reject_payment(payment_id: int, reviewer_id: int | None, reject_reason: str | None) -> PaymentRequest | None:
+    """Reject a pending payment and cancel its reservation (freeing the slot), in one transaction.
+
+    Returns the rejected payment, or None if it does not exist or was already reviewed.
+    """
+    with _connect() as con:
+        payment = _review_payment(con, payment_id, "rejected", reviewer_id, reject_reason)
+        if payment is None:
+            return None
+        slot = _set_reservation_status_in(con, payment.reservation_id, "cancelled")
+    _after_reservation_status(payment.reservation_id, slot)
+    return payment
+
+
 @dataclass(frozen=True)
 class VerificationRequest:
     id: int
@@ -756,9 +1251,8 @@ class VerificationRequest:
 
 
 def create_verification_request(user_id: int, username: str | None, card_number: str, photo_file_id: str) -> int:
-    db_path = _db_path()
     created_at = datetime.utcnow().isoformat(timespec="seconds")
-    with sqlite3.connect(db_path) as con:
+    with _connect() as con:
         cur = con.execute(
             """
             INSERT INTO verification_requests(user_id, username, card_number, photo_file_id, status, created_at)
@@ -770,8 +1264,7 @@ def create_verification_request(user_id: int, username: str | None, card_number:
 
 
 def get_verification_request(request_id: int) -> VerificationRequest | None:
-    db_path = _db_path()
-    with sqlite3.connect(db_path) as con:
+    with _connect() as con:
         row = con.execute(
             """
             SELECT id, user_id, username, card_number, photo_file_id, status,
@@ -790,9 +1283,8 @@ def set_verification_status(
     reviewer_id: int | None,
     decision_reason: str | None = None,
 ) -> None:
-    db_path = _db_path()
     reviewed_at = datetime.utcnow().isoformat(timespec="seconds")
-    with sqlite3.connect(db_path) as con:
+    with _connect() as con:
         con.execute(
             """
             UPDATE verification_requests
@@ -804,9 +1296,8 @@ def set_verification_status(
 
 
 def upsert_verified_card(user_id: int, username: str | None, card_number: str, verifier_id: int | None) -> None:
-    db_path = _db_path()
     verified_at = datetime.utcnow().isoformat(timespec="seconds")
-    with sqlite3.connect(db_path) as con:
+    with _connect() as con:
         con.execute(
             """
             INSERT INTO verified_cards(user_id, username, card_number, verified_at, verifier_id)
@@ -819,13 +1310,230 @@ def upsert_verified_card(user_id: int, username: str | None, card_number: str, v
             """,
             (user_id, username, card_number, verified_at, verifier_id),
         )
+    _card_cache.invalidate(user_id)
 
 
-def get_verified_card_number(user_id: int) -> str | None:
-    db_path = _db_path()
-    with sqlite3.connect(db_path) as con:
+def _load_verified_card_number(user_id: int) -> str | None:
+    with _connect() as con:
         row = con.execute(
             "SELECT card_number FROM verified_cards WHERE user_id = ?",
             (user_id,),
         ).fetchone()
     return str(row[0]) if row else None
+
+
+def get_verified_card_number(user_id: int) -> str | None:
+    return _cached(_card_cache, user_id, lambda: _load_verified_card_number(user_id))
+
+
+def peek_verified_card_number(user_id: int) -> tuple[bool, str | None]:
+    """(True, card or None) if cached, else (False, None); never touches the DB."""
+    return _peek(_card_cache, user_id)
+
+
+BROADCAST_ACTIVE_STATUSES = ("running", "paused")
+# User ids per "IN (...)" list; stays well under SQLite's bound-parameter limit.
+_IN_CHUNK_SIZE = 500
+
+
+@dataclass(frozen=True)
+class BroadcastJob:
+    id: int
+    created_by: int
+    owner_chat_id: int
+    from_chat_id: int
+    message_id: int
+    status: str
+    total: int
+    sent: int
+    failed: int
+    blocked: int
+    status_message_id: int | None
+    created_at: str
+    finished_at: str | None
+
+
+_BROADCAST_JOB_COLUMNS = """
+    id, created_by, owner_chat_id, from_chat_id, message_id, status,
+    total, sent, failed, blocked, status_message_id, created_at, finished_at
+"""
+
+
+def create_broadcast_job(created_by: int, owner_chat_id: int, from_chat_id: int, message_id: int) -> BroadcastJob:
+    """Create a running job and snapshot every subscribed user as a pending delivery."""
+    created_at = datetime.utcnow().isoformat(timespec="seconds")
+    with _connect() as con:
+        cur = con.execute(
+            """
+            INSERT INTO broadcast_jobs(created_by, owner_chat_id, from_chat_id, message_id, status, created_at)
+            VALUES (?, ?, ?, ?, 'running', ?)
+            """,
+            (created_by, owner_chat_id, from_chat_id, message_id, created_at),
+        )
+        job_id = int(cur.lastrowid)
+        cur = con.execute(
+            """
+            INSERT INTO broadcast_deliveries(job_id, user_id, status)
+            SELECT ?, user_id, 'pending' FROM users WHERE is_subscribed = 1
+            """,
+            (job_id,),
+        )
+        total = int(cur.rowcount)
+        con.execute("UPDATE broadcast_jobs SET total = ? WHERE id = ?", (total, job_id))
+        row = con.execute(
+            f"SELECT {_BROADCAST_JOB_COLUMNS} FROM broadcast_jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+    return BroadcastJob(*row)
+
+
+def get_broadcast_job(job_id: int) -> BroadcastJob | None:
+    with _connect() as con:
+        row = con.execute(
+            f"SELECT {_BROADCAST_JOB_COLUMNS} FROM broadcast_jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+    return BroadcastJob(*row) if row else None
+
+
+def list_active_broadcast_jobs() -> list[BroadcastJob]:
+    """Running and paused jobs, oldest first."""
+    with _connect() as con:
+        rows = con.execute(
+            f"""
+            SELECT {_BROADCAST_JOB_COLUMNS}
+            FROM broadcast_jobs
+            WHERE status IN ('running', 'paused')
+            ORDER BY id ASC
+            """
+        ).fetchall()
+    return [BroadcastJob(*row) for row in rows]
+
+
+def set_broadcast_job_status(job_id: int, status: str) -> bool:
+    """Move an unfinished job to `status`. Returns False if it is already done/cancelled."""
+    finished_at = datetime.utcnow().isoformat(timespec="seconds") if status in ("done", "cancelled") else None
+    with _connect() as con:
+        cur = con.execute(
+            """
+            UPDATE broadcast_jobs
+            SET status = ?, finished_at = COALESCE(?, finished_at)
+            WHERE id = ? AND status IN ('running', 'paused')
+            """,
+            (status, finished_at, job_id),
+        )
+        return cur.rowcount == 1
+
+
+def set_broadcast_status_message(job_id: int, status_message_id: int) -> None:
+    with _connect() as con:
+        con.execute(
+            "UPDATE broadcast_jobs SET status_message_id = ? WHERE id = ?",
+            (status_message_id, job_id),
+        )
+
+
+def list_pending_broadcast_recipients(job_id: int, limit: int, after_user_id: int = -1) -> list[int]:
+    """Next pending recipients after `after_user_id` (keyset on the (job_id, user_id) key)."""
+    with _connect() as con:
+        rows = con.execute(
+            """
+            SELECT user_id
+            FROM broadcast_deliveries
+            WHERE job_id = ? AND user_id > ? AND status = 'pending'
+            ORDER BY user_id ASC
+            LIMIT ?
+            """,
+            (job_id, after_user_id, limit),
+        ).fetchall()
+    return [int(r[0]) for r in rows]
+
+
+def record_broadcast_results(job_id: int, results: dict[int, str]) -> None:
+    """Store per-recipient outcomes ('sent' / 'failed' / 'blocked') and bump job counters.
+
+    Only deliveries still pending change, and the counters are built from the
+    rows that did, so a result recorded twice is counted once. Recipients are
+    updated one statement per outcome and chunk of user ids.
+    """
+    if not results:
+        return
+    attempted_at = datetime.utcnow().isoformat(timespec="seconds")
+    by_outcome: dict[str, list[int]] = {}
+    for user_id, outcome in results.items():
+        by_outcome.setdefault(outcome, []).append(int(user_id))
+    counts = {"sent": 0, "failed": 0, "blocked": 0}
+    with _connect() as con:
+        for outcome, user_ids in by_outcome.items():
+            for start in range(0, len(user_ids), _IN_CHUNK_SIZE):
+                chunk = user_ids[start : start + _IN_CHUNK_SIZE]
+                rows = con.execute(
+                    f"""
+                    UPDATE broadcast_deliveries
+                    SET status = ?, attempted_at = ?
+                    WHERE job_id = ? AND user_id IN ({",".join("?" * len(chunk))}) AND status = 'pending'
+                    RETURNING status
+                    """,
+                    (outcome, attempted_at, job_id, *chunk),
+                ).fetchall()
+                counts[outcome] += len(rows)
+        if not any(counts.values()):
+            return
+        con.execute(
+            """
+            UPDATE broadcast_jobs
+            SET sent = sent + ?, failed = failed + ?, blocked = blocked + ?
+            WHERE id = ?
+            """,
+            (counts["sent"], counts["failed"], counts["blocked"], job_id),
+        )
+
+
+def get_persisted_user_data(user_id: int) -> str | None:
+    """Stored user_data JSON for one user, or None."""
+    with _connect() as con:
+        row = con.execute("SELECT data FROM persisted_user_data WHERE user_id = ?", (user_id,)).fetchone()
+    return str(row[0]) if row else None
+
+
+def get_persisted_bot_data() -> dict[str, str]:
+    """Every stored bot_data entry as key -> JSON."""
+    with _connect() as con:
+        rows = con.execute("SELECT key, value FROM persisted_bot_data").fetchall()
+    return {str(r[0]): str(r[1]) for r in rows}
+
+
+def save_persisted_data(user_data: dict[int, str | None], bot_data: dict[str, str | None]) -> None:
+    """Write changed user_data / bot_data entries in one transaction; None deletes the entry."""
+    if not user_data and not bot_data:
+        return
+    updated_at = datetime.utcnow().isoformat(timespec="seconds")
+    with _connect() as con:
+        con.executemany(
+            """
+            INSERT INTO persisted_user_data(user_id, data, updated_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                data = excluded.data,
+                updated_at = excluded.updated_at
+            """,
+            [(user_id, data, updated_at) for user_id, data in user_data.items() if data is not None],
+        )
+        con.executemany(
+            "DELETE FROM persisted_user_data WHERE user_id = ?",
+            [(user_id,) for user_id, data in user_data.items() if data is None],
+        )
+        con.executemany(
+            """
+            INSERT INTO persisted_bot_data(key, value, updated_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                value = excluded.value,
+                updated_at = excluded.updated_at
+            """,
+            [(key, value, updated_at) for key, value in bot_data.items() if value is not None],
+        )
+        con.executemany(
+            "DELETE FROM persisted_bot_data WHERE key = ?",
+            [(key,) for key, value in bot_data.items() if value is None],
+        )
@@ -0,0 +1,178 @@
+"""Awaitable versions of the db.py functions the bot calls from handlers and jobs.
+
+Each function here runs its db.py counterpart on one of two dedicated
+executors instead of asyncio's default one:
+
+- writes go to a single writer thread and its queue, one after another, so
+  the bot's own writes never wait on each other for SQLite's write lock;
+- reads go to a small pool of reader threads (`DB_READER_THREADS`, default
+  4) and run alongside the writer thanks to WAL.
+
+Every call that reaches a thread records its queue wait and run time in
+metrics.py.
+
+Both pools reuse db.py's per-thread connections, so there is one connection
+per worker thread. A slow query only holds up other DB calls, never
+unrelated blocking work on the default executor. A read awaited after a write
+sees that write, because the write has committed by the time its await
+returns.
+
+    from db_async import get_verified_card_number
+    card = await get_verified_card_number(user_id)
+
+Point reads backed by db.py's row caches (verified card, user profile,
+reservation) are answered inline on a cache hit and only hop to a reader
+thread on a miss. Memory-only helpers (record_user_seen,
+peek_day_slot_occupancy, ...) stay plain db.py calls; they don't need a thread.
+"""
+
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, ParamSpec, TypeVar
+
+import db
+import metrics
+
+DB_READER_THREADS = max(1, int(os.getenv("DB_READER_THREADS", "4").strip() or "4"))
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+_executors: dict[str, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def _executor(kind: str) -> ThreadPoolExecutor:
+    executor = _executors.get(kind)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(kind)
+            if executor is None:
+                workers = 1 if kind == "writer" else DB_READER_THREADS
+                executor = _executors[kind] = ThreadPoolExecutor(workers, thread_name_prefix=f"db-{kind}")
+    return executor
+
+
+def _on(kind: str) -> Callable[[Callable[P, R]], Callable[P, Awaitable[R]]]:
+    def wrap(fn: Callable[P, R]) -> Callable[P, Awaitable[R]]:
+        name = fn.__name__
+
+        @functools.wraps(fn)
+        async def call(*args: P.args, **kwargs: P.kwargs) -> R:
+            submitted = time.perf_counter()
+
+            def run() -> R:
+                started = time.perf_counter()
+                metrics.observe(metrics.DB_QUEUE_SECONDS, kind, started - submitted)
+                error = True
+                try:
+                    result = fn(*args, **kwargs)
+                    error = False
+                    return result
+                finally:
+                    metrics.observe(metrics.DB_CALL_SECONDS, name, time.perf_counter() - started, error)
+
+            return await asyncio.get_running_loop().run_in_executor(_executor(kind), run)
+
+        return call
+
+    return wrap
+
+
+_read = _on("reader")
+_write = _on("writer")
+
+
+def _read_cached(fn: Callable[[int], R], peek: Callable[[int], tuple[bool, R]]) -> Callable[[int], Awaitable[R]]:
+    read = _read(fn)
+
+    @functools.wraps(fn)
+    async def call(key: int) -> R:
+        hit, value = peek(key)
+        if hit:
+            return value
+        return await read(key)
+
+    return call
+
+
+async def shutdown() -> None:
+    """Let queued calls finish, stop the worker threads and close their connections.
+
+    The next call starts fresh threads, so this is safe to run between
+    Application restarts.
+    """
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        await asyncio.to_thread(executor.shutdown, True)
+    await asyncio.to_thread(db.close_connections)
+
+
+# Users
+upsert_user = _write(db.upsert_user)
+flush_seen_users = _write(db.flush_seen_users)
+set_user_subscription = _write(db.set_user_subscription)
+unsubscribe_users = _write(db.unsubscribe_users)
+list_subscribed_user_ids = _read(db.list_subscribed_user_ids)
+get_user_profile = _read_cached(db.get_user_profile, db.peek_user_profile)
+get_admin_stats = _read(db.get_admin_stats)
+
+# Slots and reservations
+is_slot_reserved = _read(db.is_slot_reserved)
+get_slot_owner_user_id = _read(db.get_slot_owner_user_id)
+get_day_slot_occupancy = _read(db.get_day_slot_occupancy)
+check_slot_cache = _read(db.check_slot_cache)
+add_reservation = _write(db.add_reservation)
+try_reserve_slot = _write(db.try_reserve_slot)
+try_hold_slot_pending_payment = _write(db.try_hold_slot_pending_payment)
+expire_pending_payment_holds = _write(db.expire_pending_payment_holds)
+list_reservations_for_user = _read(db.list_reservations_for_user)
+get_reservation = _read_cached(db.get_reservation, db.peek_reservation)
+get_reservation_full = _read_cached(db.get_reservation_full, db.peek_reservation_full)
+set_reservation_status = _write(db.set_reservation_status)
+update_reservation_promo = _write(db.update_reservation_promo)
+update_reservation_destination_links = _write(db.update_reservation_destination_links)
+
+# Reminders
+get_reminder_candidate = _read(db.get_reminder_candidate)
+list_reminder_candidates = _read(db.list_reminder_candidates)
+mark_reservation_reminded = _write(db.mark_reservation_reminded)
+unmark_reservation_reminded = _write(db.unmark_reservation_reminded)
+
+# Payments and discount codes
+create_payment_request = _write(db.create_payment_request)
+get_payment_request = _read(db.get_payment_request)
+set_payment_status = _write(db.set_payment_status)
+approve_payment = _write(db.approve_payment)
+reject_payment = _write(db.reject_payment)
+create_discount_code = _write(db.create_discount_code)
+get_discount_code = _read(db.get_discount_code)
+can_use_discount_code = _read(db.can_use_discount_code)
+consume_discount_code = _write(db.consume_discount_code)
+
+# Card verification
+create_verification_request = _write(db.create_verification_request)
+get_verification_request = _read(db.get_verification_request)
+set_verification_status = _write(db.set_verification_status)
+upsert_verified_card = _write(db.upsert_verified_card)
+get_verified_card_number = _read_cached(db.get_verified_card_number, db.peek_verified_card_number)
+
+# Broadcasts
+create_broadcast_job = _write(db.create_broadcast_job)
+get_broadcast_job = _read(db.get_broadcast_job)
+list_active_broadcast_jobs = _read(db.list_active_broadcast_jobs)
+set_broadcast_job_status = _write(db.set_broadcast_job_status)
+set_broadcast_status_message = _write(db.set_broadcast_status_message)
+list_pending_broadcast_recipients = _read(db.list_pending_broadcast_recipients)
+record_broadcast_results = _write(db.record_broadcast_results)
+
+# Persistence (persistence.py)
+get_persisted_user_data = _read(db.get_persisted_user_data)
+get_persisted_bot_data = _read(db.get_persisted_bot_data)
+save_persisted_data = _write(db.save_persisted_data)
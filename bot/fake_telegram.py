@@ -0,0 +1,200 @@
+"""Offline stand-in for the Telegram Bot API.
+
+FakeBotAPI plugs into python-telegram-bot as its request backend, so a real
+Application (same handlers, same Bot class) runs without network access:
+
+    app = bot.build_application(
+        Application.builder().token(FAKE_TOKEN).request(FakeBotAPI()).get_updates_request(FakeBotAPI())
+    )
+
+Every Bot API call is answered locally with a minimal valid result and
+counted in `calls`, so load tools can measure the bot's own overhead.
+"""
+
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter, defaultdict
+from typing import Iterable
+
+from telegram.request import BaseRequest, RequestData
+
+FAKE_TOKEN = "123456:fake-token-for-local-runs"
+FAKE_BOT_ID = 123456
+
+
+class FakeBotAPI(BaseRequest):
+    """Answer Bot API calls locally.
+
+    `latency` adds a fixed delay per call to mimic Telegram round trips;
+    `flood_every` makes every Nth send/copy fail with 429 (RetryAfter),
+    sends/copies to `blocked_chats` fail with 403 (Forbidden) and
+    `member_status` is what getChatMember reports for every user. With
+    `record_buttons`, the callback_data of every inline button the bot sends
+    or edits in is appended to `buttons[chat_id]`, so simulated users can
+    press what they were shown.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        flood_every: int = 0,
+        member_status: str = "member",
+        record_buttons: bool = False,
+        blocked_chats: Iterable[int] = (),
+    ) -> None:
+        self.latency = latency
+        self.flood_every = flood_every
+        self.blocked_chats = frozenset(blocked_chats)
+        self.member_status = member_status
+        self.record_buttons = record_buttons
+        self.buttons: defaultdict[int, list[str]] = defaultdict(list)
+        self.calls: Counter[str] = Counter()
+        self._message_ids = itertools.count(1)
+        self._sends = itertools.count(1)
+
+    @property
+    def read_timeout(self) -> float | None:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: RequestData | None = None,
+        read_timeout=None,
+        write_timeout=None,
+        connect_timeout=None,
+        pool_timeout=None,
+    ) -> tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data is not None else {}
+        self.calls[api_method] += 1
+
+        if api_method == "getUpdates":
+            # Nothing ever arrives through polling; don't spin.
+            await asyncio.sleep(min(float(params.get("timeout") or 0), 1.0))
+            return 200, b'{"ok": true, "result": []}'
+
+        if self.record_buttons:
+            self._record_buttons(params)
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        is_send = api_method.startswith("send") or api_method == "copyMessage"
+        if is_send and self.blocked_chats and int(params.get("chat_id", 0)) in self.blocked_chats:
+            body = {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}
+            return 403, json.dumps(body).encode()
+
+        if self.flood_every and is_send:
+            if next(self._sends) % self.flood_every == 0:
+                body = {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                }
+                return 429, json.dumps(body).encode()
+
+        return 200, json.dumps({"ok": True, "result": self._result(api_method, params)}).encode()
+
+    def _record_buttons(self, params: dict) -> None:
+        markup = params.get("reply_markup")
+        if isinstance(markup, str):
+            markup = json.loads(markup)
+        if not isinstance(markup, dict) or "chat_id" not in params:
+            return
+        chat_buttons = self.buttons[int(params["chat_id"])]
+        for row in markup.get("inline_keyboard") or []:
+            for button in row:
+                if button.get("callback_data"):
+                    chat_buttons.append(button["callback_data"])
+
+    def _message(self, params: dict) -> dict:
+        chat_id = params.get("chat_id", 0)
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id) if str(chat_id).lstrip("-").isdigit() else 0, "type": "private"},
+            "text": params.get("text") or params.get("caption") or "",
+        }
+
+    def _result(self, api_method: str, params: dict):
+        if api_method == "getMe":
+            return {
+                "id": FAKE_BOT_ID,
+                "is_bot": True,
+                "first_name": "FakeBot",
+                "username": "fake_bot",
+                "can_join_groups": True,
+                "can_read_all_group_messages": False,
+                "supports_inline_queries": False,
+            }
+        if api_method == "getChatMember":
+            user = {"id": int(params.get("user_id", 0)), "is_bot": False, "first_name": "user"}
+            return {"status": self.member_status, "user": user}
+        if api_method == "copyMessage":
+            return {"message_id": next(self._message_ids)}
+        if api_method.startswith("send") or api_method.startswith("edit") or api_method == "forwardMessage":
+            return self._message(params)
+        # answerCallbackQuery, setWebhook, deleteMessage, ...
+        return True
+
+
+# Raw Update JSON builders (what Telegram would POST / return from getUpdates).
+
+_update_ids = itertools.count(1)
+
+
+def _user(user_id: int, username: str | None = None) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+    if username:
+        user["username"] = username
+    return user
+
+
+def message_update(user_id: int, text: str | None = None, photo_file_id: str | None = None) -> dict:
+    """A private-chat message update; `/command` texts get a bot_command entity."""
+    update_id = next(_update_ids)
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id, f"user{user_id}"),
+    }
+    if text is not None:
+        message["text"] = text
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    if photo_file_id is not None:
+        message["photo"] = [{"file_id": photo_file_id, "file_unique_id": photo_file_id, "width": 800, "height": 600}]
+    return {"update_id": update_id, "message": message}
+
+
+def callback_update(user_id: int, data: str, message_id: int = 1) -> dict:
+    """An inline-button press on a bot message in the user's private chat."""
+    update_id = next(_update_ids)
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(user_id, f"user{user_id}"),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": FAKE_BOT_ID, "is_bot": True, "first_name": "FakeBot"},
+                "text": "",
+            },
+        },
+    }
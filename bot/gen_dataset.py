@@ -0,0 +1,459 @@
+"""Synthetic large-dataset generator for db.py benchmarks.
+
+Fills a SQLite file (created with the bot's own schema via db.init_db) with
+users, reservations, payments, discount codes, card verifications, a running
+broadcast and persisted handler state. Distributions follow the bot's domain:
+
+- users: first seen uniformly over the history, last seen mostly recently
+  (exponential), ~60% subscribed, ~75% with a username;
+- reservations: six evening slots a day (bot._time_slots). Each past slot is
+  booked with ~85% probability and upcoming days fill up less the further
+  out they are; the 20:30 slot is the most contested. The unique active-slot
+  index allows one booked/pending reservation per slot, so every reservation
+  beyond those is a cancelled hold, and at large sizes most rows are
+  cancelled. A few heavy users make most bookings;
+- payments: an approved payment for each booked reservation, a pending one
+  for about half of the upcoming holds, and rejected ones for ~3% of
+  cancelled holds;
+- verifications: ~35% of users submitted a card, and most were approved
+  (with a verified_cards row).
+
+Rows are streamed in chronological order with explicit ids, so memory stays
+flat at 1M users / 5M reservations. The same arguments and seed give the same
+file.
+
+    python gen_dataset.py --users 1000000 --reservations 5000000 --out big.sqlite3
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import time
+from datetime import date, datetime, timedelta, timezone
+from datetime import time as clock
+from typing import Iterator
+
+import db
+
+SLOT_TIMES = (clock(20, 30), clock(21, 0), clock(21, 30), clock(22, 0), clock(22, 30), clock(23, 0))
+# The first slot of the evening sells out first.
+SLOT_WEIGHTS = (4, 3, 2, 2, 1, 1)
+HISTORY_DAYS = 730
+FUTURE_DAYS = 14
+BATCH_ROWS = 50_000
+
+_DAY = 86_400
+
+
+def _iso_utc(ts: int) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def _username(user_id: int) -> str | None:
+    return None if user_id % 4 == 0 else f"user{user_id}"
+
+
+def _card(rng: random.Random) -> str:
+    return "6219" + "".join(rng.choices("0123456789", k=12))
+
+
+def _batched(con: sqlite3.Connection, sql: str, rows: Iterator[tuple]) -> int:
+    total = 0
+    batch: list[tuple] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_ROWS:
+            con.executemany(sql, batch)
+            total += len(batch)
+            batch.clear()
+    if batch:
+        con.executemany(sql, batch)
+        total += len(batch)
+    return total
+
+
+class _Generator:
+    def __init__(self, con: sqlite3.Connection, users: int, reservations: int, seed: int, now: datetime) -> None:
+        self.con = con
+        self.users = users
+        self.reservations = reservations
+        self.rng = random.Random(seed)
+        self.now_ts = int(now.timestamp())
+        self.today = now.astimezone(db.LOCAL_TZ).date()
+
+    def _user_id(self) -> int:
+        # Heavy-tailed: low ids (early users) book far more often.
+        return min(self.users, int(self.users * self.rng.random() ** 2) + 1)
+
+    def users_rows(self) -> Iterator[tuple]:
+        rng, now = self.rng, self.now_ts
+        for uid in range(1, self.users + 1):
+            first_ts = now - rng.randrange(HISTORY_DAYS * _DAY)
+            last_ts = max(first_ts, now - int(rng.expovariate(1 / (14 * _DAY))))
+            subscribed = rng.random() < 0.6
+            subscribed_at = unsubscribed_at = None
+            if subscribed:
+                subscribed_at = _iso_utc(rng.randint(first_ts, last_ts))
+            elif rng.random() < 0.25:
+                subscribed_at = _iso_utc(first_ts)
+                unsubscribed_at = _iso_utc(rng.randint(first_ts, last_ts))
+            yield (
+                uid,
+                _iso_utc(first_ts),
+                _iso_utc(last_ts),
+                last_ts,
+                _username(uid),
+                int(subscribed),
+                subscribed_at,
+                unsubscribed_at,
+            )
+
+    def _days(self) -> list[date]:
+        start = self.today - timedelta(days=HISTORY_DAYS)
+        return [start + timedelta(days=i) for i in range(HISTORY_DAYS + FUTURE_DAYS + 1)]
+
+    def _active_slots(self, days: list[date]) -> set[tuple[date, int]]:
+        rng = self.rng
+        active = set()
+        for day in days:
+            ahead = (day - self.today).days
+            fill = 0.85 if ahead <= 0 else max(0.15, 0.9 - 0.05 * ahead)
+            for slot in range(len(SLOT_TIMES)):
+                if rng.random() < fill * (1.0 if slot < 2 else 0.9):
+                    active.add((day, slot))
+        if len(active) > self.reservations:
+            active = set(rng.sample(sorted(active), self.reservations))
+        return active
+
+    def reservations_and_payments(self) -> tuple[int, int]:
+        rng, now = self.rng, self.now_ts
+        days = self._days()
+        active = self._active_slots(days)
+        cancelled_total = self.reservations - len(active)
+        per_day = cancelled_total / len(days)
+
+        reservation_rows: list[tuple] = []
+        payment_rows: list[tuple] = []
+        reservation_id = payment_id = 0
+        written_reservations = written_payments = 0
+
+        def flush() -> None:
+            nonlocal written_reservations, written_payments
+            self.con.executemany(
+                """
+                INSERT INTO reservations(
+                    id, user_id, reserved_at, reserved_ts, created_at, created_ts, status,
+                    group_link, promo_photo_file_id, reminder_sent_at, username, destination_links
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                reservation_rows,
+            )
+            self.con.executemany(
+                """
+                INSERT INTO payment_requests(
+                    id, reservation_id, user_id, username, card_number, coupon_code, coupon_percent,
+                    receipt_photo_file_id, status, created_at, reviewed_at, reviewer_id, reject_reason
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                payment_rows,
+            )
+            written_reservations += len(reservation_rows)
+            written_payments += len(payment_rows)
+            reservation_rows.clear()
+            payment_rows.clear()
+
+        for index, day in enumerate(days):
+            slot_ts = [int(datetime.combine(day, t, tzinfo=db.LOCAL_TZ).timestamp()) for t in SLOT_TIMES]
+            # Telescoping rounding: the per-day counts add up to exactly cancelled_total.
+            n_cancelled = round(per_day * (index + 1)) - round(per_day * index)
+            day_rows = []
+            for _ in range(n_cancelled):
+                slot = rng.choices(range(len(SLOT_TIMES)), SLOT_WEIGHTS)[0]
+                day_rows.append((slot, "cancelled"))
+            for slot in range(len(SLOT_TIMES)):
+                if (day, slot) in active:
+                    upcoming = slot_ts[slot] > now
+                    pending = upcoming and (day - self.today).days <= 2 and rng.random() < 0.15
+                    day_rows.append((slot, "pending_payment" if pending else "booked"))
+
+            stamped = []
+            for slot, status in day_rows:
+                reserved_ts = slot_ts[slot]
+                if status == "pending_payment":
+                    created_ts = now - rng.randrange(600)
+                else:
+                    created_ts = min(now - 60, reserved_ts - rng.randrange(60, 7 * _DAY))
+                stamped.append((created_ts, slot, status, reserved_ts))
+            stamped.sort()
+
+            for created_ts, slot, status, reserved_ts in stamped:
+                reservation_id += 1
+                uid = self._user_id()
+                username = _username(uid)
+                reserved_at = datetime.fromtimestamp(reserved_ts, db.LOCAL_TZ).isoformat(timespec="seconds")
+                created_at = _iso_utc(created_ts)
+                booked = status == "booked"
+                reminded = _iso_utc(reserved_ts - 3600) if booked and reserved_ts - 3600 < now else None
+                reservation_rows.append(
+                    (
+                        reservation_id,
+                        uid,
+                        reserved_at,
+                        reserved_ts,
+                        created_at,
+                        created_ts,
+                        status,
+                        f"https://t.me/+g{uid}" if booked and rng.random() < 0.5 else None,
+                        f"promo-{reservation_id}" if booked and rng.random() < 0.7 else None,
+                        reminded,
+                        username,
+                        f"@channel{uid}" if booked and rng.random() < 0.3 else None,
+                    )
+                )
+
+                if booked:
+                    payment = "approved"
+                elif status == "pending_payment":
+                    payment = "pending" if rng.random() < 0.5 else None
+                else:
+                    payment = "rejected" if rng.random() < 0.03 else None
+                if payment is not None:
+                    payment_id += 1
+                    paid_ts = min(now, created_ts + rng.randrange(60, 900))
+                    reviewed = payment != "pending"
+                    coupon = rng.random() < 0.1
+                    payment_rows.append(
+                        (
+                            payment_id,
+                            reservation_id,
+                            uid,
+                            username,
+                            _card(rng),
+                            f"code{rng.randrange(1000):06d}" if coupon else None,
+                            rng.choice((10, 20, 50)) if coupon else None,
+                            f"receipt-{payment_id}",
+                            payment,
+                            _iso_utc(paid_ts),
+                            _iso_utc(min(now, paid_ts + rng.randrange(60, 3600))) if reviewed else None,
+                            1 if reviewed else None,
+                            "receipt unreadable" if payment == "rejected" else None,
+                        )
+                    )
+
+            if len(reservation_rows) >= BATCH_ROWS:
+                flush()
+        flush()
+        return written_reservations, written_payments
+
+    def discount_codes_rows(self) -> Iterator[tuple]:
+        rng, now = self.rng, self.now_ts
+        for i in range(max(10, self.users // 200)):
+            created_ts = now - rng.randrange(HISTORY_DAYS * _DAY)
+            expires_ts = created_ts + rng.choice((1, 3, 7, 30)) * _DAY
+            if rng.random() < 0.2:
+                expires_ts = now + rng.randrange(1, 30) * _DAY
+            max_uses = rng.choice((1, 10, 50, 100, 1000))
+            yield (
+                f"code{i:06d}",
+                rng.choice((5, 10, 15, 20, 30, 50)),
+                max_uses,
+                rng.randint(0, max_uses),
+                _iso_utc(created_ts),
+                1,
+                _iso_utc(expires_ts),
+                expires_ts,
+                int(rng.random() < 0.9),
+            )
+
+    def verifications(self) -> tuple[int, int]:
+        rng, now = self.rng, self.now_ts
+
+        def rows() -> Iterator[tuple]:
+            request_id = 0
+            for uid in range(1, self.users + 1):
+                if rng.random() >= 0.35:
+                    continue
+                request_id += 1
+                roll = rng.random()
+                status = "approved" if roll < 0.88 else "rejected" if roll < 0.96 else "pending"
+                created_ts = now - rng.randrange(HISTORY_DAYS * _DAY)
+                reviewed = status != "pending"
+                yield (
+                    request_id,
+                    uid,
+                    _username(uid),
+                    _card(rng),
+                    f"card-photo-{request_id}",
+                    status,
+                    _iso_utc(created_ts),
+                    _iso_utc(min(now, created_ts + 3600)) if reviewed else None,
+                    1 if reviewed else None,
+                    "name mismatch" if status == "rejected" else None,
+                )
+
+        verified = 0
+
+        def with_cards() -> Iterator[tuple]:
+            nonlocal verified
+            for row in rows():
+                if row[5] == "approved":
+                    self.con.execute(
+                        "INSERT INTO verified_cards(user_id, username, card_number, verified_at, verifier_id) VALUES (?, ?, ?, ?, 1)",
+                        (row[1], row[2], row[3], row[7]),
+                    )
+                    verified += 1
+                yield row
+
+        requests = _batched(
+            self.con,
+            """
+            INSERT INTO verification_requests(
+                id, user_id, username, card_number, photo_file_id, status, created_at,
+                reviewed_at, reviewer_id, decision_reason
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            with_cards(),
+        )
+        return requests, verified
+
+    def broadcast(self) -> int:
+        """Twenty finished jobs and one running job with a delivery row per subscriber, 40% attempted."""
+        rng, now = self.rng, self.now_ts
+        for i in range(20):
+            created_ts = now - (20 - i) * 30 * _DAY
+            self.con.execute(
+                """
+                INSERT INTO broadcast_jobs(created_by, owner_chat_id, from_chat_id, message_id, status,
+                                           total, sent, failed, blocked, created_at, finished_at)
+                VALUES (1, 1, 1, ?, 'done', 0, 0, 0, 0, ?, ?)
+                """,
+                (i + 1, _iso_utc(created_ts), _iso_utc(created_ts + 3600)),
+            )
+        job_id = int(
+            self.con.execute(
+                """
+                INSERT INTO broadcast_jobs(created_by, owner_chat_id, from_chat_id, message_id, status, created_at)
+                VALUES (1, 1, 1, 21, 'running', ?)
+                """,
+                (_iso_utc(now - 600),),
+            ).lastrowid
+        )
+        subscribers = [r[0] for r in self.con.execute("SELECT user_id FROM users WHERE is_subscribed = 1 ORDER BY user_id")]
+        attempted = int(len(subscribers) * 0.4)
+        outcomes = {"sent": 0, "failed": 0, "blocked": 0}
+
+        def rows() -> Iterator[tuple]:
+            for i, uid in enumerate(subscribers):
+                if i < attempted:
+                    roll = rng.random()
+                    status = "sent" if roll < 0.93 else "blocked" if roll < 0.98 else "failed"
+                    outcomes[status] += 1
+                    yield (job_id, uid, status, _iso_utc(now - 300))
+                else:
+                    yield (job_id, uid, "pending", None)
+
+        _batched(
+            self.con,
+            "INSERT INTO broadcast_deliveries(job_id, user_id, status, attempted_at) VALUES (?, ?, ?, ?)",
+            rows(),
+        )
+        self.con.execute(
+            "UPDATE broadcast_jobs SET total = ?, sent = ?, failed = ?, blocked = ? WHERE id = ?",
+            (
+                len(subscribers),
+                outcomes["sent"],
+                outcomes["failed"],
+                outcomes["blocked"],
+                job_id,
+            ),
+        )
+        return len(subscribers)
+
+    def persisted_rows(self) -> Iterator[tuple]:
+        rng, now = self.rng, self.now_ts
+        for uid in range(1, self.users + 1):
+            if rng.random() < 0.03:
+                data = {"flow": rng.choice(("payment", "verification", "banner")), "reservation_id": rng.randrange(1, 10**6)}
+                yield (uid, json.dumps(data), _iso_utc(now - rng.randrange(HISTORY_DAYS * _DAY)))
+
+
+def generate(path: str, users: int, reservations: int, seed: int = 1, now: datetime | None = None) -> dict[str, int]:
+    """Create `path` (which must not exist) and fill it. Returns row counts per table."""
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    now = (now or datetime.now(timezone.utc)).replace(microsecond=0)
+
+    previous = os.environ.get("DB_PATH")
+    os.environ["DB_PATH"] = path
+    try:
+        db.init_db()
+        db.close_connections()
+    finally:
+        if previous is None:
+            del os.environ["DB_PATH"]
+        else:
+            os.environ["DB_PATH"] = previous
+
+    con = sqlite3.connect(path, isolation_level=None)
+    try:
+        con.execute("PRAGMA synchronous = OFF")
+        con.execute("PRAGMA cache_size = -262144")
+        gen = _Generator(con, users, reservations, seed, now)
+        counts: dict[str, int] = {}
+        con.execute("BEGIN")
+        counts["users"] = _batched(
+            con,
+            """
+            INSERT INTO users(user_id, first_seen_at, last_seen_at, last_seen_ts, username,
+                              is_subscribed, subscribed_at, unsubscribed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            gen.users_rows(),
+        )
+        counts["reservations"], counts["payment_requests"] = gen.reservations_and_payments()
+        counts["discount_codes"] = _batched(
+            con,
+            """
+            INSERT INTO discount_codes(code, percent, max_uses, used_count, created_at, created_by,
+                                       expires_at, expires_ts, is_active)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            gen.discount_codes_rows(),
+        )
+        counts["verification_requests"], counts["verified_cards"] = gen.verifications()
+        counts["broadcast_deliveries"] = gen.broadcast()
+        counts["persisted_user_data"] = _batched(
+            con,
+            "INSERT INTO persisted_user_data(user_id, data, updated_at) VALUES (?, ?, ?)",
+            gen.persisted_rows(),
+        )
+        con.execute("COMMIT")
+        con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        con.close()
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--reservations", type=int, default=500_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", required=True, help="SQLite file to create (must not exist)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    counts = generate(args.out, args.users, args.reservations, args.seed)
+    elapsed = time.perf_counter() - t0
+    for table, n in counts.items():
+        print(f"{table:<22} {n:>12,}")
+    print(f"wrote {args.out} ({os.path.getsize(args.out) / 1e6:,.1f} MB) in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
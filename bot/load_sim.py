@@ -0,0 +1,248 @@
+"""End-to-end load simulator: the real Application against an offline Bot API.
+
+Builds the same Application as main() (bot.build_application) with every
+Bot API call answered by fake_telegram.FakeBotAPI and a throwaway SQLite
+file, then feeds synthetic updates through the normal update queue and
+update processor. Each simulated user walks the booking flow, waiting for
+the bot to finish each step before sending the next:
+
+    /start -> "رزرو تایم" -> a weekday -> a slot| button -> discount|...|no -> receipt photo
+
+An admin presses the pay|...|approve button of every receipt it is shown.
+Users only press buttons the bot actually sent them, so a taken slot or a
+full day ends that user's run the way it would for a real user.
+
+Reported: per-step and overall latency (p50/p95/p99, from enqueue to the end
+of processing), throughput, DB lock errors and other handler errors.
+`--json` saves the report; `--baseline` prints the change against a saved one.
+
+    python load_sim.py --users 2000 --rate 500
+    python load_sim.py --users 2000 --rate 500 --json after.json --baseline before.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from telegram import Update
+from telegram.ext import Application, ContextTypes
+
+from broadcast import TokenBucket
+from fake_telegram import FAKE_TOKEN, FakeBotAPI, callback_update, message_update
+
+ADMIN_ID = 1
+FIRST_USER_ID = 100_000
+STEPS = ("start", "menu", "weekday", "slot", "discount", "receipt", "approve")
+
+
+def _percentiles(samples: list[float]) -> dict[str, float]:
+    ms = sorted(s * 1000 for s in samples)
+    if not ms:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0}
+
+    def pct(p: float) -> float:
+        return ms[min(len(ms) - 1, int(len(ms) * p))]
+
+    return {"count": len(ms), "p50": statistics.median(ms), "p95": pct(0.95), "p99": pct(0.99)}
+
+
+class _Simulation:
+    def __init__(self, app: Application, api: FakeBotAPI, args: argparse.Namespace) -> None:
+        self.app = app
+        self.api = api
+        self.args = args
+        self.bucket = TokenBucket(args.rate) if args.rate > 0 else None
+        self.pending: dict[int, asyncio.Future] = {}
+        self.latency: dict[str, list[float]] = defaultdict(list)
+        self.errors: Counter[str] = Counter()
+        self.lock_errors = 0
+        self.users_done = asyncio.Event()
+
+        original_process_update = app.process_update
+
+        async def process_update(update: object) -> None:
+            try:
+                await original_process_update(update)
+            finally:
+                future = self.pending.pop(getattr(update, "update_id", None), None)
+                if future is not None and not future.done():
+                    future.set_result(time.perf_counter())
+
+        app.process_update = process_update
+        app.add_error_handler(self._on_error)
+
+    async def _on_error(self, update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+        error = context.error
+        if isinstance(error, sqlite3.OperationalError) and "locked" in str(error):
+            self.lock_errors += 1
+        else:
+            self.errors[type(error).__name__] += 1
+
+    async def send(self, step: str, raw: dict) -> None:
+        """Enqueue one update and wait until the bot has fully processed it."""
+        if self.bucket is not None:
+            await self.bucket.acquire()
+        update = Update.de_json(raw, self.app.bot)
+        done = asyncio.get_running_loop().create_future()
+        self.pending[update.update_id] = done
+        t0 = time.perf_counter()
+        await self.app.update_queue.put(update)
+        finished = await done
+        self.latency[step].append(finished - t0)
+        if self.args.think_ms:
+            await asyncio.sleep(self.args.think_ms / 1000)
+
+    def _take_button(self, chat_id: int, prefix: str, suffix: str = "") -> str | None:
+        buttons = self.api.buttons[chat_id]
+        matches = [b for b in buttons if b.startswith(prefix) and b.endswith(suffix)]
+        buttons.clear()
+        return random.choice(matches) if matches else None
+
+    async def user(self, uid: int, weekdays: list[str]) -> None:
+        await self.send("start", message_update(uid, "/start"))
+        await self.send("menu", message_update(uid, "رزرو تایم"))
+        self.api.buttons[uid].clear()
+        await self.send("weekday", message_update(uid, random.choice(weekdays)))
+        slot = self._take_button(uid, "slot|")
+        if slot is None:
+            return
+        await self.send("slot", callback_update(uid, slot))
+        discount = self._take_button(uid, "discount|", "|no")
+        if discount is None:
+            return
+        await self.send("discount", callback_update(uid, discount))
+        await self.send("receipt", message_update(uid, photo_file_id=f"receipt-{uid}"))
+
+    async def admin(self) -> None:
+        approved: set[str] = set()
+        while True:
+            buttons = self.api.buttons[ADMIN_ID]
+            todo = [b for b in buttons if b.startswith("pay|") and b.endswith("|approve") and b not in approved]
+            buttons.clear()
+            for data in todo:
+                approved.add(data)
+                await self.send("approve", callback_update(ADMIN_ID, data))
+            if not todo:
+                if self.users_done.is_set():
+                    return
+                await asyncio.sleep(0.05)
+
+
+async def _run(args: argparse.Namespace) -> dict:
+    import bot
+    import db
+
+    db.init_db()
+    for i in range(args.users):
+        uid = FIRST_USER_ID + i
+        db.upsert_verified_card(uid, f"@user{uid}", "6219861800000000", ADMIN_ID)
+
+    api = FakeBotAPI(latency=args.api_latency, record_buttons=True)
+    app = bot.build_application(
+        Application.builder().token(FAKE_TOKEN).request(api).get_updates_request(FakeBotAPI()).updater(None)
+    )
+    sim = _Simulation(app, api, args)
+    weekdays = list(bot.DAY_TO_PERSIAN_WEEKDAY)
+
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+
+    t0 = time.perf_counter()
+    admin = asyncio.create_task(sim.admin())
+    await asyncio.gather(*(sim.user(FIRST_USER_ID + i, weekdays) for i in range(args.users)))
+    sim.users_done.set()
+    await admin
+    elapsed = time.perf_counter() - t0
+
+    await app.stop()
+    if app.post_stop:
+        await app.post_stop(app)
+    await app.shutdown()
+    if app.post_shutdown:
+        await app.post_shutdown(app)
+    now = datetime.now(timezone.utc)
+    stats = db.get_admin_stats(now, now, use_cache=False)
+
+    all_samples = [s for samples in sim.latency.values() for s in samples]
+    return {
+        "users": args.users,
+        "rate": args.rate,
+        "concurrent_updates": bot.CONCURRENT_UPDATES,
+        "elapsed_s": elapsed,
+        "updates": len(all_samples),
+        "updates_per_s": len(all_samples) / elapsed if elapsed else 0.0,
+        "overall": _percentiles(all_samples),
+        "steps": {step: _percentiles(sim.latency[step]) for step in STEPS if sim.latency[step]},
+        "reservations_booked": stats.reservations_booked,
+        "payments_approved": stats.payment_approved,
+        "db_lock_errors": sim.lock_errors,
+        "other_errors": dict(sim.errors),
+    }
+
+
+def _print_report(report: dict, baseline: dict | None) -> None:
+    def delta(path: tuple[str, ...], value: float) -> str:
+        if baseline is None:
+            return ""
+        old = baseline
+        for key in path:
+            old = old.get(key) if isinstance(old, dict) else None
+        if not old:
+            return ""
+        return f" ({(value - old) / old * 100:+.0f}%)"
+
+    print(
+        f"users: {report['users']}  updates: {report['updates']} in {report['elapsed_s']:.1f}s"
+        f"  throughput: {report['updates_per_s']:,.0f} updates/s{delta(('updates_per_s',), report['updates_per_s'])}"
+    )
+    print(f"{'step':<9} {'count':>7} {'p50 ms':>12} {'p95 ms':>12} {'p99 ms':>12}")
+    rows = list(report["steps"].items()) + [("all", report["overall"])]
+    for step, p in rows:
+        path = ("overall",) if step == "all" else ("steps", step)
+        cells = "".join(f" {p[k]:>7.2f}{delta(path + (k,), p[k]):<5}" for k in ("p50", "p95", "p99"))
+        print(f"{step:<9} {p['count']:>7}{cells}")
+    print(f"booked: {report['reservations_booked']}  approved payments: {report['payments_approved']}")
+    print(f"db lock errors: {report['db_lock_errors']}  other errors: {report['other_errors'] or 0}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000, help="simulated users, all active at once")
+    parser.add_argument("--rate", type=float, default=0, help="max updates/second overall (0 = unlimited)")
+    parser.add_argument("--think-ms", type=float, default=0, help="pause between a user's steps")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="simulated Bot API latency (seconds)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="report file of an earlier run to compare against")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DB_PATH"] = os.path.join(tmp, "load.sqlite3")
+        os.environ["BOT_ADMIN_IDS"] = str(ADMIN_ID)
+        os.environ.setdefault("REQUIRED_CHANNEL", "@load_sim")
+        report = asyncio.run(_run(args))
+
+    _print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
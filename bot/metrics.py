@@ -0,0 +1,285 @@
+"""In-process latency histograms and counters, exported in Prometheus text format.
+
+What is measured:
+
+- every handler registered on the Application (`instrument_handlers`):
+  latency and errors per callback;
+- every db_async call: time queued for a DB thread (per pool) and time
+  running inside db.py (per function), plus errors. Handlers, jobs,
+  broadcast drains and persistence flushes all reach the database this
+  way. Calls made straight into db.py are not timed: init_db at startup,
+  the memory-only helpers (record_user_seen, peek_*, cache_stats, ...) and
+  the offline tools (bench_db*, check_*, migrations.py). Row-cache hits are
+  answered without a thread and show up in the cache counters instead;
+- Bot API calls made through `TimedRequest`: latency and errors per method
+  (getChatMember, sendMessage, ...).
+
+`render()` produces the /metrics text and `summary()` the admin /perf
+digest. `start_http_server()` serves /metrics locally when METRICS_PORT is
+set (settings below); it listens on 127.0.0.1 by default and is separate
+from the webhook server, so nothing is exposed publicly by accident.
+
+    METRICS_PORT     port for the /metrics endpoint; empty = disabled
+    METRICS_LISTEN   bind address (default 127.0.0.1)
+"""
+
+import bisect
+import functools
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable
+
+from aiohttp import web
+from telegram.ext import Application, ApplicationHandlerStop
+from telegram.request import BaseRequest, RequestData
+
+logger = logging.getLogger("ryno_sender_bot.metrics")
+
+METRICS_PORT = os.getenv("METRICS_PORT", "").strip()
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1").strip() or "127.0.0.1"
+
+# Seconds; fine-grained at the low end where DB calls and cached handlers live.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a call count, error count and sum."""
+
+    __slots__ = ("counts", "count", "errors", "total")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)  # last one is +Inf
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation (inf past the last bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+
+class _Family:
+    """Histograms of one metric, keyed by a single label value."""
+
+    def __init__(self, name: str, label: str, help_text: str, with_errors: bool) -> None:
+        self.name = name
+        self.label = label
+        self.help = help_text
+        self.with_errors = with_errors
+        self.series: dict[str, Histogram] = {}
+
+
+_lock = threading.Lock()
+_families: dict[str, _Family] = {}
+
+
+def _family(name: str, label: str, help_text: str, with_errors: bool = True) -> _Family:
+    family = _families.get(name)
+    if family is None:
+        family = _families[name] = _Family(name, label, help_text, with_errors)
+    return family
+
+
+HANDLER_SECONDS = _family("ryno_handler_seconds", "handler", "Handler callback latency")
+DB_CALL_SECONDS = _family("ryno_db_call_seconds", "function", "Time spent inside a db.py function")
+DB_QUEUE_SECONDS = _family(
+    "ryno_db_queue_wait_seconds", "pool", "Time a DB call waited for a worker thread", with_errors=False
+)
+API_SECONDS = _family("ryno_bot_api_seconds", "method", "Bot API request latency")
+
+
+def observe(family: _Family, key: str, seconds: float, error: bool = False) -> None:
+    """Record one observation; safe to call from any thread."""
+    i = bisect.bisect_left(BUCKETS, seconds)
+    with _lock:
+        hist = family.series.get(key)
+        if hist is None:
+            hist = family.series[key] = Histogram()
+        hist.counts[i] += 1
+        hist.count += 1
+        hist.total += seconds
+        if error:
+            hist.errors += 1
+
+
+def snapshot(family: _Family) -> dict[str, Histogram]:
+    """A consistent copy of every series of `family`."""
+    with _lock:
+        copies = {}
+        for key, hist in family.series.items():
+            copy = Histogram()
+            copy.counts = list(hist.counts)
+            copy.count = hist.count
+            copy.errors = hist.errors
+            copy.total = hist.total
+            copies[key] = copy
+        return copies
+
+
+def reset() -> None:
+    with _lock:
+        for family in _families.values():
+            family.series.clear()
+
+
+# Instrumentation
+
+
+def instrument_handlers(app: Application) -> int:
+    """Wrap the callback of every handler registered on `app`. Returns how many were wrapped.
+
+    ApplicationHandlerStop is flow control, not a failure, and is not counted
+    as an error. Call once, after all handlers are added.
+    """
+    wrapped = 0
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            handler.callback = timed(HANDLER_SECONDS, handler.callback)
+            wrapped += 1
+    return wrapped
+
+
+def timed(family: _Family, fn: Callable[..., Awaitable[Any]], key: str | None = None) -> Callable[..., Awaitable[Any]]:
+    """Wrap coroutine function `fn` so each call is observed in `family` under `key` (default: its name)."""
+    key = key or getattr(fn, "__name__", repr(fn))
+
+    @functools.wraps(fn)
+    async def call(*args: Any, **kwargs: Any) -> Any:
+        t0 = time.perf_counter()
+        error = False
+        try:
+            return await fn(*args, **kwargs)
+        except ApplicationHandlerStop:
+            raise
+        except BaseException:
+            error = True
+            raise
+        finally:
+            observe(family, key, time.perf_counter() - t0, error)
+
+    return call
+
+
+class TimedRequest(BaseRequest):
+    """BaseRequest wrapper that times each Bot API call by method name."""
+
+    def __init__(self, inner: BaseRequest) -> None:
+        self._inner = inner
+
+    @property
+    def read_timeout(self) -> float | None:
+        return self._inner.read_timeout
+
+    async def initialize(self) -> None:
+        await self._inner.initialize()
+
+    async def shutdown(self) -> None:
+        await self._inner.shutdown()
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: RequestData | None = None,
+        read_timeout=BaseRequest.DEFAULT_NONE,
+        write_timeout=BaseRequest.DEFAULT_NONE,
+        connect_timeout=BaseRequest.DEFAULT_NONE,
+        pool_timeout=BaseRequest.DEFAULT_NONE,
+    ) -> tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        t0 = time.perf_counter()
+        error = True
+        try:
+            code, payload = await self._inner.do_request(
+                url,
+                method,
+                request_data=request_data,
+                read_timeout=read_timeout,
+                write_timeout=write_timeout,
+                connect_timeout=connect_timeout,
+                pool_timeout=pool_timeout,
+            )
+            error = code >= 400
+            return code, payload
+        finally:
+            observe(API_SECONDS, api_method, time.perf_counter() - t0, error)
+
+
+# Export
+
+
+def _fmt(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+def render() -> str:
+    """All metrics in Prometheus text exposition format (version 0.0.4)."""
+    lines: list[str] = []
+    for family in list(_families.values()):
+        series = snapshot(family)
+        lines.append(f"# HELP {family.name} {family.help}")
+        lines.append(f"# TYPE {family.name} histogram")
+        for key in sorted(series):
+            hist = series[key]
+            label = key.replace("\\", "\\\\").replace('"', '\\"')
+            cumulative = 0
+            for bound, n in zip(BUCKETS + (float("inf"),), hist.counts):
+                cumulative += n
+                lines.append(f'{family.name}_bucket{{{family.label}="{label}",le="{_fmt(bound)}"}} {cumulative}')
+            lines.append(f'{family.name}_sum{{{family.label}="{label}"}} {hist.total!r}')
+            lines.append(f'{family.name}_count{{{family.label}="{label}"}} {hist.count}')
+        if not family.with_errors:
+            continue
+        errors_name = family.name.removesuffix("_seconds") + "_errors_total"
+        lines.append(f"# TYPE {errors_name} counter")
+        for key in sorted(series):
+            label = key.replace("\\", "\\\\").replace('"', '\\"')
+            lines.append(f'{errors_name}{{{family.label}="{label}"}} {series[key].errors}')
+    return "\n".join(lines) + "\n"
+
+
+def summary(top: int = 8) -> str:
+    """Plain-text digest for the /perf command: the slowest series of each family by total time."""
+    sections = []
+    for title, family in (
+        ("handlers", HANDLER_SECONDS),
+        ("db calls", DB_CALL_SECONDS),
+        ("db queue wait", DB_QUEUE_SECONDS),
+        ("bot api", API_SECONDS),
+    ):
+        series = snapshot(family)
+        if not series:
+            continue
+        rows = sorted(series.items(), key=lambda kv: kv[1].total, reverse=True)[:top]
+        lines = [f"{title} (calls, errors, p50/p95 ms, total s):"]
+        for key, hist in rows:
+            p50 = hist.quantile(0.5) * 1000
+            p95 = hist.quantile(0.95) * 1000
+            lines.append(f"  {key}: {hist.count}, {hist.errors}, {p50:g}/{p95:g}, {hist.total:.3f}")
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections) if sections else "no measurements yet"
+
+
+async def start_http_server(listen: str, port: int) -> web.AppRunner:
+    """Serve GET /metrics on listen:port; stop it with `await runner.cleanup()`."""
+
+    async def metrics(request: web.Request) -> web.Response:
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    web_app = web.Application()
+    web_app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(web_app)
+    await runner.setup()
+    await web.TCPSite(runner, listen, port).start()
+    logger.info("Serving metrics on http://%s:%s/metrics", listen, port)
+    return runner
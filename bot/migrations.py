@@ -0,0 +1,478 @@
+"""Schema migrations keyed on SQLite's PRAGMA user_version.
+
+MIGRATIONS is an ordered list of steps. Each step runs exactly once per
+database, in its own transaction, together with the user_version bump. A
+database that is already current costs init_db() a single PRAGMA read.
+
+Steps get the connection inside an open transaction: they must not commit,
+and they may run DDL and small data fixes alike. A backfill over a whole
+table goes in BACKFILLS instead. It runs before its step's transaction, one
+short transaction per chunk of rows, so other writers only ever wait for a
+chunk. It must be safe to rerun, and its step catches up on rows written
+while it ran.
+
+Run pending migrations without starting the bot:
+
+    python migrations.py              # apply
+    python migrations.py --status     # show current / latest version
+    python migrations.py --db path/to/db.sqlite3
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+from datetime import datetime, timezone
+from typing import Callable
+
+logger = logging.getLogger("ryno_sender_bot.migrations")
+
+# Rows per backfill transaction.
+BACKFILL_CHUNK_ROWS = 5000
+
+
+def _v1_baseline(con: sqlite3.Connection) -> None:
+    """The schema init_db() created before migrations existed.
+
+    Databases from those builds may lack later columns, so they are probed
+    and added here (the only place PRAGMA table_info is used).
+    """
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            first_seen_at TEXT NOT NULL,
+            last_seen_at TEXT NOT NULL,
+            username TEXT,
+            is_subscribed INTEGER NOT NULL DEFAULT 0,
+            subscribed_at TEXT,
+            unsubscribed_at TEXT
+        );
+        """
+    )
+
+    user_cols = {row[1] for row in con.execute("PRAGMA table_info(users)").fetchall()}
+    if "first_seen_at" not in user_cols:
+        con.execute("ALTER TABLE users ADD COLUMN first_seen_at TEXT")
+    if "last_seen_at" not in user_cols:
+        con.execute("ALTER TABLE users ADD COLUMN last_seen_at TEXT")
+    if "username" not in user_cols:
+        con.execute("ALTER TABLE users ADD COLUMN username TEXT")
+    if "is_subscribed" not in user_cols:
+        con.execute("ALTER TABLE users ADD COLUMN is_subscribed INTEGER NOT NULL DEFAULT 0")
+    if "subscribed_at" not in user_cols:
+        con.execute("ALTER TABLE users ADD COLUMN subscribed_at TEXT")
+    if "unsubscribed_at" not in user_cols:
+        con.execute("ALTER TABLE users ADD COLUMN unsubscribed_at TEXT")
+
+    con.execute("CREATE INDEX IF NOT EXISTS idx_users_is_subscribed ON users(is_subscribed);")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_users_last_seen_at ON users(last_seen_at);")
+
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS reservations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            reserved_at TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'booked',
+            group_link TEXT,
+            promo_photo_file_id TEXT,
+            reminder_sent_at TEXT,
+            username TEXT,
+            destination_links TEXT
+        );
+        """
+    )
+
+    # Migrate existing DBs (SQLite has no IF NOT EXISTS for columns)
+    cols = {row[1] for row in con.execute("PRAGMA table_info(reservations)").fetchall()}
+    if "group_link" not in cols:
+        con.execute("ALTER TABLE reservations ADD COLUMN group_link TEXT")
+    if "promo_photo_file_id" not in cols:
+        con.execute("ALTER TABLE reservations ADD COLUMN promo_photo_file_id TEXT")
+    if "reminder_sent_at" not in cols:
+        con.execute("ALTER TABLE reservations ADD COLUMN reminder_sent_at TEXT")
+    if "username" not in cols:
+        con.execute("ALTER TABLE reservations ADD COLUMN username TEXT")
+    if "destination_links" not in cols:
+        con.execute("ALTER TABLE reservations ADD COLUMN destination_links TEXT")
+    # Prevent double-booking the same time slot for active statuses.
+    # Keep the previous index (if exists) but also enforce for pending payments.
+    con.execute(
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_reservations_reserved_at_active
+        ON reservations(reserved_at)
+        WHERE status IN ('booked', 'pending_payment');
+        """
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS idx_reservations_user_id ON reservations(user_id);")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_reservations_reserved_at ON reservations(reserved_at);")
+
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS payment_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            reservation_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            username TEXT,
+            card_number TEXT NOT NULL,
+            coupon_code TEXT,
+            coupon_percent INTEGER,
+            receipt_photo_file_id TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            created_at TEXT NOT NULL,
+            reviewed_at TEXT,
+            reviewer_id INTEGER,
+            reject_reason TEXT,
+            FOREIGN KEY(reservation_id) REFERENCES reservations(id)
+        );
+        """
+    )
+
+    pay_cols = {row[1] for row in con.execute("PRAGMA table_info(payment_requests)").fetchall()}
+    if "coupon_code" not in pay_cols:
+        con.execute("ALTER TABLE payment_requests ADD COLUMN coupon_code TEXT")
+    if "coupon_percent" not in pay_cols:
+        con.execute("ALTER TABLE payment_requests ADD COLUMN coupon_percent INTEGER")
+    con.execute(
+        "CREATE INDEX IF NOT EXISTS idx_payment_requests_status ON payment_requests(status);"
+    )
+    con.execute(
+        "CREATE INDEX IF NOT EXISTS idx_payment_requests_reservation_id ON payment_requests(reservation_id);"
+    )
+
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS discount_codes (
+            code TEXT PRIMARY KEY,
+            percent INTEGER NOT NULL,
+            max_uses INTEGER NOT NULL,
+            used_count INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL,
+            created_by INTEGER NOT NULL,
+            expires_at TEXT NOT NULL,
+            is_active INTEGER NOT NULL DEFAULT 1
+        );
+        """
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS idx_discount_codes_expires_at ON discount_codes(expires_at);")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_discount_codes_is_active ON discount_codes(is_active);")
+
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS verification_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            username TEXT,
+            card_number TEXT NOT NULL,
+            photo_file_id TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            created_at TEXT NOT NULL,
+            reviewed_at TEXT,
+            reviewer_id INTEGER,
+            decision_reason TEXT
+        );
+        """
+    )
+    con.execute(
+        "CREATE INDEX IF NOT EXISTS idx_verification_requests_user_id ON verification_requests(user_id);"
+    )
+    con.execute(
+        "CREATE INDEX IF NOT EXISTS idx_verification_requests_status ON verification_requests(status);"
+    )
+
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS verified_cards (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            card_number TEXT NOT NULL,
+            verified_at TEXT NOT NULL,
+            verifier_id INTEGER
+        );
+        """
+    )
+
+
+def _v2_broadcast_jobs(con: sqlite3.Connection) -> None:
+    """Persisted /hamgani broadcasts that resume after a restart."""
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_by INTEGER NOT NULL,
+            owner_chat_id INTEGER NOT NULL,
+            from_chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            total INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            status_message_id INTEGER,
+            created_at TEXT NOT NULL,
+            finished_at TEXT
+        );
+        """
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs(status);")
+    # One row per recipient, snapshotted when the job is created.
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+            job_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempted_at TEXT,
+            PRIMARY KEY(job_id, user_id)
+        ) WITHOUT ROWID;
+        """
+    )
+
+
+def _v3_persisted_handler_state(con: sqlite3.Connection) -> None:
+    """Handler state (context.user_data / context.bot_data) as JSON, see persistence.py."""
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS persisted_user_data (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+        """
+    )
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS persisted_bot_data (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        ) WITHOUT ROWID;
+        """
+    )
+
+
+def _v4_pending_holds_index(con: sqlite3.Connection) -> None:
+    """Only live holds are indexed; the expiry sweep scans just these."""
+    con.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_reservations_pending_created_at
+        ON reservations(created_at)
+        WHERE status = 'pending_payment';
+        """
+    )
+
+
+def _v5_reservations_indexes(con: sqlite3.Connection) -> None:
+    """Indexes shaped after the hot reservations queries (check_query_plans.py verifies them)."""
+    # Slot lookups and day loads use ux_reservations_reserved_at_active.
+    # My reservations: user_id = ? AND status = 'booked' ORDER BY reserved_at,
+    # covering (id is the rowid) so no table lookups are needed.
+    con.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_reservations_user_status_reserved
+        ON reservations(user_id, status, reserved_at, created_at);
+        """
+    )
+    # Reminder candidates: only booked, not yet reminded rows, ordered by time.
+    con.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_reservations_reminder_due
+        ON reservations(reserved_at)
+        WHERE status = 'booked' AND reminder_sent_at IS NULL;
+        """
+    )
+    # Superseded: user_id is a prefix of the composite index, and nothing
+    # queries reserved_at without the active-status filter.
+    con.execute("DROP INDEX IF EXISTS idx_reservations_user_id")
+    con.execute("DROP INDEX IF EXISTS idx_reservations_reserved_at")
+
+
+def _iso_to_epoch(value: str | None) -> int | None:
+    # Frozen copy of the conversion the backfill needs; naive values were written as UTC.
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+# Epoch columns and the ISO text they are computed from.
+_EPOCH_COLUMNS = {
+    "reservations": {"reserved_ts": "reserved_at", "created_ts": "created_at"},
+    "users": {"last_seen_ts": "last_seen_at"},
+    "discount_codes": {"expires_ts": "expires_at"},
+}
+
+
+def _v6_epoch_columns(con: sqlite3.Connection) -> None:
+    """Integer UTC epoch columns for every timestamp used in comparisons.
+
+    reserved_at is local time with an offset while created_at / last_seen_at /
+    expires_at are naive UTC, so comparing the ISO text only worked by luck.
+    The *_ts columns are backfilled before v7, which moves all filtering,
+    ordering and indexes onto them; the text columns stay (and are still
+    written) as readable copies only.
+    """
+    for table, columns in _EPOCH_COLUMNS.items():
+        for ts_column in columns:
+            con.execute(f"ALTER TABLE {table} ADD COLUMN {ts_column} INTEGER")
+
+
+def _v7_backfill_epoch_columns(con: sqlite3.Connection) -> None:
+    con.create_function("iso_to_epoch", 1, _iso_to_epoch, deterministic=True)
+    for table, columns in _EPOCH_COLUMNS.items():
+        assignments = ", ".join(f"{ts} = iso_to_epoch({iso})" for ts, iso in columns.items())
+        low, high = con.execute(f"SELECT min(rowid), max(rowid) FROM {table}").fetchone()
+        if low is None:
+            continue
+        for start in range(low, high + 1, BACKFILL_CHUNK_ROWS):
+            with con:
+                con.execute(
+                    f"UPDATE {table} SET {assignments} WHERE rowid >= ? AND rowid < ?",
+                    (start, start + BACKFILL_CHUNK_ROWS),
+                )
+
+
+def _v7_epoch_indexes(con: sqlite3.Connection) -> None:
+    """Move the timestamp indexes onto the backfilled *_ts columns.
+
+    One-way: do not run an older build against the upgraded file. It would
+    lose double-booking protection (ux_reservations_reserved_at_active is
+    dropped) and insert rows with NULL *_ts columns that every query here
+    misses. Roll back by restoring a backup taken before the upgrade.
+    """
+    con.create_function("iso_to_epoch", 1, _iso_to_epoch, deterministic=True)
+    # Rows an older build wrote while the backfill ran.
+    for table, columns in _EPOCH_COLUMNS.items():
+        assignments = ", ".join(f"{ts} = iso_to_epoch({iso})" for ts, iso in columns.items())
+        missing = " OR ".join(f"({ts} IS NULL AND {iso} IS NOT NULL)" for ts, iso in columns.items())
+        con.execute(f"UPDATE {table} SET {assignments} WHERE {missing}")
+
+    # Same access paths as before, keyed on 8-byte integers instead of ~25-byte strings.
+    con.execute("DROP INDEX IF EXISTS ux_reservations_reserved_at_active")
+    con.execute(
+        """
+        CREATE UNIQUE INDEX ux_reservations_reserved_ts_active
+        ON reservations(reserved_ts)
+        WHERE status IN ('booked', 'pending_payment');
+        """
+    )
+    con.execute("DROP INDEX IF EXISTS idx_reservations_pending_created_at")
+    con.execute(
+        """
+        CREATE INDEX idx_reservations_pending_created_ts
+        ON reservations(created_ts)
+        WHERE status = 'pending_payment';
+        """
+    )
+    con.execute("DROP INDEX IF EXISTS idx_reservations_user_status_reserved")
+    # Covers list_reservations_for_user: id is the rowid, the rest are key columns.
+    con.execute(
+        """
+        CREATE INDEX idx_reservations_user_status_reserved_ts
+        ON reservations(user_id, status, reserved_ts, reserved_at, created_at);
+        """
+    )
+    con.execute("DROP INDEX IF EXISTS idx_reservations_reminder_due")
+    con.execute(
+        """
+        CREATE INDEX idx_reservations_reminder_due_ts
+        ON reservations(reserved_ts)
+        WHERE status = 'booked' AND reminder_sent_at IS NULL;
+        """
+    )
+    con.execute("DROP INDEX IF EXISTS idx_users_last_seen_at")
+    con.execute("CREATE INDEX idx_users_last_seen_ts ON users(last_seen_ts);")
+    # Codes are only ever looked up by primary key.
+    con.execute("DROP INDEX IF EXISTS idx_discount_codes_expires_at")
+
+
+MIGRATIONS: list[tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "baseline schema", _v1_baseline),
+    (2, "broadcast jobs and deliveries", _v2_broadcast_jobs),
+    (3, "persisted user_data and bot_data", _v3_persisted_handler_state),
+    (4, "pending payment holds index", _v4_pending_holds_index),
+    (5, "reservations indexes for the hot queries", _v5_reservations_indexes),
+    (6, "integer epoch timestamp columns", _v6_epoch_columns),
+    (7, "timestamp indexes on the epoch columns", _v7_epoch_indexes),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Chunked backfills run (outside a transaction) before the step of the same version.
+BACKFILLS: dict[int, Callable[[sqlite3.Connection], None]] = {
+    7: _v7_backfill_epoch_columns,
+}
+
+
+def schema_version(con: sqlite3.Connection) -> int:
+    return int(con.execute("PRAGMA user_version").fetchone()[0])
+
+
+def apply_migrations(con: sqlite3.Connection) -> list[int]:
+    """Bring the database to LATEST_VERSION; returns the versions applied."""
+    current = schema_version(con)
+    if current > LATEST_VERSION:
+        raise RuntimeError(
+            f"Database schema version {current} is newer than this code supports ({LATEST_VERSION})"
+        )
+
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        backfill = BACKFILLS.get(version)
+        if backfill is not None:
+            backfill(con)
+        # IMMEDIATE takes the write lock up front, so two processes starting
+        # together serialize here and the second one sees the new version.
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            current = schema_version(con)
+            if version <= current:
+                con.execute("COMMIT")
+                continue
+            step(con)
+            con.execute(f"PRAGMA user_version = {version}")
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        current = version
+        applied.append(version)
+        logger.info("Applied schema migration %s: %s", version, description)
+    return applied
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Apply pending database schema migrations.")
+    parser.add_argument("--db", help="database file (default: DB_PATH / the bot's default)")
+    parser.add_argument("--status", action="store_true", help="only print the current and latest version")
+    args = parser.parse_args()
+
+    if args.db:
+        os.environ["DB_PATH"] = args.db
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(name)s - %(message)s", level=logging.INFO)
+
+    import db
+
+    con = db._connect()
+    current = schema_version(con)
+    if args.status:
+        pending = [f"{v} ({d})" for v, d, _ in MIGRATIONS if v > current]
+        print(f"schema version {current}, latest {LATEST_VERSION}")
+        print("pending: " + (", ".join(pending) if pending else "none"))
+        return
+
+    db.init_db()
+    print(f"schema version {schema_version(con)} (was {current})")
+    db.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""SQLite-backed persistence for context.user_data and context.bot_data.
+
+Flow state (payment / verification / takhfif / destination steps in
+user_data, the banner and pending-reject maps in bot_data) survives restarts.
+Values are stored as JSON in the bot's own database, not pickled.
+
+- user_data is loaded lazily: nothing at startup, one indexed read the
+  first time a user's update is processed (refresh_user_data). Which users
+  are loaded is remembered for the `max_loaded_users` most recently active
+  ones; a user who drops out of that window is read again on their next
+  update, and what is in memory still wins over the stored copy.
+- Only entries whose JSON changed since the last write are written: one row
+  per user, one row per top-level bot_data key.
+- python-telegram-bot calls update_* every `update_interval` seconds and on
+  shutdown; all changes of one such run go to SQLite in a single transaction.
+
+Everything stored must be JSON-serializable; dict keys come back as strings
+(the bot already keys its bot_data maps by str(user_id)).
+"""
+
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from typing import Any
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from db_async import get_persisted_bot_data, get_persisted_user_data, save_persisted_data
+
+logger = logging.getLogger("ryno_sender_bot.persistence")
+
+_EMPTY = "{}"
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+class SQLitePersistence(BasePersistence[dict, dict, dict]):
+    """user_data and bot_data persistence on top of db.py (chat/callback data are not stored)."""
+
+    def __init__(self, update_interval: float = 5, max_loaded_users: int = 20000) -> None:
+        super().__init__(
+            store_data=PersistenceInput(bot_data=True, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        # Last JSON written (or loaded) per user / bot_data key; absent = nothing stored.
+        self._user_snapshots: dict[int, str] = {}
+        self._loaded_users: OrderedDict[int, None] = OrderedDict()
+        self._max_loaded_users = max_loaded_users
+        self._bot_snapshots: dict[str, str] = {}
+        # Staged changes (None = delete), written together by _write_soon().
+        self._pending_users: dict[int, str | None] = {}
+        self._pending_bot: dict[str, str | None] = {}
+        self._write_task: asyncio.Task | None = None
+
+    # Loading
+
+    async def get_user_data(self) -> dict[int, dict]:
+        # Lazy: each user's data is read in refresh_user_data() on first use.
+        return {}
+
+    async def get_chat_data(self) -> dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        rows = await get_persisted_bot_data()
+        data = {}
+        for key, raw in rows.items():
+            try:
+                data[key] = json.loads(raw)
+            except ValueError:
+                logger.warning("Dropping unreadable bot_data entry %r", key)
+                continue
+            self._bot_snapshots[key] = raw
+        return data
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        if user_id in self._loaded_users:
+            self._loaded_users.move_to_end(user_id)
+            return
+        self._loaded_users[user_id] = None
+        while len(self._loaded_users) > self._max_loaded_users:
+            self._loaded_users.popitem(last=False)
+        if user_id in self._pending_users:
+            # Staged but not yet written: memory is newer than anything stored.
+            return
+        raw = await get_persisted_user_data(user_id)
+        if raw is None:
+            return
+        try:
+            stored = json.loads(raw)
+        except ValueError:
+            logger.warning("Dropping unreadable user_data for %s", user_id)
+            return
+        self._user_snapshots[user_id] = raw
+        for key, value in stored.items():
+            # Anything set before the load finished is newer than the DB copy.
+            user_data.setdefault(key, value)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    # Saving
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        try:
+            raw = _dumps(data) if data else _EMPTY
+        except (TypeError, ValueError):
+            logger.exception("user_data of %s is not JSON-serializable; not persisted", user_id)
+            return
+        if raw == self._user_snapshots.get(user_id, _EMPTY):
+            self._pending_users.pop(user_id, None)
+            return
+        self._pending_users[user_id] = None if raw == _EMPTY else raw
+        await self._write_soon()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._loaded_users.pop(user_id, None)
+        if user_id in self._user_snapshots or user_id in self._pending_users:
+            self._pending_users[user_id] = None
+            await self._write_soon()
+
+    async def update_bot_data(self, data: dict) -> None:
+        changed = False
+        for key in set(self._bot_snapshots) | set(self._pending_bot) | set(data):
+            if key not in data:
+                if self._pending_bot.get(key, self._bot_snapshots.get(key)) is not None:
+                    self._pending_bot[key] = None
+                    changed = True
+                continue
+            try:
+                raw = _dumps(data[key])
+            except (TypeError, ValueError):
+                logger.exception("bot_data[%r] is not JSON-serializable; not persisted", key)
+                continue
+            if raw != self._bot_snapshots.get(key):
+                self._pending_bot[key] = raw
+                changed = True
+            else:
+                self._pending_bot.pop(key, None)
+        if changed:
+            await self._write_soon()
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: tuple, new_state: object | None) -> None:
+        pass
+
+    async def flush(self) -> None:
+        if self._write_task is not None and not self._write_task.done():
+            # A failed write re-stages its changes, which the call below retries.
+            await asyncio.wait([self._write_task])
+        await self._write_pending()
+
+    async def _write_soon(self) -> None:
+        """Join (or start) the write of everything staged in this event-loop turn.
+
+        The Application gathers all update_* calls of one persistence run, so
+        they stage their changes before the shared write task runs.
+        """
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write_next_turn())
+        await asyncio.shield(self._write_task)
+
+    async def _write_next_turn(self) -> None:
+        await asyncio.sleep(0)
+        await self._write_pending()
+
+    async def _write_pending(self) -> None:
+        users, self._pending_users = self._pending_users, {}
+        bot, self._pending_bot = self._pending_bot, {}
+        if not users and not bot:
+            return
+        try:
+            await save_persisted_data(users, bot)
+        except Exception:
+            # Keep the changes for the next run unless something newer was staged meanwhile.
+            for user_id, raw in users.items():
+                self._pending_users.setdefault(user_id, raw)
+            for key, raw in bot.items():
+                self._pending_bot.setdefault(key, raw)
+            raise
+        for user_id, raw in users.items():
+            if raw is None:
+                self._user_snapshots.pop(user_id, None)
+            else:
+                self._user_snapshots[user_id] = raw
+        for key, raw in bot.items():
+            if raw is None:
+                self._bot_snapshots.pop(key, None)
+            else:
+                self._bot_snapshots[key] = raw
@@ -0,0 +1,266 @@
+"""Opt-in recording of incoming updates for replay.py.
+
+With UPDATE_RECORD_PATH set, every Update is captured as it enters the
+Application's update queue, in polling and webhook mode alike, so the
+recorded timing is arrival time even when handlers are backlogged. Each one
+is scrubbed of personal data and appended to a gzip-compressed JSON-lines
+file:
+
+    {"session": {"started_at": "...", "admin_ids": [...], "version": 1}}
+    {"t": 0.412, "update": {...}}
+    {"t": 0.951, "update": {...}}
+
+`t` is seconds since the session started, and message dates are stored the
+same way. Every bot start appends a new session (a new gzip member) to the
+same file.
+
+Scrubbing keeps what routing needs and masks the rest:
+
+- user and chat ids map to pseudonyms that are stable within a session and
+  keyed by a random salt that is never written; admin ids are listed in the
+  session header (as pseudonyms) so replays can grant them admin rights;
+- names, usernames, titles and bios are replaced; file ids are hashed;
+  phone numbers, contacts, locations, emails and links are dropped;
+- text and captions are kept verbatim only when they are one of the bot's
+  own button labels (`keep_texts`). A command keeps its command word.
+  Anything else is masked character by character: letters become "x",
+  digits become "1", and punctuation and `keep_words` stay. Numbers of up to
+  4 digits stay too, unless the text holds 8 or more digits in total, so a
+  card or phone number typed in groups ("6219 8618 1234 5678") is masked
+  like one typed in a single run. Masked text keeps its shape (length,
+  letters vs digits), so input parsing takes similar paths on replay, though
+  checksummed values such as card numbers no longer validate;
+- callback data is the bot's own and is kept.
+
+Lines are buffered in memory and written by `flush()`, which the bot runs on
+a worker thread every UPDATE_RECORD_FLUSH_SECONDS and on shutdown. Recording
+stops once the file reaches UPDATE_RECORD_MAX_MB.
+
+    UPDATE_RECORD_PATH           file to append to (e.g. updates.jsonl.gz); empty = off
+    UPDATE_RECORD_FLUSH_SECONDS  default 5
+    UPDATE_RECORD_MAX_MB         default 512
+"""
+
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Iterable, Iterator
+
+from telegram import Update
+
+logger = logging.getLogger("ryno_sender_bot.recording")
+
+UPDATE_RECORD_PATH = os.getenv("UPDATE_RECORD_PATH", "").strip()
+UPDATE_RECORD_FLUSH_SECONDS = float(os.getenv("UPDATE_RECORD_FLUSH_SECONDS", "5").strip() or "5")
+UPDATE_RECORD_MAX_MB = float(os.getenv("UPDATE_RECORD_MAX_MB", "512").strip() or "512")
+
+FORMAT_VERSION = 1
+
+_ID_KEYS = {"id", "user_id", "chat_id", "sender_chat_id"}
+_NAME_KEYS = {"first_name", "last_name", "title", "bio", "description", "custom_title", "author_signature"}
+_TEXT_KEYS = {"text", "caption", "query"}
+_FILE_KEYS = {"file_id", "file_unique_id"}
+_DROP_KEYS = {
+    "phone_number",
+    "contact",
+    "location",
+    "venue",
+    "email",
+    "vcard",
+    "url",
+    "invite_link",
+    "user_chat_id",
+    "shipping_address",
+    "order_info",
+}
+_DATE_KEYS = {"date", "edit_date", "forward_date"}
+_TOKEN = re.compile(r"\S+")
+# A text with this many digits may carry a grouped card or phone number.
+_MASK_ALL_DIGITS_FROM = 8
+_COMMAND = re.compile(r"^(/[A-Za-z0-9_]+(?:@[A-Za-z0-9_]+)?)(\s.*)?$", re.DOTALL)
+
+
+class Scrubber:
+    """Masks the personal data in one Update dict (see the module docstring)."""
+
+    def __init__(self, keep_texts: Iterable[str] = (), keep_words: Iterable[str] = (), salt: bytes | None = None) -> None:
+        self.keep_texts = frozenset(keep_texts)
+        self.keep_words = frozenset(keep_words)
+        self._salt = salt if salt is not None else secrets.token_bytes(16)
+
+    def _digest(self, value: str) -> bytes:
+        return hmac.new(self._salt, value.encode("utf-8"), hashlib.sha256).digest()
+
+    def pseudonym(self, value: int) -> int:
+        """Stable stand-in for a user or chat id; keeps the sign (group chats are negative)."""
+        n = 1_000_000_000 + int.from_bytes(self._digest(str(abs(value)))[:5], "big")
+        return -n if value < 0 else n
+
+    def _token(self, value: str) -> str:
+        return self._digest(value)[:12].hex()
+
+    def _mask_word(self, word: str, keep_numbers: bool) -> str:
+        if word in self.keep_words or (keep_numbers and word.isdigit() and len(word) <= 4):
+            return word
+        out = []
+        for ch in word:
+            if ch.isdigit():
+                out.append("1")
+            elif ch.isalpha():
+                # Same UTF-16 length, so message entity offsets stay valid.
+                out.append("xx" if ord(ch) > 0xFFFF else "x")
+            else:
+                out.append(ch)
+        return "".join(out)
+
+    def text(self, value: str) -> str:
+        if value in self.keep_texts:
+            return value
+        command = _COMMAND.match(value)
+        if command:
+            return command.group(1) + self.text(command.group(2) or "")
+        keep_numbers = sum(ch.isdigit() for ch in value) < _MASK_ALL_DIGITS_FROM
+        return _TOKEN.sub(lambda m: self._mask_word(m.group(0), keep_numbers), value)
+
+    def scrub(self, data: Any, epoch: float) -> Any:
+        """A scrubbed copy of `data`, with dates made relative to `epoch`."""
+        if isinstance(data, list):
+            return [self.scrub(item, epoch) for item in data]
+        if not isinstance(data, dict):
+            return data
+        out = {}
+        for key, value in data.items():
+            if key in _DROP_KEYS:
+                continue
+            if key in _ID_KEYS and isinstance(value, int) and not isinstance(value, bool):
+                out[key] = self.pseudonym(value)
+            elif key in ("id", "chat_instance") and isinstance(value, str):
+                out[key] = self._token(value)  # callback / inline query ids
+            elif key == "username" and isinstance(value, str):
+                out[key] = "u" + self._token(value)[:10]
+            elif key in _NAME_KEYS and isinstance(value, str):
+                out[key] = "User" if key == "first_name" else self.text(value)
+            elif key in _TEXT_KEYS and isinstance(value, str):
+                out[key] = self.text(value)
+            elif key in _FILE_KEYS and isinstance(value, str):
+                out[key] = self._token(value)
+            elif key in _DATE_KEYS and isinstance(value, int):
+                out[key] = max(0, value - int(epoch))
+            else:
+                out[key] = self.scrub(value, epoch)
+        return out
+
+
+class UpdateRecorder:
+    """Buffers scrubbed updates and appends them to a gzip JSON-lines file."""
+
+    def __init__(
+        self,
+        path: str,
+        admin_ids: Iterable[int] = (),
+        keep_texts: Iterable[str] = (),
+        keep_words: Iterable[str] = (),
+        max_bytes: int | None = None,
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes if max_bytes is not None else int(UPDATE_RECORD_MAX_MB * 1024 * 1024)
+        self.scrubber = Scrubber(keep_texts, keep_words)
+        self.recorded = 0
+        self.dropped = 0
+        self._started = time.monotonic()
+        self._started_epoch = time.time()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = False
+        header = {
+            "session": {
+                "version": FORMAT_VERSION,
+                "started_at": datetime.fromtimestamp(self._started_epoch, timezone.utc).isoformat(timespec="seconds"),
+                "admin_ids": sorted(self.scrubber.pseudonym(int(uid)) for uid in admin_ids),
+            }
+        }
+        self._pending: list[str] = [json.dumps(header, ensure_ascii=False)]
+
+    def record(self, update: Update) -> None:
+        """Scrub and buffer one update; never raises (a failure only drops it from the recording)."""
+        if self._stopped:
+            return
+        t = time.monotonic() - self._started
+        try:
+            line = json.dumps(
+                {"t": round(t, 4), "update": self.scrubber.scrub(update.to_dict(), self._started_epoch)},
+                ensure_ascii=False,
+            )
+        except Exception:
+            self.dropped += 1
+            logger.warning("Could not record update %s", getattr(update, "update_id", "?"), exc_info=True)
+            return
+        with self._lock:
+            self._pending.append(line)
+            self.recorded += 1
+
+    def flush(self) -> int:
+        """Write buffered lines (blocking; call from a worker thread). Returns how many were written."""
+        with self._flush_lock:
+            with self._lock:
+                lines, self._pending = self._pending, []
+            if not lines or self._stopped:
+                return 0
+            if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                self._stopped = True
+                logger.warning("Update recording stopped: %s reached %s bytes", self.path, self.max_bytes)
+                return 0
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            return len(lines)
+
+
+class RecordingQueue(asyncio.Queue):
+    """The Application's update queue, handing every Update to a recorder on the way in.
+
+    Both the polling Updater and the webhook server enqueue through put(),
+    which ends in put_nowait().
+    """
+
+    def __init__(self, recorder: UpdateRecorder) -> None:
+        super().__init__()
+        self.recorder = recorder
+
+    def put_nowait(self, item: Any) -> None:
+        if isinstance(item, Update):
+            self.recorder.record(item)
+        super().put_nowait(item)
+
+
+def read_recording(path: str) -> Iterator[tuple[float, dict | None, dict]]:
+    """Yield (t, session header or None, update dict) in file order.
+
+    Sessions follow each other: each one's `t` continues from where the
+    previous session ended, so a multi-session file replays as one timeline.
+    The header is passed with the first update of each session.
+    """
+    offset = 0.0
+    last = 0.0
+    header = None
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if "session" in entry:
+                header = entry["session"]
+                offset = last
+                continue
+            t = offset + float(entry["t"])
+            last = t
+            yield t, header, entry["update"]
+            header = None
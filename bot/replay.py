@@ -0,0 +1,246 @@
+"""Replay a recorded update log (recording.py) into the real Application.
+
+Builds the Application like load_sim.py does: bot.build_application with every
+Bot API call answered by fake_telegram.FakeBotAPI and a throwaway SQLite
+file. It then puts the recorded updates on the update queue at their recorded
+offsets, scaled by --speed (1 = real time, 10 = ten times faster, max = as
+fast as the bot takes them). The admins of the recording (pseudonymous ids
+from its session headers) are the admins of the replay.
+
+The same log replayed against two versions of the bot gives comparable
+numbers:
+
+    python replay.py updates.jsonl.gz --speed 10 --json before.json
+    python replay.py updates.jsonl.gz --speed 10 --baseline before.json
+
+Reported: end-to-end latency per update kind (command, menu text, callback
+prefix, photo, ...) and overall, throughput, how far dispatch fell behind
+the schedule, DB lock errors and other handler errors.
+
+Replays are as deterministic as the bot allows. The bot reads the wall clock
+(today's slots, hold expiry), and callback data that points at DB rows only
+matches rows the replay itself created. A copy of a real DB would not help:
+its user ids are real, the recording's are pseudonyms keyed by a salt that is
+never written, so no recorded user could be matched to their rows.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from telegram import Update
+from telegram.ext import Application, ContextTypes
+
+from fake_telegram import FAKE_TOKEN, FakeBotAPI
+from recording import read_recording
+
+
+def _percentiles(samples: list[float]) -> dict[str, float]:
+    ms = sorted(s * 1000 for s in samples)
+    if not ms:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0}
+
+    def pct(p: float) -> float:
+        return ms[min(len(ms) - 1, int(len(ms) * p))]
+
+    return {"count": len(ms), "p50": statistics.median(ms), "p95": pct(0.95), "p99": pct(0.99)}
+
+
+def _kind(update: dict) -> str:
+    """Coarse label for per-kind latency: the command, callback prefix or message type."""
+    if "callback_query" in update:
+        data = update["callback_query"].get("data") or ""
+        return "callback:" + data.split("|", 1)[0]
+    message = update.get("message")
+    if message is None:
+        return next((key for key in update if key != "update_id"), "unknown")
+    text = message.get("text")
+    if text is not None:
+        return text.split(maxsplit=1)[0] if text.startswith("/") else "text"
+    if "photo" in message:
+        return "photo"
+    return "message"
+
+
+def _load(path: str) -> tuple[list[tuple[float, dict]], set[int]]:
+    updates = []
+    admin_ids: set[int] = set()
+    for t, header, update in read_recording(path):
+        if header is not None:
+            admin_ids.update(header.get("admin_ids", ()))
+        updates.append((t, update))
+    return updates, admin_ids
+
+
+def _rebase_dates(data: object, epoch: int) -> object:
+    """Turn the recording's relative message dates back into absolute ones."""
+    if isinstance(data, list):
+        return [_rebase_dates(item, epoch) for item in data]
+    if not isinstance(data, dict):
+        return data
+    return {
+        key: value + epoch if key in ("date", "edit_date", "forward_date") and isinstance(value, int) else _rebase_dates(value, epoch)
+        for key, value in data.items()
+    }
+
+
+async def _run(args: argparse.Namespace, updates: list[tuple[float, dict]]) -> dict:
+    import bot
+    import db
+
+    db.init_db()
+    app = bot.build_application(
+        Application.builder()
+        .token(FAKE_TOKEN)
+        .request(FakeBotAPI(latency=args.api_latency))
+        .get_updates_request(FakeBotAPI())
+        .updater(None)
+    )
+
+    enqueued: dict[int, tuple[float, str]] = {}
+    latency: dict[str, list[float]] = defaultdict(list)
+    errors: Counter[str] = Counter()
+    lock_errors = 0
+    all_done = asyncio.Event()
+    original_process_update = app.process_update
+
+    async def timed_process_update(update: object) -> None:
+        try:
+            await original_process_update(update)
+        finally:
+            entry = enqueued.pop(getattr(update, "update_id", None), None)
+            if entry is not None:
+                latency[entry[1]].append(time.perf_counter() - entry[0])
+                if not enqueued and dispatched.is_set():
+                    all_done.set()
+
+    async def on_error(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+        nonlocal lock_errors
+        if isinstance(context.error, sqlite3.OperationalError) and "locked" in str(context.error):
+            lock_errors += 1
+        else:
+            errors[type(context.error).__name__] += 1
+
+    app.process_update = timed_process_update
+    app.add_error_handler(on_error)
+    dispatched = asyncio.Event()
+
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+
+    epoch = int(time.time())
+    behind: list[float] = []
+    t0 = time.perf_counter()
+    for t, raw in updates:
+        if args.speed:
+            delay = t / args.speed - (time.perf_counter() - t0)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            behind.append(max(0.0, -delay))
+        update = Update.de_json(_rebase_dates(raw, epoch), app.bot)
+        enqueued[update.update_id] = (time.perf_counter(), _kind(raw))
+        await app.update_queue.put(update)
+    dispatched.set()
+    if enqueued:
+        try:
+            await asyncio.wait_for(all_done.wait(), timeout=args.timeout)
+        except asyncio.TimeoutError:
+            pass
+    elapsed = time.perf_counter() - t0
+
+    await app.stop()
+    if app.post_stop:
+        await app.post_stop(app)
+    await app.shutdown()
+    if app.post_shutdown:
+        await app.post_shutdown(app)
+
+    samples = [s for values in latency.values() for s in values]
+    return {
+        "updates": len(updates),
+        "processed": len(samples),
+        "speed": args.speed or "max",
+        "recorded_s": updates[-1][0] if updates else 0.0,
+        "elapsed_s": elapsed,
+        "updates_per_s": len(samples) / elapsed if elapsed else 0.0,
+        "dispatch_behind_ms": _percentiles(behind),
+        "overall": _percentiles(samples),
+        "kinds": {kind: _percentiles(values) for kind, values in sorted(latency.items())},
+        "db_lock_errors": lock_errors,
+        "other_errors": dict(errors),
+    }
+
+
+def _print_report(report: dict, baseline: dict | None) -> None:
+    def delta(path: tuple[str, ...], value: float) -> str:
+        if baseline is None:
+            return ""
+        old = baseline
+        for key in path:
+            old = old.get(key) if isinstance(old, dict) else None
+        if not old:
+            return ""
+        return f" ({(value - old) / old * 100:+.0f}%)"
+
+    print(
+        f"updates: {report['processed']}/{report['updates']}  speed: {report['speed']}"
+        f"  recorded {report['recorded_s']:.1f}s, replayed in {report['elapsed_s']:.1f}s"
+        f"  throughput: {report['updates_per_s']:,.0f} updates/s{delta(('updates_per_s',), report['updates_per_s'])}"
+    )
+    print(f"{'kind':<22} {'count':>7} {'p50 ms':>12} {'p95 ms':>12} {'p99 ms':>12}")
+    rows = list(report["kinds"].items()) + [("all", report["overall"])]
+    for kind, p in rows:
+        path = ("overall",) if kind == "all" else ("kinds", kind)
+        cells = "".join(f" {p[k]:>7.2f}{delta(path + (k,), p[k]):<5}" for k in ("p50", "p95", "p99"))
+        print(f"{kind:<22} {p['count']:>7}{cells}")
+    behind = report["dispatch_behind_ms"]
+    if behind["count"]:
+        print(f"dispatch behind schedule: p50 {behind['p50']:.2f}ms  p99 {behind['p99']:.2f}ms")
+    print(f"db lock errors: {report['db_lock_errors']}  other errors: {report['other_errors'] or 0}")
+
+
+def _speed(value: str) -> float:
+    return 0.0 if value == "max" else float(value)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("recording", help="gzip JSON-lines file written with UPDATE_RECORD_PATH")
+    parser.add_argument("--speed", type=_speed, default=1.0, help="1 = real time, 10 = 10x faster, max = no waiting")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="simulated Bot API latency (seconds)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="wait this long for the last updates")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="report file of an earlier replay to compare against")
+    args = parser.parse_args()
+
+    updates, admin_ids = _load(args.recording)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DB_PATH"] = os.path.join(tmp, "replay.sqlite3")
+        if admin_ids:
+            os.environ["BOT_ADMIN_IDS"] = ",".join(str(uid) for uid in sorted(admin_ids))
+        os.environ.setdefault("REQUIRED_CHANNEL", "@replay")
+        # Never record the replay itself.
+        os.environ["UPDATE_RECORD_PATH"] = ""
+        report = asyncio.run(_run(args, updates))
+
+    _print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
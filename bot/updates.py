@@ -0,0 +1,136 @@
+"""Which updates the bot asks Telegram for, and how it processes them concurrently.
+
+`allowed_update_types(app)` derives the allowed_updates list from the
+registered handlers, so Telegram stops delivering update types nothing
+handles (edits, channel posts, reactions, ...).
+
+`PerUserUpdateProcessor` lets updates from different users run concurrently
+while updates from the same user still run one at a time, in arrival order,
+so multi-step flows (payment, verification, ...) see their steps in sequence.
+"""
+
+import asyncio
+import logging
+import sys
+from typing import Any, Awaitable
+
+from telegram import Update
+from telegram.ext import (
+    Application,
+    BaseUpdateProcessor,
+    CallbackQueryHandler,
+    ChatMemberHandler,
+    CommandHandler,
+    MessageHandler,
+    TypeHandler,
+)
+
+logger = logging.getLogger("ryno_sender_bot.updates")
+
+# Every flow runs in private chats on new messages; edited messages and channel
+# posts (when the bot is admin of REQUIRED_CHANNEL) are deliberately not handled.
+_HANDLER_UPDATE_TYPES: dict[type, tuple[str, ...]] = {
+    MessageHandler: (Update.MESSAGE,),
+    CommandHandler: (Update.MESSAGE,),
+    CallbackQueryHandler: (Update.CALLBACK_QUERY,),
+}
+
+
+def _chat_member_update_types(handler: ChatMemberHandler) -> tuple[str, ...]:
+    if handler.chat_member_types == ChatMemberHandler.MY_CHAT_MEMBER:
+        return (Update.MY_CHAT_MEMBER,)
+    if handler.chat_member_types == ChatMemberHandler.CHAT_MEMBER:
+        return (Update.CHAT_MEMBER,)
+    return (Update.MY_CHAT_MEMBER, Update.CHAT_MEMBER)
+
+
+def allowed_update_types(app: Application) -> list[str]:
+    """Update types the handlers registered on `app` can act on.
+
+    TypeHandlers only observe what the other handlers subscribe to and add
+    nothing. An unknown handler class falls back to Update.ALL_TYPES.
+    """
+    wanted: set[str] = set()
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, TypeHandler):
+                continue
+            if isinstance(handler, ChatMemberHandler):
+                wanted.update(_chat_member_update_types(handler))
+                continue
+            types = next(
+                (types for cls, types in _HANDLER_UPDATE_TYPES.items() if isinstance(handler, cls)),
+                None,
+            )
+            if types is None:
+                logger.warning("No update types known for %s; subscribing to all", type(handler).__name__)
+                return list(Update.ALL_TYPES)
+            wanted.update(types)
+    # Keep Telegram's order so logs and set_webhook calls are stable.
+    return [t for t in Update.ALL_TYPES if t in wanted]
+
+
+def _ordering_key(update: object) -> int | None:
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Up to `max_concurrent_updates` updates at once, serialized per user.
+
+    Each user's updates first queue on that user's lock (FIFO, so they never
+    overtake each other) and only then take one of the shared slots. An
+    update waiting behind its own user's slow handler therefore holds no
+    slot, and one user's burst cannot stall everyone else.
+    """
+
+    def __init__(self, max_concurrent_updates: int) -> None:
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        # process_update() (final in the base class) holds the base class's limit
+        # around do_process_update, including the wait for the user's lock. Give
+        # it no effective limit and apply the real one below, once the lock is
+        # held. The base class sizes that limit from the property, hence the order.
+        self._limit = sys.maxsize
+        super().__init__(sys.maxsize)
+        self._limit = max_concurrent_updates
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._users: dict[int, int] = {}  # key -> updates holding or waiting for the lock
+
+    @property
+    def max_concurrent_updates(self) -> int:
+        # The Application reads this to decide whether to process concurrently at all.
+        return self._limit
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = _ordering_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            async with lock, self._slots:
+                await coroutine
+        finally:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                del self._locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        self._locks.clear()
+        self._users.clear()
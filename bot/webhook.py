@@ -0,0 +1,181 @@
+"""Webhook deployment mode: serve Telegram updates from a built-in aiohttp server.
+
+Selected with BOT_MODE=webhook. Settings (env):
+
+    WEBHOOK_URL              public https base URL Telegram should call; if empty
+                             the webhook is not registered (local harness runs)
+    WEBHOOK_PATH             URL path for updates (default "telegram")
+    WEBHOOK_LISTEN           bind address (default 0.0.0.0)
+    WEBHOOK_PORT / PORT      bind port (default 8080)
+    WEBHOOK_SECRET           X-Telegram-Bot-Api-Secret-Token value; generated
+                             per start when WEBHOOK_URL is set and this is empty
+    WEBHOOK_LOCAL_ONLY       1 = bind 127.0.0.1 and allow running without a
+                             secret (default 0)
+    WEBHOOK_MAX_CONNECTIONS  concurrent deliveries Telegram may open, and the
+                             local cap on requests being parsed and queued
+                             (default 40)
+
+Every request must carry the secret token: without one anyone who can reach
+the port could post forged updates, admin payment approvals included. The
+server therefore refuses to start with no secret unless it only listens on
+the loopback interface.
+
+Requests are answered as soon as their update is queued. How many updates
+are processed at once is CONCURRENT_UPDATES (the Application's update
+processor), in webhook and polling mode alike.
+"""
+
+import asyncio
+import hmac
+import logging
+import os
+import secrets
+import signal
+from dataclasses import dataclass
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger("ryno_sender_bot.webhook")
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+LOOPBACK_ADDRESSES = {"127.0.0.1", "::1", "localhost"}
+
+
+@dataclass(frozen=True)
+class WebhookConfig:
+    listen: str
+    port: int
+    url_path: str
+    public_url: str
+    secret_token: str
+    max_connections: int
+
+    @property
+    def webhook_url(self) -> str:
+        return f"{self.public_url.rstrip('/')}/{self.url_path}"
+
+    @property
+    def local_only(self) -> bool:
+        return self.listen in LOOPBACK_ADDRESSES
+
+    @classmethod
+    def from_env(cls) -> "WebhookConfig":
+        public_url = os.getenv("WEBHOOK_URL", "").strip()
+        secret_token = os.getenv("WEBHOOK_SECRET", "").strip()
+        local_only = os.getenv("WEBHOOK_LOCAL_ONLY", "0").strip() == "1"
+        listen = os.getenv("WEBHOOK_LISTEN", "0.0.0.0").strip() or "0.0.0.0"
+        if local_only:
+            listen = "127.0.0.1"
+        if public_url and not secret_token:
+            secret_token = secrets.token_urlsafe(32)
+            logger.info("WEBHOOK_SECRET not set; generated one for this run")
+        if not secret_token and not local_only:
+            raise SystemExit(
+                "WEBHOOK_SECRET is missing. Set it (or WEBHOOK_URL, which generates one), "
+                "or set WEBHOOK_LOCAL_ONLY=1 to serve unauthenticated on 127.0.0.1."
+            )
+        port_raw = os.getenv("WEBHOOK_PORT", "").strip() or os.getenv("PORT", "").strip() or "8080"
+        return cls(
+            listen=listen,
+            port=int(port_raw),
+            url_path=(os.getenv("WEBHOOK_PATH", "telegram").strip() or "telegram").strip("/"),
+            public_url=public_url,
+            secret_token=secret_token,
+            max_connections=int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40").strip() or "40"),
+        )
+
+
+def create_web_app(app: Application, config: WebhookConfig) -> web.Application:
+    """aiohttp app that validates the secret token and queues updates into `app`."""
+    # Bounds request parsing and queueing only; handler concurrency is the update processor's.
+    in_flight = asyncio.Semaphore(config.max_connections)
+
+    if not config.secret_token and not config.local_only:
+        raise ValueError(f"refusing to serve updates on {config.listen} without a secret token")
+
+    async def receive_update(request: web.Request) -> web.Response:
+        if config.secret_token and not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, ""), config.secret_token
+        ):
+            return web.Response(status=403)
+
+        async with in_flight:
+            try:
+                data = await request.json()
+            except ValueError:
+                return web.Response(status=400)
+            update = Update.de_json(data, app.bot)
+            if update is None:
+                return web.Response(status=400)
+            # Handlers run on the Application's own loop; answering now keeps
+            # Telegram's delivery connections short.
+            await app.update_queue.put(update)
+        return web.Response()
+
+    async def health(request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    web_app = web.Application()
+    web_app.router.add_post(f"/{config.url_path}", receive_update)
+    web_app.router.add_get("/healthz", health)
+    return web_app
+
+
+async def serve_webhook(
+    app: Application,
+    config: WebhookConfig,
+    stop: asyncio.Event,
+    allowed_updates: list[str] | None = None,
+) -> None:
+    """Run `app` behind the webhook server until `stop` is set, then shut down cleanly."""
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+
+    if config.public_url:
+        await app.bot.set_webhook(
+            url=config.webhook_url,
+            secret_token=config.secret_token or None,
+            max_connections=config.max_connections,
+            allowed_updates=allowed_updates,
+        )
+
+    await app.start()
+    runner = web.AppRunner(create_web_app(app, config))
+    await runner.setup()
+    site = web.TCPSite(runner, config.listen, config.port)
+    await site.start()
+
+    try:
+        await stop.wait()
+    finally:
+        # Stop accepting requests first (in-flight ones finish), then drain handlers.
+        await runner.cleanup()
+        await app.stop()
+        if app.post_stop:
+            await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+
+
+def run_webhook(app: Application, config: WebhookConfig, allowed_updates: list[str] | None = None) -> None:
+    """Blocking entry point, the webhook counterpart of Application.run_polling()."""
+
+    async def _main() -> None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:
+                # Windows: Ctrl+C surfaces as KeyboardInterrupt instead.
+                pass
+        await serve_webhook(app, config, stop, allowed_updates)
+
+    try:
+        asyncio.run(_main())
+    except KeyboardInterrupt:
+        pass
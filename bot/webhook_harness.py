@@ -0,0 +1,153 @@
+"""Local throughput/latency harness for webhook mode (no Telegram needed).
+
+Starts the real Application behind the webhook server on localhost, with the
+Bot API answered by fake_telegram.FakeBotAPI and a throwaway SQLite file, then
+POSTs recorded updates (JSON lines, one Update per line) or synthetic ones.
+
+    python webhook_harness.py --synthetic 2000 --concurrency 50
+    python webhook_harness.py --updates recorded.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import aiohttp
+from telegram.ext import Application
+
+from fake_telegram import FAKE_TOKEN, FakeBotAPI, message_update
+from webhook import SECRET_HEADER, WebhookConfig, serve_webhook
+
+
+def _synthetic(users: int) -> list[dict]:
+    updates = []
+    for uid in range(1, users + 1):
+        updates.append(message_update(100_000 + uid, "/start"))
+        updates.append(message_update(100_000 + uid, "رزرو تایم"))
+    return updates
+
+
+def _percentiles(samples: list[float]) -> str:
+    if not samples:
+        return "n/a"
+    ms = sorted(s * 1000 for s in samples)
+
+    def pct(p: float) -> float:
+        return ms[min(len(ms) - 1, int(len(ms) * p))]
+
+    return f"p50 {statistics.median(ms):.2f}ms  p95 {pct(0.95):.2f}ms  p99 {pct(0.99):.2f}ms"
+
+
+async def _run(args: argparse.Namespace, updates: list[dict]) -> None:
+    import bot
+    import db
+
+    db.init_db()
+    app = bot.build_application(
+        Application.builder()
+        .token(FAKE_TOKEN)
+        .request(FakeBotAPI(latency=args.api_latency))
+        .get_updates_request(FakeBotAPI())
+        .updater(None)
+    )
+
+    posted_at: dict[int, float] = {}
+    processed: list[float] = []
+    all_done = asyncio.Event()
+    original_process_update = app.process_update
+
+    async def timed_process_update(update: object) -> None:
+        try:
+            await original_process_update(update)
+        finally:
+            update_id = getattr(update, "update_id", None)
+            if update_id in posted_at:
+                processed.append(time.perf_counter() - posted_at[update_id])
+                if len(processed) == len(updates):
+                    all_done.set()
+
+    app.process_update = timed_process_update
+
+    config = WebhookConfig(
+        listen="127.0.0.1",
+        port=args.port,
+        url_path="telegram",
+        public_url="",
+        secret_token=args.secret,
+        max_connections=args.concurrency,
+    )
+    stop = asyncio.Event()
+    server = asyncio.create_task(serve_webhook(app, config, stop))
+
+    base = f"http://127.0.0.1:{args.port}"
+    async with aiohttp.ClientSession() as session:
+        for _ in range(100):
+            try:
+                async with session.get(f"{base}/healthz") as resp:
+                    if resp.status == 200:
+                        break
+            except aiohttp.ClientConnectionError:
+                await asyncio.sleep(0.05)
+
+        http_latency: list[float] = []
+        errors = 0
+        gate = asyncio.Semaphore(args.concurrency)
+
+        async def post(update: dict) -> None:
+            nonlocal errors
+            async with gate:
+                t0 = time.perf_counter()
+                posted_at[update["update_id"]] = t0
+                async with session.post(
+                    f"{base}/telegram", json=update, headers={SECRET_HEADER: args.secret}
+                ) as resp:
+                    if resp.status != 200:
+                        errors += 1
+                http_latency.append(time.perf_counter() - t0)
+
+        t_start = time.perf_counter()
+        await asyncio.gather(*(post(u) for u in updates))
+        t_posted = time.perf_counter()
+        try:
+            await asyncio.wait_for(all_done.wait(), timeout=args.timeout)
+        except asyncio.TimeoutError:
+            pass
+        t_done = time.perf_counter()
+
+    stop.set()
+    await server
+
+    print(f"updates: {len(updates)}  http errors: {errors}  processed: {len(processed)}")
+    print(f"accept:  {len(updates) / (t_posted - t_start):,.0f} updates/s  HTTP {_percentiles(http_latency)}")
+    print(f"process: {len(processed) / (t_done - t_start):,.0f} updates/s  end-to-end {_percentiles(processed)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", help="JSON-lines file of recorded Update objects")
+    parser.add_argument("--synthetic", type=int, default=500, help="synthetic users when --updates is not given")
+    parser.add_argument("--concurrency", type=int, default=40)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--secret", default="harness-secret")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="simulated Bot API latency (seconds)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    if args.updates:
+        with open(args.updates, encoding="utf-8") as f:
+            updates = [json.loads(line) for line in f if line.strip()]
+    else:
+        updates = _synthetic(args.synthetic)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Always a throwaway file: an exported DB_PATH must never receive synthetic traffic.
+        os.environ["DB_PATH"] = os.path.join(tmp, "harness.sqlite3")
+        asyncio.run(_run(args, updates))
+
+
+if __name__ == "__main__":
+    main()